@@ -674,8 +674,10 @@ extern "Python" void pn_pyref_decref(void *object);
 extern "Python" void pn_pytracer(pn_transport_t *transport, const char *message);
 
 pn_event_t *pn_collector_put_py(pn_collector_t *collector, void *context, pn_event_type_t type);
+int pn_data_copy_current_py(pn_data_t *dst, pn_data_t *src);
 ssize_t pn_data_format_py(pn_data_t *data, char *bytes, size_t size);
 const char *pn_event_class_name_py(pn_event_t *event);
+size_t pn_link_buffered_bytes_py(pn_link_t *link);
 ssize_t pn_message_encode_py(pn_message_t *msg, char *bytes, size_t size);
 void pn_record_def_py(pn_record_t *record);
 void *pn_record_get_py(pn_record_t *record);
@@ -99,7 +99,7 @@ from cproton_ffi.lib import (PN_ACCEPTED, PN_ARRAY, PN_BINARY, PN_BOOL, PN_BYTE,
                              pn_disposition_type, pn_error_code, pn_event_connection,
                              pn_event_context, pn_event_delivery, pn_event_link, pn_event_session,
                              pn_event_transport, pn_event_type, pn_incref, pn_link_advance,
-                             pn_link_attachments, pn_link_available, pn_link_close,
+                             pn_link_attachments, pn_link_available, pn_link_buffered_bytes_py, pn_link_close,
                              pn_link_condition, pn_link_credit, pn_link_current, pn_link_detach,
                              pn_link_drain, pn_link_drained, pn_link_draining, pn_link_error,
                              pn_link_flow, pn_link_free, pn_link_get_drain, pn_link_head,
@@ -297,25 +297,61 @@ def pn_transport_set_pytracer(transport, tracer):
     attrs['_tracer'] = tracer
     lib.pn_transport_set_tracer(transport, lib.pn_pytracer)
 
-retained_objects = set()
+# Python objects referenced from C (collector event contexts and record
+# attachments) are passed as cffi handles. Each object has a single handle,
+# shared by all C references to it and reference counted by the pn_pyref
+# class: retained_objects maps the handle to [refcount, id(obj)] and an entry
+# is dropped, releasing the handle and the object, when the count reaches
+# zero. The void pointers passed back from C compare and hash equal to the
+# handle. _pyref_handles maps id(obj) to the handle.
+retained_objects = {}
+_pyref_handles = {}
 lib.init()
 
 @atexit.register
 def clear_retained_objects():
+    _pyref_handles.clear()
     retained_objects.clear()
 
 def retained_count():
     """ Debugging aid to give the number of wrapper objects retained by the bindings"""
     return len(retained_objects)
 
+def retained_count_by_type():
+    """ Debugging aid to give the number of objects retained by the bindings for each type name"""
+    counts = {}
+    for handle in list(retained_objects):
+        name = type(ffi.from_handle(handle)).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def _pyref(obj):
+    handle = _pyref_handles.get(id(obj))
+    if handle is None:
+        handle = _pyref_handles[id(obj)] = ffi.new_handle(obj)
+        retained_objects[handle] = [0, id(obj)]
+    return handle
+
+def _pyref_release_unused(obj):
+    # The C side may decline the reference (e.g. a freed collector)
+    handle = _pyref_handles.get(id(obj))
+    if handle is not None and retained_objects[handle][0] == 0:
+        del retained_objects[handle]
+        del _pyref_handles[id(obj)]
+
 @ffi.def_extern()
 def pn_pyref_incref(obj):
-    retained_objects.add(obj)
+    retained_objects[obj][0] += 1
 
 
 @ffi.def_extern()
 def pn_pyref_decref(obj):
-    retained_objects.discard(obj)
+    entry = retained_objects.get(obj)
+    if entry is not None:
+        entry[0] -= 1
+        if entry[0] <= 0:
+            del retained_objects[obj]
+            del _pyref_handles[entry[1]]
 
 
 def pn_tostring(obj):
@@ -326,9 +362,8 @@ def pn_tostring(obj):
 
 
 def pn_collector_put_pyref(collector, obj, etype):
-    d = ffi.new_handle(obj)
-    retained_objects.add(d)
-    lib.pn_collector_put_py(collector, d, etype.number)
+    lib.pn_collector_put_py(collector, _pyref(obj), etype.number)
+    _pyref_release_unused(obj)
 
 
 def pn_record_def_py(record):
@@ -344,11 +379,10 @@ def pn_record_get_py(record):
 
 def pn_record_set_py(record, value):
     if value is None:
-        d = ffi.NULL
+        lib.pn_record_set_py(record, ffi.NULL)
     else:
-        d = ffi.new_handle(value)
-        retained_objects.add(d)
-    lib.pn_record_set_py(record, d)
+        lib.pn_record_set_py(record, _pyref(value))
+        _pyref_release_unused(value)
 
 
 def pn_event_class_name(event):
@@ -359,50 +393,73 @@ def pn_event_class_name(event):
 def pn_transport_peek(transport, size):
     buff = bytearray(size)
     cd = lib.pn_transport_peek(transport, ffi.from_buffer(buff), size)
-    if cd >= 0:
-        buff = buff[:cd]
+    if 0 <= cd < size:
+        del buff[cd:]
     return cd, buff
 
 
+def pn_transport_peek_into(transport, buff):
+    dst = ffi.from_buffer(buff, require_writable=True)
+    return lib.pn_transport_peek(transport, dst, len(dst))
+
+
 # ssize_t pn_transport_push(pn_transport_t *transport, const char *src, size_t size);
 def pn_transport_push(transport, src):
-    return lib.pn_transport_push(transport, ffi.from_buffer(src), len(src))
+    buff = ffi.from_buffer(src)
+    return lib.pn_transport_push(transport, buff, len(buff))
 
 
 # int pn_message_decode(pn_message_t *msg, const char *bytes, size_t size);
 def pn_message_decode(msg, buff):
-    return lib.pn_message_decode(msg, ffi.from_buffer(buff), len(buff))
+    src = ffi.from_buffer(buff)
+    return lib.pn_message_decode(msg, src, len(src))
 
 
 # int pn_message_encode_py(pn_message_t *msg, char *bytes, size_t size);
 def pn_message_encode(msg, size):
     buff = bytearray(size)
     err = lib.pn_message_encode_py(msg, ffi.from_buffer(buff), size)
-    if err >= 0:
-        buff = buff[:err]
+    if 0 <= err < size:
+        del buff[err:]
     return err, buff
 
 
+def pn_message_encode_into(msg, buff):
+    dst = ffi.from_buffer(buff, require_writable=True)
+    return lib.pn_message_encode_py(msg, dst, len(dst))
+
+
 # ssize_t pn_data_decode(pn_data_t *data, const char *bytes, size_t size);
 def pn_data_decode(data, buff):
-    return lib.pn_data_decode(data, ffi.from_buffer(buff), len(buff))
+    src = ffi.from_buffer(buff)
+    return lib.pn_data_decode(data, src, len(src))
 
 
 # ssize_t pn_data_encode(pn_data_t *data, char *bytes, size_t size);
 def pn_data_encode(data, size):
     buff = bytearray(size)
     err = lib.pn_data_encode(data, ffi.from_buffer(buff), size)
-    if err >= 0:
-        buff = buff[:err]
+    if 0 <= err < size:
+        del buff[err:]
     return err, buff
 
 
+def pn_data_encode_into(data, buff):
+    dst = ffi.from_buffer(buff, require_writable=True)
+    return lib.pn_data_encode(data, dst, len(dst))
+
+
+# int pn_data_copy_current_py(pn_data_t *dst, pn_data_t *src);
+def pn_data_copy_current(dst, src):
+    return lib.pn_data_copy_current_py(dst, src)
+
+
 # int pn_data_format(pn_data_t *data, char *bytes, size_t *size);
 def pn_data_format(data, size):
     buff = bytearray(size)
     err = lib.pn_data_format_py(data, ffi.from_buffer(buff), size)
-    if err >= 0:
-        buff = buff[:err]
+    if 0 <= err < size:
+        del buff[err:]
     return err, buff
 
 
@@ -410,14 +467,21 @@ def pn_data_format(data, size):
 def pn_link_recv(receiver, limit):
     buff = bytearray(limit)
     err = lib.pn_link_recv(receiver, ffi.from_buffer(buff), limit)
-    if err >= 0:
-        buff = buff[:err]
+    if 0 <= err < limit:
+        # Truncate in place rather than slicing into a second copy
+        del buff[err:]
     return err, buff
 
 
+def pn_link_recv_into(receiver, buff):
+    dst = ffi.from_buffer(buff, require_writable=True)
+    return lib.pn_link_recv(receiver, dst, len(dst))
+
+
 # ssize_t pn_link_send(pn_link_t *sender, const char *bytes, size_t n);
 def pn_link_send(sender, buff):
-    return lib.pn_link_send(sender, ffi.from_buffer(buff), len(buff))
+    src = ffi.from_buffer(buff)
+    return lib.pn_link_send(sender, src, len(src))
 
 
 # pn_condition bindings
@@ -485,7 +549,15 @@ def pn_data_get_symbol(data):
 
 
 def pn_delivery_tag(delivery):
-    return bytes2string(lib.pn_delivery_tag(delivery))
+    # bytes that are not UTF-8 are kept as surrogate escapes, so that every
+    # tag is a str that pn_delivery turns back into the same bytes
+    tag = lib.pn_delivery_tag(delivery)
+    return ffi.unpack(tag.start, tag.size).decode('utf8', 'surrogateescape')
+
+
+def pn_delivery_tag_bytes(delivery):
+    tag = lib.pn_delivery_tag(delivery)
+    return ffi.unpack(tag.start, tag.size)
 
 
 def pn_connection_get_container(connection):
@@ -541,6 +613,8 @@ def pn_receiver(session, name):
 
 
 def pn_delivery(link, tag):
+    if isinstance(tag, str):
+        tag = tag.encode('utf8', 'surrogateescape')
     return lib.pn_delivery(link, py2bytes(tag))
 
 def pn_link_name(link):
@@ -148,6 +148,25 @@ ssize_t pn_message_encode_py(pn_message_t *msg, char *bytes, size_t size) {
     else return err;
 }
 
+int pn_data_copy_current_py(pn_data_t *dst, pn_data_t *src) {
+    /* Narrow src so that its first node after rewinding is the current
+       node, then let pn_data_appendn copy just that node */
+    pn_handle_t point = pn_data_point(src);
+    if (pn_data_prev(src)) {
+        pn_data_narrow(src);
+    } else if (pn_data_exit(src)) {
+        pn_data_enter(src);
+        pn_data_narrow(src);
+    } else {
+        pn_data_widen(src);
+    }
+    pn_data_clear(dst);
+    int err = pn_data_appendn(dst, src, 1);
+    pn_data_widen(src);
+    pn_data_restore(src, point);
+    return err;
+}
+
 ssize_t pn_data_format_py(pn_data_t *data, char *bytes, size_t size) {
     int err = pn_data_format(data, bytes, &size);
     if (err == 0) return size;
@@ -158,6 +177,14 @@ int pn_ssl_get_peer_hostname_py(pn_ssl_t *ssl, char *hostname, size_t size) {
     return pn_ssl_get_peer_hostname(ssl, hostname, &size);
 }
 
+size_t pn_link_buffered_bytes_py(pn_link_t *link) {
+    size_t bytes = 0;
+    for (pn_delivery_t *d = pn_unsettled_head(link); d; d = pn_unsettled_next(d)) {
+        bytes += pn_delivery_pending(d);
+    }
+    return bytes;
+}
+
 const char *pn_event_class_name_py(pn_event_t *event) {
     const pn_class_t *class = pn_event_class(event);
     return class ? pn_class_name(class) : 0;
@@ -33,16 +33,20 @@ import os
 
 from cproton import PN_VERSION_MAJOR, PN_VERSION_MINOR, PN_VERSION_POINT
 
+from ._compression import Compression
 from ._condition import Condition
 from ._data import UNDESCRIBED, Array, Data, Described, char, symbol, timestamp, ubyte, ushort, uint, ulong, \
     byte, short, int32, float32, decimal32, decimal64, decimal128, AnnotationDict, PropertyDict, SymbolList
+from ._dedup import DuplicateFilter
 from ._delivery import Delivery, Disposition
 from ._endpoints import Endpoint, Connection, Session, Link, Receiver, Sender, Terminus
 from ._events import Collector, Event, EventType
 from ._exceptions import ProtonException, MessageException, DataException, TransportException, \
-    SSLException, SSLUnavailable, ConnectionException, SessionException, LinkException, Timeout, Interrupt
+    SSLException, SSLUnavailable, ConnectionException, SessionException, LinkException, OutboxFull, \
+    Timeout, Interrupt
 from ._handler import Handler
-from ._message import Message
+from ._message import Message, MessagePool, MmapWriter, encode_messages, decode_messages
+from ._outbox import DurableOutbox, Outbox
 from ._transport import Transport, SASL, SSL, SSLDomain, SSLSessionDetails
 from ._url import Url
 
@@ -53,6 +57,7 @@ __all__ = [
     "AnnotationDict",
     "Array",
     "Collector",
+    "Compression",
     "Condition",
     "Connection",
     "ConnectionException",
@@ -60,6 +65,8 @@ __all__ = [
     "DataException",
     "Delivery",
     "Disposition",
+    "DuplicateFilter",
+    "DurableOutbox",
     "Described",
     "Endpoint",
     "Event",
@@ -68,7 +75,11 @@ __all__ = [
     "Link",
     "LinkException",
     "Message",
+    "MessagePool",
+    "MmapWriter",
     "MessageException",
+    "Outbox",
+    "OutboxFull",
     "PropertyDict",
     "ProtonException",
     "VERSION_MAJOR",
@@ -103,7 +114,9 @@ __all__ = [
     "float32",
     "decimal32",
     "decimal64",
-    "decimal128"
+    "decimal128",
+    "encode_messages",
+    "decode_messages"
 ]
 
 VERSION_MAJOR = PN_VERSION_MAJOR
@@ -0,0 +1,183 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import lzma
+import zlib
+
+from ._exceptions import MessageException
+from typing import Callable, Dict, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._message import Message
+
+CompressFunction = Callable[[bytes, Optional[int]], bytes]
+DecompressFunction = Callable[[Union[bytes, memoryview], int], bytes]
+
+
+def _deflate(data: bytes, level: Optional[int]) -> bytes:
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def _gzip(data: bytes, level: Optional[int]) -> bytes:
+    compressor = zlib.compressobj(-1 if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _inflate(data: Union[bytes, memoryview], max_size: int, wbits: int = zlib.MAX_WBITS) -> bytes:
+    decompressor = zlib.decompressobj(wbits)
+    out = decompressor.decompress(data, max_size + 1)
+    if not decompressor.eof and len(out) <= max_size:
+        raise zlib.error("incomplete or truncated stream")
+    return out
+
+
+def _gunzip(data: Union[bytes, memoryview], max_size: int) -> bytes:
+    return _inflate(data, max_size, 47)
+
+
+def _xz(data: bytes, level: Optional[int]) -> bytes:
+    return lzma.compress(data, preset=level)
+
+
+def _unxz(data: Union[bytes, memoryview], max_size: int) -> bytes:
+    decompressor = lzma.LZMADecompressor()
+    out = decompressor.decompress(data, max_length=max_size + 1)
+    if not decompressor.eof and len(out) <= max_size:
+        raise lzma.LZMAError("incomplete or truncated stream")
+    return out
+
+
+class Compression(object):
+    """
+    Opt-in compression of message bodies, identified to the receiver by
+    the message ``content_encoding``.
+
+    A :class:`Compression` object is used for sending by assigning it to
+    :attr:`proton.Sender.compression`, after which :meth:`proton.Message.send`
+    compresses the bodies of messages sent on that link, and for receiving
+    by passing it to :class:`proton.handlers.MessagingHandler`, which
+    decompresses the bodies of received messages and clears their
+    ``content_encoding``.
+
+    Only ``bytes`` bodies are compressed, and are sent as a compressed AMQP
+    data section. Only data section bodies are decompressed on receipt, so
+    a body in an AMQP value section is passed on unchanged whatever its
+    ``content_encoding``. Messages that already have a ``content_encoding``
+    are sent unchanged.
+
+    :param encoding: The content encoding to compress bodies with. The
+        ``"deflate"`` (zlib), ``"gzip"`` and ``"xz"`` (lzma) encodings are
+        built in, and others can be added with :meth:`register`. Bodies in
+        any registered encoding are decompressed on receipt.
+    :param threshold: Bodies shorter than this number of bytes are sent
+        uncompressed, as are bodies that do not become smaller.
+    :param level: The compression level passed to the codec, or ``None``
+        for its default.
+    :param max_size: The largest size in bytes to which a received body
+        may decompress. Larger bodies are rejected as undecodable, so that
+        a small body from the peer cannot expand to exhaust memory.
+    """
+
+    _codecs: Dict[str, Tuple[CompressFunction, DecompressFunction]] = {
+        "deflate": (_deflate, _inflate),
+        "gzip": (_gzip, _gunzip),
+        "xz": (_xz, _unxz),
+    }
+
+    def __init__(
+            self,
+            encoding: str = "deflate",
+            threshold: int = 1024,
+            level: Optional[int] = None,
+            max_size: int = 64 * 1024 * 1024
+    ) -> None:
+        if encoding not in self._codecs:
+            raise ValueError("unknown content encoding: %s" % encoding)
+        self.encoding = encoding
+        self.threshold = threshold
+        self.level = level
+        self.max_size = max_size
+        self._compress = self._codecs[encoding][0]
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    @classmethod
+    def register(cls, encoding: str, compress: CompressFunction, decompress: DecompressFunction) -> None:
+        """
+        Add a codec for a content encoding.
+
+        :param encoding: The content encoding name.
+        :param compress: A function taking the body bytes and a compression
+            level (which may be ``None``) and returning the compressed bytes.
+        :param decompress: A function taking compressed bytes, or a
+            ``memoryview`` of them, and the largest size allowed, and
+            returning the decompressed bytes. Beyond that size it need
+            return only one more byte.
+        """
+        cls._codecs[encoding] = (compress, decompress)
+
+    @property
+    def ratio(self) -> float:
+        """
+        The total size of the bodies compressed so far divided by their
+        compressed size, or ``1.0`` if none have been compressed.
+        """
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 1.0
+
+    def compress(self, message: 'Message') -> Optional[bytes]:
+        """
+        Compress the body of a message, if it qualifies.
+
+        :return: The compressed body, to be sent as a data section, or
+            ``None`` if the body is to be sent unchanged.
+        """
+        data = message.body
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            return None
+        if len(data) < self.threshold or message._get_encoding():
+            return None
+        compressed = self._compress(data, self.level)
+        if len(compressed) >= len(data):
+            return None
+        self.raw_bytes += len(data)
+        self.compressed_bytes += len(compressed)
+        return compressed
+
+    def decompress(self, message: 'Message') -> None:
+        """
+        Decompress the data section body of a received message if its
+        content encoding is a registered one, and clear its content
+        encoding.
+
+        :raise: :exc:`MessageException` if the body cannot be decompressed,
+            or decompresses to more than :attr:`max_size` bytes.
+        """
+        encoding = message._get_encoding()
+        codec = self._codecs.get(encoding)
+        body = message.body
+        if codec is None or not message.inferred or not isinstance(body, (bytes, memoryview)):
+            return
+        try:
+            data = codec[1](body, self.max_size)
+        except Exception as e:
+            raise MessageException("cannot decompress %s body: %s" % (encoding, e))
+        if len(data) > self.max_size:
+            raise MessageException("%s body decompresses to more than %d bytes" % (encoding, self.max_size))
+        message.body = data
+        message._set_encoding(None)
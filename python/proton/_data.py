@@ -17,6 +17,7 @@
 # under the License.
 #
 
+import struct
 import uuid
 from typing import Callable, List, Tuple, Union, Optional, Any, Dict, Iterable, TypeVar
 try:
@@ -33,7 +34,7 @@ except ImportError:
 from cproton import PN_ARRAY, PN_BINARY, PN_BOOL, PN_BYTE, PN_CHAR, PN_DECIMAL128, PN_DECIMAL32, PN_DECIMAL64, \
     PN_DESCRIBED, PN_DOUBLE, PN_FLOAT, PN_INT, PN_LIST, PN_LONG, PN_MAP, PN_NULL, PN_OVERFLOW, PN_SHORT, PN_STRING, \
     PN_SYMBOL, PN_TIMESTAMP, PN_UBYTE, PN_UINT, PN_ULONG, PN_USHORT, PN_UUID, pn_data, pn_data_clear, pn_data_copy, \
-    pn_data_decode, pn_data_dump, pn_data_encode, pn_data_encoded_size, pn_data_enter, pn_data_error, pn_data_exit, \
+    pn_data_decode, pn_data_dump, pn_data_encode, pn_data_encode_into, pn_data_encoded_size, pn_data_enter, pn_data_error, pn_data_exit, \
     pn_data_format, pn_data_free, pn_data_get_array, pn_data_get_array_type, pn_data_get_binary, pn_data_get_bool, \
     pn_data_get_byte, pn_data_get_char, pn_data_get_decimal128, pn_data_get_decimal32, pn_data_get_decimal64, \
     pn_data_get_double, pn_data_get_float, pn_data_get_int, pn_data_get_list, pn_data_get_long, pn_data_get_map, \
@@ -44,11 +45,17 @@ from cproton import PN_ARRAY, PN_BINARY, PN_BOOL, PN_BYTE, PN_CHAR, PN_DECIMAL12
     pn_data_put_decimal32, pn_data_put_decimal64, pn_data_put_described, pn_data_put_double, pn_data_put_float, \
     pn_data_put_int, pn_data_put_list, pn_data_put_long, pn_data_put_map, pn_data_put_null, pn_data_put_short, \
     pn_data_put_string, pn_data_put_symbol, pn_data_put_timestamp, pn_data_put_ubyte, pn_data_put_uint, \
-    pn_data_put_ulong, pn_data_put_ushort, pn_data_put_uuid, pn_data_rewind, pn_data_type, pn_data_widen, pn_error_text
+    pn_data_put_ulong, pn_data_put_ushort, pn_data_put_uuid, pn_data_rewind, pn_data_type, pn_data_widen, pn_error_text, \
+    pn_data_copy_current
 
 from ._common import Constant
 from ._exceptions import DataException, EXCEPTIONS
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 long = int
 unicode = str
 
@@ -559,6 +566,80 @@ class SymbolList(list):
         return 'SymbolList(%s)' % super(SymbolList, self).__repr__()
 
 
+# AMQP types with a fixed width encoding that can be packed directly into,
+# or unpacked directly from, an array encoding. For each type: the struct
+# format character, the array element constructor and the Python type.
+_FIXED_WIDTH_TYPES = {
+    PN_UBYTE: ('B', 0x50, ubyte),
+    PN_BYTE: ('b', 0x51, byte),
+    PN_USHORT: ('H', 0x60, ushort),
+    PN_SHORT: ('h', 0x61, short),
+    PN_UINT: ('I', 0x70, uint),
+    PN_INT: ('i', 0x71, int32),
+    PN_ULONG: ('Q', 0x80, ulong),
+    PN_LONG: ('q', 0x81, long),
+    PN_FLOAT: ('f', 0x72, float32),
+    PN_DOUBLE: ('d', 0x82, float),
+    PN_TIMESTAMP: ('q', 0x83, timestamp)
+}
+
+# Struct format for each fixed width array element constructor we may be sent
+_ARRAY_ELEMENT_FORMATS = {
+    0x50: 'B', 0x51: 'b', 0x52: 'B', 0x53: 'B', 0x54: 'b', 0x55: 'b',
+    0x60: 'H', 0x61: 'h', 0x70: 'I', 0x71: 'i', 0x72: 'f',
+    0x80: 'Q', 0x81: 'q', 0x82: 'd', 0x83: 'q'
+}
+
+# AMQP type for each numpy (kind, itemsize)
+_NUMPY_TYPES = {
+    ('u', 1): PN_UBYTE, ('i', 1): PN_BYTE,
+    ('u', 2): PN_USHORT, ('i', 2): PN_SHORT,
+    ('u', 4): PN_UINT, ('i', 4): PN_INT,
+    ('u', 8): PN_ULONG, ('i', 8): PN_LONG,
+    ('f', 4): PN_FLOAT, ('f', 8): PN_DOUBLE
+}
+
+
+# Signed integer array element types, narrowest first, with their range and width
+_INT_ARRAY_TYPES = (
+    (PN_BYTE, -2**7, 2**7 - 1, 1),
+    (PN_SHORT, -2**15, 2**15 - 1, 2),
+    (PN_INT, -2**31, 2**31 - 1, 4),
+    (PN_LONG, -2**63, 2**63 - 1, 8)
+)
+
+
+def _compact_array_type(s: List[Any]) -> Optional[int]:
+    """
+    Return the AMQP array element type to use for a list of Python ``int``
+    or ``float`` values, or ``None`` if the list is not homogeneous or would
+    not encode smaller as an array than as a list.
+    """
+    if not s:
+        return None
+    first = type(s[0])
+    if first is float:
+        if all(type(v) is float for v in s):
+            # 8 bytes per element rather than 9 in a list
+            return PN_DOUBLE
+        return None
+    if first is not int or not all(type(v) is int for v in s):
+        return None
+    low = min(s)
+    high = max(s)
+    for element_type, type_min, type_max, width in _INT_ARRAY_TYPES:
+        if type_min <= low and high <= type_max:
+            break
+    else:
+        return None
+    # In a list python ints are encoded as 2 byte smalllongs or 9 byte longs.
+    # The array header is a byte longer than the list header.
+    list_size = sum(2 if -128 <= v <= 127 else 9 for v in s)
+    if len(s) * width + 1 < list_size:
+        return element_type
+    return None
+
+
 class Data:
     """
     The :class:`Data` class provides an interface for decoding, extracting,
@@ -609,6 +690,16 @@ class Data:
         * :const:`ARRAY`
         * :const:`LIST`
         * :const:`MAP`
+
+    :ivar compact_lists: If ``True``, :meth:`put_sequence` encodes lists of
+        Python ``int`` or ``float`` values as an AMQP array of the narrowest
+        suitable type whenever that is smaller than an AMQP list.
+    :vartype compact_lists: ``bool``
+    :ivar arrays_as_lists: If ``True``, :meth:`get_py_array` returns
+        undescribed arrays as Python ``list`` objects rather than
+        :class:`Array` objects, with integer and floating point elements as
+        plain ``int`` and ``float`` values.
+    :vartype arrays_as_lists: ``bool``
     """
 
     NULL = PN_NULL  #: A null value.
@@ -637,6 +728,9 @@ class Data:
     LIST = PN_LIST  #: A list value.
     MAP = PN_MAP  #: A map value.
 
+    compact_lists = False
+    arrays_as_lists = False
+
     type_names = {
         NULL: "null",
         BOOL: "bool",
@@ -817,6 +911,20 @@ class Data:
             else:
                 self._check(cd)
 
+    def encode_into(self, buffer: Union[bytearray, memoryview]) -> int:
+        """
+        Encodes the data in AMQP format into a caller supplied writable
+        buffer, as :meth:`encode` does but without allocating a new buffer.
+        :meth:`encoded_size` gives the space required.
+
+        :param buffer: A writable buffer, such as a ``bytearray`` or a
+            ``memoryview`` over one.
+        :return: The number of bytes written to ``buffer``
+        :raise: :exc:`DataException` if ``buffer`` is too small or there is
+            a Proton error.
+        """
+        return self._check(pn_data_encode_into(self._data, buffer))
+
     def decode(self, encoded: bytes) -> int:
         """
         Decodes the first value from supplied AMQP data and returns the
@@ -1458,11 +1566,17 @@ class Data:
     def put_sequence(self, s: List[Any]) -> None:
         """
         A convenience method for encoding a Python ``list`` as an
-        AMQP list.
+        AMQP list, or as an AMQP array if :attr:`compact_lists` is set
+        and the list is suitable.
 
         :param s: The sequence to be encoded
         :raise: :exc:`DataException` if there is a Proton error.
         """
+        if self.compact_lists:
+            element_type = _compact_array_type(s)
+            if element_type is not None:
+                self.put_py_array(Array(UNDESCRIBED, element_type, *s))
+                return
         self.put_list()
         self.enter()
         try:
@@ -1520,14 +1634,48 @@ class Data:
         finally:
             self.exit()
 
-    def get_py_array(self) -> Optional[Array]:
+    def _put_encoded_array(self, element_type: int, count: int, payload: bytes) -> None:
+        """
+        Puts an undescribed array of a fixed width type whose elements are
+        already encoded (big-endian) in ``payload``.
+        """
+        constructor = _FIXED_WIDTH_TYPES[element_type][1]
+        header = struct.pack('>BIIB', 0xf0, len(payload) + 5, count, constructor)
+        self._check(pn_data_decode(self._data, b"".join((header, payload))))
+
+    def _get_encoded_array(self) -> Optional[Tuple[str, int, memoryview]]:
+        """
+        If the current node is an undescribed array of a fixed width type,
+        return the struct format of its elements, the element count and a
+        view of the encoded elements. Otherwise return ``None``.
+        """
+        if pn_data_type(self._data) != PN_ARRAY or pn_data_is_array_described(self._data) \
+                or pn_data_get_array_type(self._data) not in _FIXED_WIDTH_TYPES:
+            return None
+        node = Data()
+        self._check(pn_data_copy_current(node._data, self._data))
+        encoded = memoryview(node.encode())
+        if encoded[0] == 0xe0:
+            count, constructor = encoded[2], encoded[3]
+            offset = 4
+        else:
+            count, constructor = struct.unpack_from('>IB', encoded, 5)
+            offset = 10
+        fmt = _ARRAY_ELEMENT_FORMATS.get(constructor)
+        if fmt is None:
+            return None
+        return fmt, count, encoded[offset:offset + count * struct.calcsize(fmt)]
+
+    def get_py_array(self) -> Optional[Union[Array, List[Any]]]:
         """
         A convenience method for decoding an AMQP array into an
         :class:`Array` object. This method encapsulates all the
         steps described in :func:`get_array` into a single function.
 
         If the current node is an array, return an Array object
-        representing the array and its contents. Otherwise return ``None``.
+        representing the array and its contents, or a ``list`` of its
+        elements if :attr:`arrays_as_lists` is set and the array is not
+        described. Otherwise return ``None``.
 
         :returns: The decoded AMQP array.
         """
@@ -1535,6 +1683,16 @@ class Data:
         count, described, type = self.get_array()
         if type is None:
             return None
+        encoded = self._get_encoded_array()
+        if encoded is not None:
+            fmt, count, payload = encoded
+            elements = struct.unpack('>%d%s' % (count, fmt), payload)
+            if self.arrays_as_lists:
+                return list(elements)
+            pytype = _FIXED_WIDTH_TYPES[type][2]
+            return Array(UNDESCRIBED, type, *map(pytype, elements))
+        if not described and self.arrays_as_lists:
+            return self.get_sequence()
         if self.enter():
             try:
                 if described:
@@ -1559,6 +1717,16 @@ class Data:
         :raise: :exc:`DataException` if there is a Proton error.
         """
         described = a.descriptor != UNDESCRIBED
+        if not described and a.type in _FIXED_WIDTH_TYPES:
+            fmt = _FIXED_WIDTH_TYPES[a.type][0]
+            try:
+                payload = struct.pack('>%d%s' % (len(a.elements), fmt), *a.elements)
+            except (struct.error, TypeError, OverflowError):
+                # Let the element by element encoding handle the problem
+                pass
+            else:
+                self._put_encoded_array(a.type, len(a.elements), payload)
+                return
         self.put_array(described, a.type)
         self.enter()
         try:
@@ -1569,6 +1737,41 @@ class Data:
         finally:
             self.exit()
 
+    def put_ndarray(self, a: 'numpy.ndarray') -> None:
+        """
+        A convenience method for encoding a one dimensional ``numpy.ndarray``
+        of integers or floats as an AMQP array. The conversion to the AMQP
+        (big-endian) encoding is done by numpy rather than element by element.
+
+        :param a: The array to be encoded
+        :raise: :exc:`DataException` if the array cannot be encoded as an AMQP array.
+        """
+        if a.ndim != 1:
+            raise DataException("Only one dimensional arrays can be encoded: ndim=%d" % a.ndim)
+        element_type = _NUMPY_TYPES.get((a.dtype.kind, a.dtype.itemsize))
+        if element_type is None:
+            raise DataException("Unsupported array element type: %s" % a.dtype)
+        fmt = _FIXED_WIDTH_TYPES[element_type][0]
+        self._put_encoded_array(element_type, len(a), a.astype('>' + fmt, copy=False).tobytes())
+
+    def get_ndarray(self) -> Optional['numpy.ndarray']:
+        """
+        A convenience method for decoding an undescribed AMQP array of a fixed
+        width numeric type as a ``numpy.ndarray``. The result is a read-only
+        view with a big-endian ``dtype`` of a single copy of the encoded array.
+
+        :returns: The decoded array, or ``None`` if the current node is not
+            an undescribed array of a fixed width numeric type.
+        :raise: ``ImportError`` if numpy is not available.
+        """
+        if numpy is None:
+            raise ImportError("numpy is required to decode arrays as numpy.ndarray")
+        encoded = self._get_encoded_array()
+        if encoded is None:
+            return None
+        fmt, count, payload = encoded
+        return numpy.frombuffer(payload, dtype='>' + fmt, count=count)
+
     put_mappings = {
         None.__class__: lambda s, _: s.put_null(),
         bool: put_bool,
@@ -1601,6 +1804,9 @@ class Data:
         SymbolList: put_sequence,
         memoryview: put_memoryview
     }
+    if numpy is not None:
+        put_mappings[numpy.ndarray] = put_ndarray
+
     get_mappings = {
         NULL: lambda s: None,
         BOOL: get_bool,
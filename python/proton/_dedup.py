@@ -0,0 +1,220 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import collections
+import math
+import time
+
+from typing import Callable, Hashable, List, Optional, OrderedDict, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._message import Message
+
+
+def _message_id(message: 'Message') -> Hashable:
+    return message.id
+
+
+class _BloomFilter(object):
+    """
+    A set of keys, each recorded as ``hashes`` bits of a bit array, that may
+    report a key never added as present, with a probability depending on
+    how many keys it holds.
+    """
+
+    # each bit tested costs more in Python than the memory saved by testing
+    # the optimal number, so fewer are used, in a larger array
+    max_hashes = 6
+
+    def __init__(self, capacity: int, error: float) -> None:
+        hashes = min(self.max_hashes, max(1, round(-math.log(error, 2))))
+        self.hashes = hashes
+        self.size = max(8, math.ceil(-hashes * capacity / math.log(1 - error ** (1 / hashes))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key: Hashable) -> List[int]:
+        """The bits recording ``key``, which are the same in filters of the same size."""
+        # double hashing, from a second hash made by hashing the first. The
+        # hashes of tuples are well mixed even for keys, such as small
+        # integers, whose hash is the key itself
+        h1 = hash((key,))
+        h2 = hash((h1,))
+        size = self.size
+        h1 %= size
+        h2 = h2 % size or 1
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def __contains__(self, positions: List[int]) -> bool:
+        bits = self.bits
+        for i in positions:
+            if not bits[i >> 3] & (1 << (i & 7)):
+                return False
+        return True
+
+    def add(self, positions: List[int]) -> None:
+        bits = self.bits
+        for i in positions:
+            bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+
+class DuplicateFilter(object):
+    """
+    A record of the messages recently received, by which
+    :class:`proton.handlers.MessagingHandler` recognises messages received
+    more than once, such as those sent again by a producer that reconnects
+    after failing to learn that they were received.
+
+    Keys of recent messages are held exactly, in a set of at most
+    ``window`` keys from which the least recently seen are forgotten. A
+    message with a key in that set is a duplicate: it is accepted without
+    being passed to ``on_message``, and is passed to ``on_duplicate``
+    instead.
+
+    A window too large to hold exactly may be covered by a Bloom filter,
+    which uses a few bytes per key but may mistake a new key for one it
+    has seen. A message whose key is found only by the Bloom filter is
+    therefore still passed to ``on_message``, with the event's
+    ``possible_duplicate`` set, so that only those messages need be
+    checked against a durable record of the messages processed.
+
+    A message is remembered once ``on_message`` returns, unless it raised
+    :class:`proton.handlers.Reject` or :class:`proton.handlers.Release`.
+    If the handler does not accept messages automatically, a message is
+    remembered only once its delivery is accepted with the handler's
+    ``accept`` method, so that a message released by the application is
+    passed to ``on_message`` when it is sent again.
+    Messages without a key, and the bodies passed to ``on_message_chunk``,
+    are not filtered.
+
+    :param window: The number of keys held exactly.
+    :param window_time: If set, keys are also forgotten by the exact set
+        after this many seconds without being seen, and are held by the
+        Bloom filter for between one and two times this long.
+    :param key: A function returning the key of a message, or ``None`` if
+        the message is not to be filtered. The default is the message
+        :attr:`~proton.Message.id`. Message ids need only be unique for each
+        producer if the key includes the producer, e.g.
+        ``lambda m: (m.properties["producer"], m.id)``.
+    :param bloom_capacity: If set, keys are also recorded by a Bloom filter
+        holding at least this many keys. It is made of two halves used in
+        turn, each holding this many, so that the oldest keys can be
+        forgotten by clearing a half.
+    :param bloom_error: The probability with which a Bloom filter holding
+        ``bloom_capacity`` keys reports a new key as seen.
+    """
+
+    def __init__(
+            self,
+            window: int = 100000,
+            window_time: Optional[float] = None,
+            key: Callable[['Message'], Optional[Hashable]] = _message_id,
+            bloom_capacity: Optional[int] = None,
+            bloom_error: float = 1e-4
+    ) -> None:
+        self.window = window
+        self.window_time = window_time
+        self.key = key
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error = bloom_error
+        self.duplicates = 0
+        self.possible_duplicates = 0
+        self._recent: OrderedDict[Hashable, float] = collections.OrderedDict()
+        self._bloom: Optional[_BloomFilter] = None
+        self._old_bloom: Optional[_BloomFilter] = None
+        if bloom_capacity:
+            # each half has half the error rate, so that the two together
+            # have about the error rate asked for
+            self._bloom = _BloomFilter(bloom_capacity, bloom_error / 2)
+        self._bloom_start = time.monotonic()
+        # the Bloom filter positions of the key last checked, for add
+        self._checked: Optional[Tuple[Hashable, List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def check(self, message: 'Message') -> Optional[bool]:
+        """
+        Whether a message has been seen before, without remembering it.
+
+        :return: ``True`` if it has, ``None`` if it may have been, as only
+            the Bloom filter has seen it, or ``False`` if it has not.
+        """
+        key = self.key(message)
+        if key is None:
+            return False
+        recent = self._recent
+        if key in recent:
+            if self.window_time is None:
+                recent.move_to_end(key)
+                self.duplicates += 1
+                return True
+            now = time.monotonic()
+            if recent[key] >= now - self.window_time:
+                recent.move_to_end(key)
+                recent[key] = now
+                self.duplicates += 1
+                return True
+            del recent[key]
+        bloom = self._bloom
+        if bloom is not None:
+            self._rotate()
+            positions = bloom.positions(key)
+            self._checked = (key, positions)
+            if positions in bloom or (self._old_bloom is not None and positions in self._old_bloom):
+                self.possible_duplicates += 1
+                return None
+        return False
+
+    def add(self, message: 'Message') -> None:
+        """
+        Remember a message as seen.
+        """
+        self._add(self.key(message))
+
+    def _add(self, key: Optional[Hashable]) -> None:
+        if key is None:
+            return
+        recent = self._recent
+        recent[key] = time.monotonic() if self.window_time is not None else 0.0
+        recent.move_to_end(key)
+        while len(recent) > self.window:
+            recent.popitem(last=False)
+        if self.window_time is not None:
+            expired = time.monotonic() - self.window_time
+            while recent and next(iter(recent.values())) < expired:
+                recent.popitem(last=False)
+        if self._bloom is not None:
+            self._rotate()
+            checked = self._checked
+            if checked is not None and checked[0] == key:
+                positions = checked[1]
+            else:
+                positions = self._bloom.positions(key)
+            self._checked = None
+            self._bloom.add(positions)
+
+    def _rotate(self) -> None:
+        bloom = self._bloom
+        if bloom.count >= self.bloom_capacity \
+                or (self.window_time is not None and time.monotonic() - self._bloom_start >= self.window_time):
+            self._old_bloom = bloom
+            self._bloom = _BloomFilter(self.bloom_capacity, self.bloom_error / 2)
+            self._bloom_start = time.monotonic()
@@ -20,18 +20,19 @@
 from cproton import PN_ACCEPTED, PN_MODIFIED, PN_RECEIVED, PN_REJECTED, PN_RELEASED, pn_delivery_abort, \
     pn_delivery_aborted, pn_delivery_attachments, pn_delivery_link, pn_delivery_local, pn_delivery_local_state, \
     pn_delivery_partial, pn_delivery_pending, pn_delivery_readable, pn_delivery_remote, pn_delivery_remote_state, \
-    pn_delivery_settle, pn_delivery_settled, pn_delivery_tag, pn_delivery_update, pn_delivery_updated, \
-    pn_delivery_writable, pn_disposition_annotations, pn_disposition_condition, pn_disposition_data, \
+    pn_delivery_settle, pn_delivery_settled, pn_delivery_tag, pn_delivery_tag_bytes, pn_delivery_update, \
+    pn_delivery_updated, pn_delivery_writable, pn_disposition_annotations, pn_disposition_condition, pn_disposition_data, \
     pn_disposition_get_section_number, pn_disposition_get_section_offset, pn_disposition_is_failed, \
     pn_disposition_is_undeliverable, pn_disposition_set_failed, pn_disposition_set_section_number, \
     pn_disposition_set_section_offset, pn_disposition_set_undeliverable, pn_disposition_type, \
-    isnull
+    addressof, isnull
 
 from ._condition import cond2obj, obj2cond
 from ._data import dat2obj, obj2dat
 from ._wrapper import Wrapper
 
 from typing import Dict, List, Optional, Type, Union, TYPE_CHECKING, Any
+from weakref import WeakValueDictionary
 
 if TYPE_CHECKING:
     from ._condition import Condition
@@ -288,12 +289,16 @@ class Delivery(Wrapper):
     delivery being settled.
     """
 
+    _wrapper_cache = WeakValueDictionary()
+
     @staticmethod
     def wrap(impl):
         if isnull(impl):
             return None
-        else:
-            return Delivery(impl)
+        wrapper = Delivery._wrapper_cache.get(addressof(impl))
+        if wrapper is None:
+            wrapper = Delivery(impl)
+        return wrapper
 
     def __init__(self, impl):
         Wrapper.__init__(self, impl, pn_delivery_attachments)
@@ -305,10 +310,20 @@ class Delivery(Wrapper):
     @property
     def tag(self) -> str:
         """
-        The identifier for the delivery.
+        The identifier for the delivery. Tag bytes that are not valid UTF-8
+        are decoded as surrogate escapes (the ``surrogateescape`` error
+        handler), so the tag is always a ``str``, and passing it to
+        :meth:`proton.Link.delivery` gives a delivery with the same tag.
         """
         return pn_delivery_tag(self._impl)
 
+    @property
+    def binary_tag(self) -> bytes:
+        """
+        The identifier for the delivery, as ``bytes``.
+        """
+        return pn_delivery_tag_bytes(self._impl)
+
     @property
     def writable(self) -> bool:
         """
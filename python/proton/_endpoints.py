@@ -21,6 +21,8 @@
 The proton.endpoints module
 """
 
+import mmap
+import os
 import weakref
 
 from cproton import PN_CONFIGURATION, PN_COORDINATOR, PN_DELIVERIES, PN_DIST_MODE_COPY, PN_DIST_MODE_MOVE, \
@@ -37,10 +39,10 @@ from cproton import PN_CONFIGURATION, PN_COORDINATOR, PN_DELIVERIES, PN_DIST_MOD
     pn_connection_set_authorization, pn_connection_set_container, \
     pn_connection_set_hostname, pn_connection_set_password, pn_connection_set_user, pn_connection_state, \
     pn_connection_transport, pn_delivery, pn_error_code, pn_error_text, pn_link_advance, pn_link_attachments, \
-    pn_link_available, pn_link_close, pn_link_condition, pn_link_credit, pn_link_current, pn_link_detach, pn_link_drain, \
-    pn_link_drained, pn_link_draining, pn_link_error, pn_link_flow, pn_link_free, pn_link_get_drain, pn_link_head, \
+    pn_link_available, pn_link_buffered_bytes_py, pn_link_close, pn_link_condition, pn_link_credit, pn_link_current, \
+    pn_link_detach, pn_link_drain, pn_link_drained, pn_link_draining, pn_link_error, pn_link_flow, pn_link_free, pn_link_get_drain, pn_link_head, \
     pn_link_is_receiver, pn_link_is_sender, pn_link_max_message_size, pn_link_name, pn_link_next, pn_link_offered, \
-    pn_link_open, pn_link_queued, pn_link_rcv_settle_mode, pn_link_recv, pn_link_remote_condition, \
+    pn_link_open, pn_link_queued, pn_link_rcv_settle_mode, pn_link_recv, pn_link_recv_into, pn_link_remote_condition, \
     pn_link_remote_max_message_size, pn_link_remote_rcv_settle_mode, pn_link_remote_snd_settle_mode, \
     pn_link_remote_source, pn_link_remote_target, pn_link_send, pn_link_session, pn_link_set_drain, \
     pn_link_set_max_message_size, pn_link_set_rcv_settle_mode, pn_link_set_snd_settle_mode, pn_link_snd_settle_mode, \
@@ -55,18 +57,20 @@ from cproton import PN_CONFIGURATION, PN_COORDINATOR, PN_DELIVERIES, PN_DIST_MOD
     pn_terminus_set_distribution_mode, pn_terminus_set_durability, pn_terminus_set_dynamic, \
     pn_terminus_set_expiry_policy, pn_terminus_set_timeout, pn_terminus_set_type, \
     pn_link_properties, pn_link_remote_properties, \
-    isnull
+    addressof, isnull
 
 from ._condition import cond2obj, obj2cond
 from ._data import Data, dat2obj, obj2dat, PropertyDict, SymbolList
 from ._delivery import Delivery
 from ._exceptions import ConnectionException, EXCEPTIONS, LinkException, SessionException
 from ._handler import Handler
+from ._outbox import Outbox
 from ._transport import Transport
 from ._wrapper import Wrapper
-from typing import Dict, List, Optional, Union, TYPE_CHECKING, Any
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from ._compression import Compression
     from ._condition import Condition
     from ._data import Array, PythonAMQPData, symbol
     from ._events import Collector
@@ -159,12 +163,16 @@ class Connection(Wrapper, Endpoint):
     A representation of an AMQP connection.
     """
 
+    _wrapper_cache = weakref.WeakValueDictionary()
+
     @staticmethod
     def wrap(impl):
         if isnull(impl):
             return None
-        else:
-            return Connection(impl)
+        wrapper = Connection._wrapper_cache.get(addressof(impl))
+        if wrapper is None:
+            wrapper = Connection(impl)
+        return wrapper
 
     def __init__(self, impl: Any = None) -> None:
         if impl is None:
@@ -550,12 +558,17 @@ class Connection(Wrapper, Endpoint):
 
 class Session(Wrapper, Endpoint):
     """A container of links"""
+
+    _wrapper_cache = weakref.WeakValueDictionary()
+
     @staticmethod
     def wrap(impl):
         if isnull(impl):
             return None
-        else:
-            return Session(impl)
+        wrapper = Session._wrapper_cache.get(addressof(impl))
+        if wrapper is None:
+            wrapper = Session(impl)
+        return wrapper
 
     def __init__(self, impl):
         Wrapper.__init__(self, impl, pn_session_attachments)
@@ -714,14 +727,19 @@ class Link(Wrapper, Endpoint):
     RCV_SECOND = PN_RCV_SECOND
     """The receiver will only settle deliveries after the sender settles."""
 
+    _wrapper_cache = weakref.WeakValueDictionary()
+
     @staticmethod
     def wrap(impl):
         if isnull(impl):
             return None
-        if pn_link_is_sender(impl):
-            return Sender(impl)
-        else:
-            return Receiver(impl)
+        wrapper = Link._wrapper_cache.get(addressof(impl))
+        if wrapper is None:
+            if pn_link_is_sender(impl):
+                wrapper = Sender(impl)
+            else:
+                wrapper = Receiver(impl)
+        return wrapper
 
     def __init__(self, impl):
         Wrapper.__init__(self, impl, pn_link_attachments)
@@ -845,14 +863,16 @@ class Link(Wrapper, Endpoint):
         """
         return self.session.transport
 
-    def delivery(self, tag: str) -> Delivery:
+    def delivery(self, tag: Union[str, bytes]) -> Delivery:
         """
         Create a delivery. Every delivery object within a
         link must be supplied with a unique tag. Links
         maintain a sequence of delivery object in the order that
         they are created.
 
-        :param tag: Delivery tag unique for this link.
+        :param tag: Delivery tag unique for this link. A ``str`` tag is sent
+            UTF-8 encoded, with surrogate escapes (see
+            :attr:`proton.Delivery.tag`) sent as the bytes they stand for.
         """
         return Delivery(pn_delivery(self._impl, tag))
 
@@ -953,6 +973,15 @@ class Link(Wrapper, Endpoint):
         """
         return pn_link_queued(self._impl)
 
+    @property
+    def buffered_bytes(self) -> int:
+        """
+        The number of bytes of message data buffered for the unsettled
+        deliveries of this link: received but not yet read for a receiver,
+        or not yet written to the transport for a sender.
+        """
+        return pn_link_buffered_bytes_py(self._impl)
+
     def next(self, mask: int) -> Optional[Union['Sender', 'Receiver']]:
         """
         Retrieve the next link that matches the given state mask.
@@ -1145,6 +1174,20 @@ class Sender(Link):
     A link over which messages are sent.
     """
 
+    compression: Optional['Compression'] = None
+    """
+    If set, the bodies of messages sent with :meth:`send` are compressed as
+    described by :class:`proton.Compression`.
+    """
+
+    compact_tags: bool = True
+    """
+    If ``True``, :meth:`delivery_tag` generates binary tags rather than the
+    decimal strings of earlier releases, which are larger on the wire and
+    slower to generate. Set to ``False`` on a sender, or on this class, for
+    peers that expect tags to be text.
+    """
+
     def offered(self, n: int) -> None:
         """
         Signal the availability of deliveries for this Sender.
@@ -1154,11 +1197,17 @@ class Sender(Link):
         """
         pn_link_offered(self._impl, n)
 
-    def stream(self, data: bytes) -> int:
+    def stream(self, data: Union[bytes, bytearray, memoryview, 'mmap.mmap']) -> int:
         """
         Send specified data as part of the current delivery.
 
-        :param data: Data to send
+        Any object supporting the buffer protocol is sent directly from its
+        memory, so a ``memoryview`` slice of a larger buffer or a ``mmap``
+        of a file can be streamed without first copying it into ``bytes``.
+
+        :param data: Data to send. Views with an item size larger than one
+            byte are sent in full.
+        :return: The number of bytes sent
         """
         return self._check(pn_link_send(self._impl, data))
 
@@ -1179,19 +1228,247 @@ class Sender(Link):
             # treat object as bytes
             return self.stream(obj)
 
+    def send_stream(
+            self,
+            source: Union[bytes, bytearray, memoryview, 'mmap.mmap', BinaryIO, Iterable[bytes]],
+            size: Optional[int] = None,
+            message: Optional['Message'] = None,
+            tag: Optional[str] = None,
+            window: int = 16
+    ) -> Delivery:
+        """
+        Send a message whose body is read incrementally from ``source``,
+        so that bodies larger than memory can be sent.
+
+        The body is sent as AMQP data sections following the other sections
+        of ``message``. Only as much of it as fits in ``window`` frames of the
+        remote maximum frame size is buffered by the session at a time; the
+        rest is sent by :meth:`resume_stream` as that buffer drains, which
+        :class:`proton.handlers.MessagingHandler` does automatically. No
+        other message can be sent on this link until the stream completes.
+
+        :param source: The body. Either a buffer, such as ``bytes`` or a
+            ``mmap``, a binary file opened for reading, from which the body
+            is read from the current position, or an iterable of ``bytes``
+            like chunks.
+        :param size: The body size in bytes. This is required if ``source``
+            is an iterable, and otherwise defaults to the size of the buffer
+            or the remainder of the file.
+        :param message: A message supplying the properties and other
+            sections of the streamed message. Its body is ignored.
+        :param tag: The delivery tag for the sent message
+        :param window: The number of frames of the body buffered at once.
+        :return: The delivery associated with the message
+        :raise: * :class:`LinkException` if a stream is already in progress
+                * ``ValueError`` if ``source`` does not hold ``size`` bytes,
+                  when found before this returns. Found later, the
+                  :class:`proton.handlers.MessagingHandler` calls its
+                  ``on_stream_error`` instead.
+        """
+        from ._message import _OutgoingStream
+        if self.streaming:
+            raise LinkException("a message is already being streamed on %s" % self.name)
+        stream = _OutgoingStream(self, source, size, message, window)
+        stream.delivery = dlv = self.delivery(tag or self.delivery_tag())
+        self._outgoing_stream = stream
+        self.resume_stream()
+        return dlv
+
+    def send_file(
+            self,
+            file: Union[str, BinaryIO],
+            message: Optional['Message'] = None,
+            tag: Optional[str] = None,
+            window: int = 16
+    ) -> Delivery:
+        """
+        Send a message whose body is the content of a file, as
+        :meth:`send_stream` does, but sending it directly from a read only
+        memory mapping of the file so that the body is neither read into
+        nor copied through Python buffers. The mapping is closed once the
+        body has been sent.
+
+        :param file: The path of the file, or a binary file object, whose
+            content from its current position is sent.
+        :param message: A message supplying the properties and other
+            sections of the message. Its body is ignored.
+        :param tag: The delivery tag for the sent message
+        :param window: The number of frames of the body buffered at once.
+        :return: The delivery associated with the message
+        """
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                return self.send_file(f, message, tag, window)
+        offset = file.tell()
+        if os.fstat(file.fileno()).st_size <= offset:
+            # an empty file cannot be mapped
+            return self.send_stream(b"", 0, message, tag, window)
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)[offset:]
+        try:
+            dlv = self.send_stream(view, None, message, tag, window)
+        except BaseException:
+            view.release()
+            mapping.close()
+            raise
+        view.release()
+        stream = getattr(self, '_outgoing_stream', None)
+        if stream is None:
+            mapping.close()
+        else:
+            stream.map(mapping, offset)
+        return dlv
+
+    @property
+    def streaming(self) -> bool:
+        """``True`` while a message started by :meth:`send_stream` is being sent."""
+        return getattr(self, '_outgoing_stream', None) is not None
+
+    def resume_stream(self) -> bool:
+        """
+        Continue sending the message started by :meth:`send_stream`, up to
+        its buffer limit.
+
+        :return: ``True`` once the whole message has been sent (or if none
+            is being streamed), ``False`` if it has more to send.
+        :raise: ``ValueError`` if the source does not hold the size given,
+            in which case the delivery has been aborted.
+        """
+        stream = getattr(self, '_outgoing_stream', None)
+        if stream is None:
+            return True
+        try:
+            stream.pump(self)
+        finally:
+            if stream.done:
+                self._outgoing_stream = None
+        return stream.done
+
+    @property
+    def outbox(self) -> Outbox:
+        """
+        The :class:`proton.Outbox` holding messages passed to :meth:`enqueue`
+        until there is credit to send them. A default one, holding up to
+        1024 messages or 16 MiB and raising :exc:`proton.OutboxFull` when
+        full, is created when first used.
+        """
+        outbox = getattr(self, '_outbox', None)
+        if outbox is None:
+            self.outbox = outbox = Outbox()
+        return outbox
+
+    @outbox.setter
+    def outbox(self, outbox: Outbox) -> None:
+        outbox.sender = self
+        self._outbox = outbox
+
+    def enqueue(
+            self,
+            msg: Union['Message', bytes, bytearray, memoryview],
+            tag: Optional[Union[str, bytes]] = None
+    ) -> Optional[Delivery]:
+        """
+        Send a message if there is credit for it, and otherwise add it to
+        :attr:`outbox` to be sent by :meth:`send_queued` as credit arrives.
+        :class:`proton.handlers.MessagingHandler` and
+        :class:`proton.utils.BlockingConnection` do that on each flow event,
+        and the ``on_sendable`` callback follows only once the outbox is
+        empty, so applications need not buffer messages themselves.
+
+        Messages are queued encoded, with their bodies compressed if the
+        sender has a :attr:`compression`, so they are unaffected by later
+        changes to the :class:`proton.Message` objects.
+
+        A :attr:`~proton.Outbox.durable` outbox, such as a
+        :class:`proton.DurableOutbox`, takes every message, which it sends
+        once it has stored it.
+
+        :param msg: The message, or an encoded message.
+        :param tag: The delivery tag for the message
+        :return: The delivery for the message if it was sent at once,
+            otherwise ``None``.
+        :raise: :exc:`proton.OutboxFull` if the message does not fit in the
+            outbox and its policy is not :const:`proton.Outbox.DROP`.
+        """
+        outbox = self.outbox
+        if outbox.durable or not self.send_queued() or not self.credit or self.streaming:
+            if not isinstance(msg, (bytes, bytearray, memoryview)):
+                data = msg.encode(self.compression)
+            else:
+                data = bytes(msg)
+            if outbox.put(data, tag) and outbox.durable:
+                self.send_queued()
+            return None
+        if isinstance(msg, (bytes, bytearray, memoryview)):
+            dlv = self._send_encoded(msg, tag)
+        else:
+            dlv = msg.send(self, tag)
+        dlv._outbox = outbox
+        return dlv
+
+    def send_queued(self) -> bool:
+        """
+        Send messages from :attr:`outbox` while the link has credit for them.
+
+        :return: ``True`` once the outbox is empty, ``False`` if it has
+            messages waiting for credit or for a :meth:`send_stream` to
+            complete.
+        """
+        outbox = getattr(self, '_outbox', None)
+        if outbox is None:
+            return True
+        while outbox and self.credit > 0 and not self.streaming:
+            item = outbox.get()
+            if item is None:
+                break
+            dlv = self._send_encoded(item[1], item[0])
+            dlv._outbox = outbox
+            outbox.sent(dlv)
+        return not outbox
+
+    def _send_encoded(self, data: Union[bytes, bytearray, memoryview], tag: Optional[Union[str, bytes]]) -> Delivery:
+        dlv = self.delivery(tag or self.delivery_tag())
+        self.stream(data)
+        self.advance()
+        if self.snd_settle_mode == Link.SND_SETTLED:
+            dlv.settle()
+        return dlv
+
     def delivery_tag(self) -> str:
-        """Increments and returns a counter to be used as the next message tag."""
-        if not hasattr(self, 'tag_generator'):
-            def simple_tags():
-                count = 1
-                while True:
-                    yield str(count)
-                    count += 1
+        """
+        Increments and returns a counter to be used as the next message tag.
 
-            self.tag_generator = simple_tags()
+        The counter is sent as the fewest big-endian bytes that hold it, and
+        returned decoded as by :attr:`proton.Delivery.tag`, so that it
+        equals the tag of the delivery sent with it. It is instead a decimal
+        string if :attr:`compact_tags` was ``False`` when the first tag was
+        generated. Tags are instead taken from
+        ``tag_generator`` if that has been set to an iterator.
+        """
+        if not hasattr(self, 'tag_generator'):
+            self.tag_generator = _binary_tags() if self.compact_tags else _text_tags()
         return next(self.tag_generator)
 
 
+def _binary_tags() -> Iterator[str]:
+    count = 1
+    width = 1
+    limit = 256
+    while True:
+        if count == limit:
+            width += 1
+            limit <<= 8
+        yield count.to_bytes(width, 'big').decode('utf-8', 'surrogateescape')
+        count += 1
+
+
+def _text_tags() -> Iterator[str]:
+    count = 1
+    while True:
+        yield str(count)
+        count += 1
+
+
 class Receiver(Link):
     """
     A link over which messages are received.
@@ -1229,6 +1506,29 @@ class Receiver(Link):
             self._check(n)
             return binary
 
+    def recv_into(self, buffer: Union[bytearray, memoryview]) -> Optional[int]:
+        """
+        Receive message data for the current delivery on this receiver
+        into a caller supplied writable buffer, as :meth:`recv` does but
+        without allocating a new buffer for each call. At most
+        ``len(buffer)`` bytes are received.
+
+        :param buffer: A writable buffer, such as a ``bytearray``, a
+            writable ``mmap`` or a ``memoryview`` slice of either, so that
+            data can be received directly into its final location.
+        :return: The number of bytes received into ``buffer``, or ``None``
+            if the message has been completely received.
+        :raise: * :class:`Timeout` if timed out
+                * :class:`Interrupt` if interrupted
+                * :class:`LinkException` for all other exceptions
+        """
+        n = pn_link_recv_into(self._impl, buffer)
+        if n == PN_EOS:
+            return None
+        else:
+            self._check(n)
+            return n
+
     def drain(self, n: int) -> None:
         """
         Grant credit for incoming deliveries on this receiver, and
@@ -114,3 +114,11 @@ class LinkException(ProtonException):
     link arise.
     """
     pass
+
+
+class OutboxFull(LinkException):
+    """
+    An exception raised when a message does not fit in the
+    :class:`proton.Outbox` of a sender.
+    """
+    pass
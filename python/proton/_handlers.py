@@ -23,18 +23,20 @@ import socket
 import time
 import weakref
 
+from ._compression import Compression
 from ._condition import Condition
+from ._dedup import DuplicateFilter
 from ._delivery import Delivery
 from ._endpoints import Endpoint
 from ._events import Event, _dispatch
-from ._exceptions import ProtonException
+from ._exceptions import MessageException, ProtonException
 from ._handler import Handler
 from ._io import IO
-from ._message import Message
+from ._message import _MAX_KEPT_BUFFER, _STREAM_CHUNK, _StreamDecoder, Message, MessagePool
 from ._selectable import Selectable
 from ._transport import Transport
 from ._url import Url
-from typing import Any, List, Optional, Union, TYPE_CHECKING
+from typing import Any, Callable, List, Optional, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from ._delivery import DispositionType
@@ -61,10 +63,23 @@ class OutgoingMessageHandler(Handler):
         self.delegate = delegate
 
     def on_link_flow(self, event: Event):
-        if event.link.is_sender and event.link.credit \
-                and event.link.state & Endpoint.LOCAL_ACTIVE \
-                and event.link.state & Endpoint.REMOTE_ACTIVE:
-            self.on_sendable(event)
+        link = event.link
+        # a flow event follows each transfer, so a streamed message is
+        # resumed as its frames are written
+        if link.is_sender and link.streaming:
+            try:
+                if not link.resume_stream():
+                    return
+            except ValueError as e:
+                # the delivery has been aborted, and the link may be used again
+                event.stream_error = e
+                self.on_stream_error(event)
+        if link.is_sender and link.credit \
+                and link.state & Endpoint.LOCAL_ACTIVE \
+                and link.state & Endpoint.REMOTE_ACTIVE:
+            # messages queued by Sender.enqueue are sent first
+            if link.send_queued() and link.credit:
+                self.on_sendable(event)
 
     def on_delivery(self, event: Event):
         dlv = event.delivery
@@ -76,10 +91,24 @@ class OutgoingMessageHandler(Handler):
             elif dlv.remote_state == Delivery.RELEASED or dlv.remote_state == Delivery.MODIFIED:
                 self.on_released(event)
             if dlv.settled:
+                outbox = getattr(dlv, '_outbox', None)
+                if outbox is not None:
+                    outbox.settled(dlv)
                 self.on_settled(event)
                 if self.auto_settle:
                     dlv.settle()
 
+    def on_transport_closed(self, event: Event):
+        # deliveries left unsettled by a lost connection are never settled
+        # once it is reconnected, so the outboxes send their messages again
+        connection = event.connection
+        link = connection.link_head(0) if connection is not None else None
+        while link:
+            outbox = getattr(link, '_outbox', None) if link.is_sender else None
+            if outbox is not None:
+                outbox.requeue()
+            link = link.next(0)
+
     def on_sendable(self, event: Event):
         """
         Called when the sender link has credit and messages can
@@ -91,6 +120,19 @@ class OutgoingMessageHandler(Handler):
         if self.delegate is not None:
             _dispatch(self.delegate, 'on_sendable', event)
 
+    def on_stream_error(self, event: Event):
+        """
+        Called when the source of a message streamed by
+        :meth:`proton.Sender.send_stream` does not hold the size given, so
+        that its delivery has been aborted. ``event.stream_error`` is the
+        ``ValueError`` describing the problem.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        if self.delegate is not None:
+            _dispatch(self.delegate, 'on_stream_error', event)
+
     def on_accepted(self, event: Event):
         """
         Called when the remote peer accepts an outgoing message.
@@ -136,13 +178,47 @@ class OutgoingMessageHandler(Handler):
             _dispatch(self.delegate, 'on_settled', event)
 
 
-def recv_msg(delivery: Delivery) -> Message:
-    msg = Message()
-    msg.decode(delivery.link.recv(delivery.pending))
-    delivery.link.advance()
+def recv_msg(
+        delivery: Delivery,
+        zero_copy: bool = False,
+        pool: Optional[MessagePool] = None,
+        compression: Optional[Compression] = None
+) -> Message:
+    msg = Message() if pool is None else pool.get()
+    link = delivery.link
+    pending = delivery.pending
+    try:
+        if zero_copy:
+            msg.decode(link.recv(pending), True)
+        else:
+            # The decoded message does not refer to the encoded bytes, so each
+            # receiver keeps one buffer to receive into, except for messages too
+            # large for it to keep
+            buff = getattr(link, '_recv_buffer', None)
+            if pending > _MAX_KEPT_BUFFER:
+                buff = bytearray(pending)
+            elif buff is None or len(buff) < pending:
+                buff = link._recv_buffer = bytearray(max(pending, 1024))
+            size = link.recv_into(memoryview(buff)[:pending]) or 0
+            msg.decode(memoryview(buff)[:size])
+        link.advance()
+        if compression is not None:
+            compression.decompress(msg)
+    except Exception:
+        if pool is not None:
+            pool.put(msg)
+        raise
     return msg
 
 
+def _reject_undecodable(delivery: Delivery, error: MessageException) -> None:
+    # a message that cannot be decompressed is rejected rather than raising
+    # out of the event dispatch
+    delivery.local.condition = Condition('amqp:decode-error', str(error))
+    delivery.update(Delivery.REJECTED)
+    delivery.settle()
+
+
 class Reject(ProtonException):
     """
     An exception that indicates a message should be rejected.
@@ -221,6 +297,13 @@ class Acking(object):
         """
         if state:
             delivery.update(state)
+            if state == Delivery.ACCEPTED:
+                dedup = getattr(delivery, '_duplicate_filter', None)
+                if dedup is not None:
+                    # the message is remembered by the filter of the handler
+                    # that received it only once accepted
+                    delivery._duplicate_filter = None
+                    dedup._add(delivery._duplicate_key)
         delivery.settle()
 
 
@@ -232,11 +315,60 @@ class IncomingMessageHandler(Handler, Acking):
     :param auto_accept: If ``True``, accept all messages (default). Otherwise
         messages must be individually accepted or rejected.
     :param delegate: A client handler for the endpoint event
+    :param zero_copy: If ``True``, a message body sent as a single AMQP data
+        section is delivered as a ``memoryview`` over the received buffer
+        instead of a copy. See :meth:`proton.Message.decode`.
+    :param message_pool: If set, received messages are taken from this
+        :class:`proton.MessagePool` and returned to it once ``on_message``
+        returns, so a message must not be referenced after ``on_message``
+        returns.
+    :param streaming: If ``True``, the body of a message sent as AMQP data
+        sections is passed to ``on_message_chunk`` as it arrives instead of
+        being buffered until the message is complete.
+    :param compression: If set, received data section bodies with a
+        content encoding known to :class:`proton.Compression` are
+        decompressed before ``on_message`` is called, and messages whose
+        bodies cannot be decompressed are rejected without it being called.
+        Streamed bodies are passed on as received.
+    :param batch_acks: If non-zero, messages accepted automatically are
+        settled together, in the order received, once this many are waiting
+        or ``batch_ack_delay`` has passed, so that the peer is sent one
+        disposition for each range of consecutive deliveries rather than one
+        per message. They are also settled by :meth:`flush_acks` and when an
+        endpoint is closed locally.
+    :param batch_ack_delay: The longest time in seconds to hold accepted
+        messages for. By default they are settled once the container has
+        processed the events it has, at the end of its loop iteration.
+    :param duplicate_filter: If set, messages that the
+        :class:`proton.DuplicateFilter` has seen are accepted and passed to
+        ``on_duplicate`` rather than to ``on_message``. Without
+        ``auto_accept``, a message is remembered by the filter only once
+        its delivery is accepted with :meth:`accept`.
     """
 
-    def __init__(self, auto_accept: bool = True, delegate: Optional[Handler] = None) -> None:
+    def __init__(
+            self,
+            auto_accept: bool = True,
+            delegate: Optional[Handler] = None,
+            zero_copy: bool = False,
+            message_pool: Optional[MessagePool] = None,
+            streaming: bool = False,
+            compression: Optional[Compression] = None,
+            batch_acks: int = 0,
+            batch_ack_delay: Optional[float] = None,
+            duplicate_filter: Optional[DuplicateFilter] = None
+    ) -> None:
         self.delegate = delegate
         self.auto_accept = auto_accept
+        self.zero_copy = zero_copy
+        self.message_pool = message_pool
+        self.streaming = streaming
+        self.compression = compression
+        self.batch_acks = batch_acks
+        self.batch_ack_delay = batch_ack_delay
+        self.duplicate_filter = duplicate_filter
+        self._unacked: List[Delivery] = []
+        self._flush_task = None
 
     def on_delivery(self, event: Event) -> None:
         dlv = event.delivery
@@ -245,27 +377,171 @@ class IncomingMessageHandler(Handler, Acking):
         if dlv.aborted:
             self.on_aborted(event)
             dlv.settle()
+        elif dlv.readable and self.streaming:
+            self._on_stream(event)
         elif dlv.readable and not dlv.partial:
-            event.message = recv_msg(dlv)
-            if event.link.state & Endpoint.LOCAL_CLOSED:
-                if self.auto_accept:
-                    dlv.update(Delivery.RELEASED)
-                    dlv.settle()
-            else:
-                try:
-                    self.on_message(event)
+            pool = self.message_pool
+            try:
+                event.message = msg = recv_msg(dlv, self.zero_copy, pool, self.compression)
+            except MessageException as e:
+                _reject_undecodable(dlv, e)
+                return
+            try:
+                if event.link.state & Endpoint.LOCAL_CLOSED:
                     if self.auto_accept:
-                        dlv.update(Delivery.ACCEPTED)
+                        dlv.update(Delivery.RELEASED)
                         dlv.settle()
-                except Reject:
-                    dlv.update(Delivery.REJECTED)
-                    dlv.settle()
-                except Release:
-                    dlv.update(Delivery.MODIFIED)
-                    dlv.settle()
+                elif self.duplicate_filter is not None:
+                    self._dispatch_filtered(event)
+                else:
+                    try:
+                        self.on_message(event)
+                        if self.auto_accept:
+                            self._accept(event)
+                    except Reject:
+                        dlv.update(Delivery.REJECTED)
+                        dlv.settle()
+                    except Release:
+                        dlv.update(Delivery.MODIFIED)
+                        dlv.settle()
+            finally:
+                if pool is not None:
+                    event.message = None
+                    pool.put(msg)
         elif dlv.updated and dlv.settled:
             self.on_settled(event)
 
+    def _on_stream(self, event: Event) -> None:
+        dlv = event.delivery
+        link = dlv.link
+        decoder = getattr(dlv, '_stream_decoder', None)
+        if decoder is None:
+            decoder = dlv._stream_decoder = _StreamDecoder()
+        buff = getattr(link, '_recv_buffer', None)
+        if buff is None or len(buff) < _STREAM_CHUNK:
+            buff = link._recv_buffer = bytearray(_STREAM_CHUNK)
+        view = memoryview(buff)
+        closed = link.state & Endpoint.LOCAL_CLOSED
+        while True:
+            if not closed and self._hold_stream(dlv):
+                # the rest is read when the delivery is resumed
+                return
+            size = link.recv_into(view)
+            if not size:
+                break
+            if closed:
+                continue
+            for chunk in decoder.feed(view[:size]):
+                if not self._dispatch_chunk(event, decoder.message, chunk):
+                    # settling has discarded the rest of the message
+                    return
+        if size == 0:
+            return
+        link.advance()
+        dlv._stream_decoder = None
+        if closed:
+            if self.auto_accept:
+                dlv.update(Delivery.RELEASED)
+                dlv.settle()
+            return
+        message = decoder.finish()
+        if decoder.streamed:
+            accepted = self._dispatch_chunk(event, message, None)
+        else:
+            if self.compression is not None:
+                try:
+                    self.compression.decompress(message)
+                except MessageException as e:
+                    _reject_undecodable(dlv, e)
+                    return
+            event.message = message
+            if self.duplicate_filter is not None:
+                self._dispatch_filtered(event)
+                return
+            accepted = self._settle_on_error(event, self.on_message)
+        if accepted and self.auto_accept:
+            self._accept(event)
+
+    def _hold_stream(self, delivery: Delivery) -> bool:
+        # whether to leave the rest of a streamed delivery in the engine
+        return False
+
+    def _dispatch_filtered(self, event: Event) -> None:
+        dedup = self.duplicate_filter
+        seen = dedup.check(event.message)
+        if seen:
+            if self._settle_on_error(event, self.on_duplicate):
+                self._accept(event)
+            return
+        event.possible_duplicate = seen is None
+        if not self.auto_accept:
+            # a message released by the application may be sent again, so
+            # is remembered only once the application accepts it
+            event.delivery._duplicate_filter = dedup
+            event.delivery._duplicate_key = dedup.key(event.message)
+            self._settle_on_error(event, self.on_message)
+        elif self._settle_on_error(event, self.on_message):
+            dedup.add(event.message)
+            self._accept(event)
+
+    def _accept(self, event: Event) -> None:
+        dlv = event.delivery
+        if not self.batch_acks:
+            dlv.update(Delivery.ACCEPTED)
+            dlv.settle()
+            return
+        self._unacked.append(dlv)
+        if len(self._unacked) >= self.batch_acks:
+            self.flush_acks()
+        elif self._flush_task is None:
+            container = getattr(event, 'container', None)
+            if container is None:
+                # not run by a container, so only the count or a call to
+                # flush_acks settles the messages
+                return
+            self._flush_task = container.schedule(self.batch_ack_delay or 0, _AckFlush(self))
+
+    def flush_acks(self) -> None:
+        """
+        Accept and settle the messages held by ``batch_acks``.
+        """
+        unacked = self._unacked
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if unacked:
+            self._unacked = []
+            for dlv in unacked:
+                dlv.update(Delivery.ACCEPTED)
+                dlv.settle()
+
+    def on_link_local_close(self, event: Event) -> None:
+        self.flush_acks()
+
+    def on_session_local_close(self, event: Event) -> None:
+        self.flush_acks()
+
+    def on_connection_local_close(self, event: Event) -> None:
+        self.flush_acks()
+
+    def _dispatch_chunk(self, event: Event, message: Message, chunk: Optional[memoryview]) -> bool:
+        event.message = message
+        event.chunk = chunk
+        return self._settle_on_error(event, self.on_message_chunk)
+
+    def _settle_on_error(self, event: Event, callback: Callable[[Event], None]) -> bool:
+        # Returns False if the callback rejected or released the message
+        dlv = event.delivery
+        try:
+            callback(event)
+            return True
+        except Reject:
+            dlv.update(Delivery.REJECTED)
+        except Release:
+            dlv.update(Delivery.MODIFIED)
+        dlv.settle()
+        return False
+
     def on_message(self, event: Event):
         """
         Called when a message is received. The message itself can be
@@ -280,6 +556,22 @@ class IncomingMessageHandler(Handler, Acking):
         if self.delegate is not None:
             _dispatch(self.delegate, 'on_message', event)
 
+    def on_message_chunk(self, event: Event):
+        """
+        Called when part of the body of a streamed message is received.
+        ``event.message`` holds the message properties and other sections
+        preceding the body, and ``event.chunk`` the next part of the body as
+        a ``memoryview`` that is only valid until this callback returns. The
+        end of the body is signalled by a final call in which ``event.chunk``
+        is ``None``. Raising :class:`Reject` or :class:`Release` settles the
+        delivery, and the rest of the message is discarded.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        if self.delegate is not None:
+            _dispatch(self.delegate, 'on_message_chunk', event)
+
     def on_settled(self, event: Event):
         """
         Callback for when a message delivery is settled by the remote peer.
@@ -300,6 +592,32 @@ class IncomingMessageHandler(Handler, Acking):
         if self.delegate is not None:
             _dispatch(self.delegate, 'on_aborted', event)
 
+    def on_duplicate(self, event: Event):
+        """
+        Called, instead of :meth:`on_message`, when a message is received
+        that the ``duplicate_filter`` has seen. The message is accepted once
+        this returns.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        if self.delegate is not None:
+            _dispatch(self.delegate, 'on_duplicate', event)
+
+
+class _AckFlush(object):
+    """
+    The timer task handler that settles the messages an
+    :class:`IncomingMessageHandler` has batched.
+    """
+
+    def __init__(self, handler: IncomingMessageHandler) -> None:
+        self.handler = handler
+
+    def on_timer_task(self, event: Event) -> None:
+        self.handler._flush_task = None
+        self.handler.flush_acks()
+
 
 class EndpointStateHandler(Handler):
     """
@@ -665,7 +983,8 @@ class MessagingHandler(Handler, Acking):
     simpler to deal with and/or avoids repetitive tasks for common use
     cases.
 
-    :param prefetch: Initial flow credit for receiving messages, defaults to 10.
+    :param prefetch: Initial flow credit for receiving messages, defaults to 10,
+        or a flow controlling handler such as :class:`AdaptiveFlowController`.
     :param auto_accept: If ``True``, accept all messages (default). Otherwise
         messages must be individually accepted or rejected.
     :param auto_settle: If ``True`` (default), automatically settle messages
@@ -674,20 +993,52 @@ class MessagingHandler(Handler, Acking):
     :param peer_close_is_error: If ``True``, a peer endpoint closing will be
         treated as an error with an error callback. Otherwise (default), the
         normal callbacks for the closing will occur.
+    :param zero_copy: If ``True``, data section message bodies are received
+        as a ``memoryview`` over the received buffer rather than copied.
+    :param message_pool: A :class:`proton.MessagePool` to take received
+        messages from. Messages are returned to the pool after
+        :meth:`on_message` returns.
+    :param streaming: If ``True``, message bodies sent as AMQP data sections
+        are passed to :meth:`on_message_chunk` as they arrive rather than
+        to :meth:`on_message` once complete.
+    :param compression: A :class:`proton.Compression` with which to
+        decompress the bodies of received messages.
+    :param batch_acks: If non-zero, messages accepted automatically are
+        settled in batches of up to this many. See
+        :class:`IncomingMessageHandler`.
+    :param batch_ack_delay: The longest time in seconds to hold accepted
+        messages for, by default until the end of the container's loop
+        iteration.
+    :param duplicate_filter: A :class:`proton.DuplicateFilter` with which to
+        recognise messages received more than once, which are accepted and
+        passed to :meth:`on_duplicate` rather than :meth:`on_message`.
+        Without ``auto_accept``, a message is remembered by the filter only
+        once its delivery is accepted with :meth:`accept`.
     """
 
     def __init__(
             self,
-            prefetch: int = 10,
+            prefetch: Union[int, Handler] = 10,
             auto_accept: bool = True,
             auto_settle: bool = True,
-            peer_close_is_error: bool = False
+            peer_close_is_error: bool = False,
+            zero_copy: bool = False,
+            message_pool: Optional[MessagePool] = None,
+            streaming: bool = False,
+            compression: Optional[Compression] = None,
+            batch_acks: int = 0,
+            batch_ack_delay: Optional[float] = None,
+            duplicate_filter: Optional[DuplicateFilter] = None
     ) -> None:
         self.handlers = []
-        if prefetch:
+        if isinstance(prefetch, Handler):
+            self.handlers.append(prefetch)
+        elif prefetch:
             self.handlers.append(FlowController(prefetch))
         self.handlers.append(EndpointStateHandler(peer_close_is_error, weakref.proxy(self)))
-        self.handlers.append(IncomingMessageHandler(auto_accept, weakref.proxy(self)))
+        self.handlers.append(IncomingMessageHandler(auto_accept, weakref.proxy(self), zero_copy, message_pool,
+                                                    streaming, compression, batch_acks, batch_ack_delay,
+                                                    duplicate_filter))
         self.handlers.append(OutgoingMessageHandler(auto_settle, weakref.proxy(self)))
         self.fatal_conditions = ["amqp:unauthorized-access"]
 
@@ -835,6 +1186,19 @@ class MessagingHandler(Handler, Acking):
         """
         pass
 
+    def on_stream_error(self, event: Event) -> None:
+        """
+        Called when the source of a message streamed by
+        :meth:`proton.Sender.send_stream` does not hold the size given, once
+        the message is being sent as the sender's buffer drains. The
+        delivery has been aborted, and ``event.stream_error`` is the
+        ``ValueError`` describing the problem. By default it is logged.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        log.error("%s: %s" % (event.sender.name, event.stream_error))
+
     def on_accepted(self, event: Event) -> None:
         """
         Called when the remote peer accepts an outgoing message.
@@ -889,6 +1253,35 @@ class MessagingHandler(Handler, Acking):
         """
         pass
 
+    def on_message_chunk(self, event: Event) -> None:
+        """
+        Called, if the handler was created with ``streaming`` set, when
+        part of the body of a message is received. ``event.message`` holds
+        the other sections of the message, and ``event.chunk`` is a
+        ``memoryview`` of the next part of the body, which is only valid
+        until this method returns. A final call with ``event.chunk`` set to
+        ``None`` marks the end of the body.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        pass
+
+    def on_duplicate(self, event: Event) -> None:
+        """
+        Called, if the handler was created with a ``duplicate_filter``,
+        instead of :meth:`on_message` when a message is received that the
+        filter has seen. The message is accepted once this returns.
+
+        Messages that the filter may have seen, as only its Bloom filter
+        has, are passed to :meth:`on_message` with
+        ``event.possible_duplicate`` set to ``True``.
+
+        :param event: The underlying event object. Use this to obtain further
+            information on the event.
+        """
+        pass
+
 
 class TransactionHandler(object):
     """
@@ -991,9 +1384,36 @@ class TransactionalClientHandler(MessagingHandler, TransactionHandler):
 
 
 class FlowController(Handler):
-    def __init__(self, window: int = 1024) -> None:
+    """
+    Keeps the credit of receiving links topped up to a fixed number of
+    messages.
+
+    Credit can also be limited by the number of bytes buffered for
+    deliveries not yet consumed, estimating the size of the messages to
+    come from those received so far, so that a change in the size of the
+    messages sent does not change how much memory the receiver uses. Credit
+    issued for smaller messages than are then received is taken back, and a
+    receiver with at most one delivery buffered is always given credit for
+    one more, however large.
+
+    :param window: The credit of each link, in messages.
+    :param max_bytes: The most bytes to buffer for each link.
+    :param connection_bytes: The most bytes to buffer for all the receiving
+        links of a connection. This is also set as the
+        :attr:`proton.Session.incoming_capacity` of their sessions, which
+        limits the bytes the sender may transfer however large its messages.
+    """
+
+    def __init__(
+            self,
+            window: int = 1024,
+            max_bytes: Optional[int] = None,
+            connection_bytes: Optional[int] = None
+    ) -> None:
         self._window = window
         self._drained = 0
+        self.max_bytes = max_bytes
+        self.connection_bytes = connection_bytes
 
     def on_link_local_open(self, event: Event) -> None:
         self._flow(event.link)
@@ -1005,14 +1425,186 @@ class FlowController(Handler):
         self._flow(event.link)
 
     def on_delivery(self, event: Event) -> None:
+        if self.max_bytes is not None or self.connection_bytes is not None:
+            delivery = event.delivery
+            link = delivery.link
+            if link.is_receiver:
+                # only the deliveries that bytes have arrived for are summed,
+                # rather than all the unsettled deliveries of the link
+                buffering = getattr(link, '_buffering', None)
+                if buffering is None:
+                    buffering = link._buffering = set()
+                buffering.add(delivery)
+                if delivery.readable and not delivery.partial:
+                    pending = delivery.pending
+                    average = getattr(link, '_delivery_size', 0)
+                    link._delivery_size = pending if pending > average else (pending + average) // 2
         self._flow(event.link)
 
     def _flow(self, link: Union['Sender', 'Receiver']) -> None:
         if link.is_receiver:
             self._drained += link.drained()
             if self._drained == 0:
-                delta = self._window - link.credit
-                link.flow(delta)
+                if self.max_bytes is None and self.connection_bytes is None:
+                    delta = self._window - link.credit
+                    link.flow(delta)
+                else:
+                    credit = min(self._window, self._byte_credit(link))
+                    # take back credit issued for smaller messages than
+                    # are now being received
+                    if credit > link.credit or link.credit - link.queued > 2 * (credit - link.queued):
+                        link.flow(credit - link.credit)
+
+    @staticmethod
+    def _buffered(link: 'Receiver') -> int:
+        # bytes held by the engine, and by a handler that has received
+        # messages the application is yet to take
+        buffered = getattr(link, '_held_bytes', 0)
+        buffering = getattr(link, '_buffering', None)
+        if buffering:
+            for delivery in list(buffering):
+                pending = delivery.pending
+                if pending:
+                    buffered += pending
+                else:
+                    # read, discarded or settled, until more bytes arrive
+                    buffering.discard(delivery)
+        return buffered
+
+    def _byte_credit(self, link: 'Receiver') -> int:
+        size = getattr(link, '_delivery_size', 0)
+        buffered = self._buffered(link)
+        available = self._window * size if self.max_bytes is None else self.max_bytes - buffered
+        if self.connection_bytes is not None:
+            session = link.session
+            transport = link.connection.transport
+            if transport is not None and not session.incoming_capacity:
+                session.incoming_capacity = max(self.connection_bytes, transport.max_frame_size)
+            used = buffered
+            other = link.connection.link_head(Endpoint.LOCAL_ACTIVE)
+            while other:
+                if other.is_receiver and other != link:
+                    outstanding = max(other.credit - other.queued, 0)
+                    used += self._buffered(other) + outstanding * getattr(other, '_delivery_size', 0)
+                other = other.next(Endpoint.LOCAL_ACTIVE)
+            available = min(available, self.connection_bytes - used)
+        if size and available >= size:
+            return link.queued + available // size
+        # the delivery being handled may be about to be consumed, after
+        # which there would be no event to issue more credit on
+        return link.queued + (1 if link.queued <= 1 else 0)
+
+
+class _CreditState(object):
+    """
+    The measurements an :class:`AdaptiveFlowController` keeps for a link.
+    """
+
+    def __init__(self, window: int, now: float) -> None:
+        self.window = window
+        self.issued = 0
+        self.consumed = 0
+        self.since = now
+        self.rate: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.granted: Optional[float] = None
+        self.arrived = 0
+
+
+class AdaptiveFlowController(Handler):
+    """
+    A flow controller that sizes the credit window of each receiving link
+    from the rate at which its deliveries are consumed and the round trip
+    time to the sender, rather than from a fixed number.
+
+    The window is the number of deliveries that can be consumed in
+    ``headroom`` round trips, kept between ``min_window`` and ``max_window``.
+    A consumer that keeps up with a distant sender is thus given enough
+    credit to keep the link busy, while a slow consumer holds few unconsumed
+    deliveries in memory. Credit is issued in batches of a quarter of the
+    window rather than after every delivery.
+
+    The round trip time is measured from issuing credit to a sender that had
+    none to the arrival of the next delivery, and the consumption rate from
+    the credit used by deliveries that have been advanced past (which
+    :class:`IncomingMessageHandler` does once :meth:`MessagingHandler.on_message`
+    returns). Both are smoothed moving averages, and the rate is sampled at
+    most every ``interval`` seconds.
+
+    An :class:`AdaptiveFlowController` can be passed as the ``prefetch`` of
+    a :class:`MessagingHandler`.
+
+    :param min_window: The smallest window, and the initial one.
+    :param max_window: The largest window.
+    :param headroom: The number of round trips worth of deliveries to allow.
+    :param interval: The minimum time in seconds between rate samples.
+    """
+
+    def __init__(
+            self,
+            min_window: int = 16,
+            max_window: int = 4096,
+            headroom: float = 2.0,
+            interval: float = 0.1
+    ) -> None:
+        if not 0 < min_window <= max_window:
+            raise ValueError("invalid window bounds: %s, %s" % (min_window, max_window))
+        self.min_window = min_window
+        self.max_window = max_window
+        self.headroom = headroom
+        self.interval = interval
+        self._clock = time.monotonic
+
+    def window(self, link: 'Receiver') -> int:
+        """
+        The current credit window of a link, or ``min_window`` for a link the
+        controller has not yet seen.
+        """
+        state = getattr(link, '_credit_state', None)
+        return self.min_window if state is None else state.window
+
+    def on_link_local_open(self, event: Event) -> None:
+        self._flow(event.link, False)
+
+    def on_link_remote_open(self, event: Event) -> None:
+        self._flow(event.link, False)
+
+    def on_link_flow(self, event: Event) -> None:
+        self._flow(event.link, False)
+
+    def on_delivery(self, event: Event) -> None:
+        self._flow(event.link, True)
+
+    def _flow(self, link: Union['Sender', 'Receiver'], arrived: bool) -> None:
+        if not link.is_receiver:
+            return
+        now = self._clock()
+        state = getattr(link, '_credit_state', None)
+        if state is None:
+            state = link._credit_state = _CreditState(self.min_window, now)
+        state.issued -= link.drained()
+        consumed = state.issued - link.credit
+        if arrived and state.granted is not None and consumed + link.queued > state.arrived:
+            sample = now - state.granted
+            state.rtt = sample if state.rtt is None else (state.rtt + sample) / 2
+            state.granted = None
+        elapsed = now - state.since
+        if consumed > state.consumed and elapsed >= self.interval:
+            sample = (consumed - state.consumed) / elapsed
+            state.rate = sample if state.rate is None or sample > state.rate else (state.rate + sample) / 2
+            state.consumed = consumed
+            state.since = now
+            if state.rtt is not None:
+                window = int(state.rate * state.rtt * self.headroom + 0.5)
+                state.window = max(self.min_window, min(self.max_window, window))
+        deficit = state.window - link.credit
+        starved = link.credit == link.queued <= 1
+        if deficit > 0 and (deficit >= state.window // 4 or starved):
+            if starved and state.granted is None:
+                state.granted = now
+                state.arrived = consumed + link.queued
+            link.flow(deficit)
+            state.issued += deficit
 
 
 class Handshaker(Handler):
@@ -19,7 +19,7 @@
 
 from cproton import PN_DEFAULT_PRIORITY, PN_STRING, PN_UUID, PN_OVERFLOW, pn_error_text, pn_message, \
     pn_message_annotations, pn_message_body, pn_message_clear, pn_message_decode, \
-    pn_message_encode, pn_message_error, pn_message_free, pn_message_get_address, pn_message_get_content_encoding, \
+    pn_message_encode, pn_message_encode_into, pn_message_error, pn_message_free, pn_message_get_address, pn_message_get_content_encoding, \
     pn_message_get_content_type, pn_message_get_correlation_id, pn_message_get_creation_time, pn_message_get_delivery_count, \
     pn_message_get_expiry_time, pn_message_get_group_id, pn_message_get_group_sequence, pn_message_get_id, pn_message_get_priority, \
     pn_message_get_reply_to, pn_message_get_reply_to_group_id, pn_message_get_subject, pn_message_get_ttl, \
@@ -35,15 +35,132 @@ from ._common import millis2secs, secs2millis
 from ._data import char, Data, symbol, ulong, AnnotationDict
 from ._endpoints import Link
 from ._exceptions import EXCEPTIONS, MessageException
+import mmap
+import os
 from uuid import UUID
-from typing import Dict, Optional, Union, TYPE_CHECKING, overload
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING, overload
 
 if TYPE_CHECKING:
+    from proton._compression import Compression
     from proton._delivery import Delivery
     from proton._endpoints import Sender, Receiver
     from proton._data import Described, PythonAMQPData
 
 
+# Descriptor codes of the AMQP message sections we need to recognise
+# when scanning an encoded message.
+_DATA_SECTION = 0x75
+_SEQUENCE_SECTION = 0x76
+_VALUE_SECTION = 0x77
+
+# Largest body a single (vbin32) data section can carry
+_MAX_DATA_SECTION = 0xffffffff
+
+# Largest amount of a streamed body sent over a link at once
+_STREAM_CHUNK = 65536
+
+# Largest encode or receive buffer kept for reuse by a link, so that one
+# large message does not hold its size in memory for the life of the link
+_MAX_KEPT_BUFFER = 1 << 20
+
+# Memory mapped bodies are released from memory in steps of this size,
+# where the platform allows it
+_RELEASE_SIZE = 16 << 20
+_MADV_DONTNEED = getattr(mmap, 'MADV_DONTNEED', None)
+
+# Number of bytes used by the size prefix (variable width types) or by
+# the value itself (fixed width types), indexed by constructor subcategory.
+_FIXED_WIDTHS = {0x4: 0, 0x5: 1, 0x6: 2, 0x7: 4, 0x8: 8, 0x9: 16}
+_SIZE_WIDTHS = {0xa: 1, 0xb: 4, 0xc: 1, 0xd: 4, 0xe: 1, 0xf: 4}
+
+
+def _skip_value(data: memoryview, pos: int) -> int:
+    """Return the offset just past the AMQP encoded value starting at ``pos``."""
+    code = data[pos]
+    pos += 1
+    if code == 0x00:
+        # described value: skip descriptor then the value itself
+        return _skip_value(data, _skip_value(data, pos))
+    subcategory = code >> 4
+    if subcategory in _FIXED_WIDTHS:
+        return pos + _FIXED_WIDTHS[subcategory]
+    width = _SIZE_WIDTHS[subcategory]
+    return pos + width + int.from_bytes(data[pos:pos + width], 'big')
+
+
+def _data_section(data: memoryview) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Locate the single AMQP data section of an encoded message.
+
+    :return: ``(section_start, section_end, body_start, body_end)`` offsets
+        into ``data``, or ``None`` if the message does not carry exactly one
+        data section with a numeric descriptor.
+    """
+    span = None
+    pos = 0
+    end = len(data)
+    try:
+        while pos < end:
+            start = pos
+            if data[pos] != 0x00:
+                return None
+            pos += 1
+            code = data[pos]
+            if code == 0x53:
+                descriptor = data[pos + 1]
+                pos += 2
+            elif code == 0x80:
+                descriptor = int.from_bytes(data[pos + 1:pos + 9], 'big')
+                pos += 9
+            else:
+                return None
+            if descriptor == _DATA_SECTION:
+                if span is not None:
+                    return None
+                code = data[pos]
+                if code == 0xa0:
+                    width = 1
+                elif code == 0xb0:
+                    width = 4
+                else:
+                    return None
+                body = pos + 1 + width
+                pos = body + int.from_bytes(data[pos + 1:body], 'big')
+                span = (start, pos, body, pos)
+            else:
+                pos = _skip_value(data, pos)
+    except (IndexError, KeyError):
+        return None
+    if pos != end:
+        return None
+    return span
+
+
+def _data_section_header(size: int) -> bytes:
+    """Encode the descriptor and vbin32 constructor of a data section."""
+    return b"\x00\x53\x75\xb0" + size.to_bytes(4, 'big')
+
+
+def _section_header(data: bytearray, pos: int) -> Tuple[int, int]:
+    """
+    Decode the descriptor of the message section starting at ``pos``.
+
+    :return: The descriptor code and the offset of the section value
+    :raise: :exc:`IndexError` if ``data`` ends before the descriptor does,
+        or :exc:`KeyError` if ``data`` does not hold a message section
+    """
+    if data[pos] != 0x00:
+        raise KeyError(data[pos])
+    code = data[pos + 1]
+    if code == 0x53:
+        return data[pos + 2], pos + 3
+    elif code == 0x80:
+        if pos + 10 > len(data):
+            raise IndexError(pos)
+        return int.from_bytes(data[pos + 2:pos + 10], 'big'), pos + 10
+    raise KeyError(code)
+
+
 class Message(object):
     """The :py:class:`Message` class is a mutable holder of message content.
 
@@ -54,6 +171,12 @@ class Message(object):
     :ivar ~.properties: application defined message properties
     :vartype ~.properties: ``dict``
     :ivar body: message body
+    :ivar compact_lists: encode suitable lists of ``int`` or ``float`` values
+        as AMQP arrays (see :attr:`Data.compact_lists`)
+    :vartype compact_lists: ``bool``
+    :ivar arrays_as_lists: decode undescribed AMQP arrays as ``list`` objects
+        (see :attr:`Data.arrays_as_lists`)
+    :vartype arrays_as_lists: ``bool``
 
     :param kwargs: Message property name/value pairs to initialize the Message
     """
@@ -61,6 +184,9 @@ class Message(object):
     DEFAULT_PRIORITY = PN_DEFAULT_PRIORITY
     """ Default AMQP message priority"""
 
+    compact_lists = False
+    arrays_as_lists = False
+
     def __init__(
             self,
             body: Union[bytes, str, dict, list, int, float, 'UUID', 'Described', None] = None,
@@ -116,48 +242,54 @@ class Message(object):
         for old_key, new_key in changed_keys:
             self.properties[new_key] = self.properties.pop(old_key)
 
-    def _pre_encode(self) -> None:
-        inst = Data(pn_message_instructions(self._msg))
-        ann = Data(pn_message_annotations(self._msg))
-        props = Data(pn_message_properties(self._msg))
-        body = Data(pn_message_body(self._msg))
-
-        inst.clear()
-        if self.instructions is not None:
-            inst.put_object(self.instructions)
-        ann.clear()
-        if self.annotations is not None:
-            ann.put_object(self.annotations)
-        props.clear()
+    # The message sections in the order they are held by the pn_message
+    _SECTIONS = (pn_message_instructions, pn_message_annotations, pn_message_properties, pn_message_body)
+
+    def _pre_encode(self, scratch: Optional[Data] = None, compression: Optional['Compression'] = None) -> \
+            Optional[Tuple[Optional[str], bool]]:
+        """Put the message sections into the pn_message.
+
+        :return: The content encoding and inferred flag to restore once
+            the message is encoded if the body was compressed, else ``None``
+        """
         if self.properties is not None:
             self._check_property_keys()
-            props.put_object(self.properties)
-        body.clear()
-        if self.body is not None:
-            body.put_object(self.body)
-
-    def _post_decode(self) -> None:
-        inst = Data(pn_message_instructions(self._msg))
-        ann = Data(pn_message_annotations(self._msg))
-        props = Data(pn_message_properties(self._msg))
-        body = Data(pn_message_body(self._msg))
-
-        if inst.next():
-            self.instructions = inst.get_object()
-        else:
-            self.instructions = None
-        if ann.next():
-            self.annotations = ann.get_object()
-        else:
-            self.annotations = None
-        if props.next():
-            self.properties = props.get_object()
-        else:
-            self.properties = None
-        if body.next():
-            self.body = body.get_object()
-        else:
-            self.body = None
+        body = self.body
+        restore = None
+        if compression is not None:
+            compressed = compression.compress(self)
+            if compressed is not None:
+                restore = (self._get_encoding(), self.inferred)
+                body = compressed
+                self.inferred = True
+                self._set_encoding(compression.encoding)
+        # A single non-owning Data wrapper is pointed at each section in turn
+        section = scratch if scratch is not None else Data(None)
+        section.compact_lists = self.compact_lists
+        values = (self.instructions, self.annotations, self.properties, body)
+        for get_section, value in zip(self._SECTIONS, values):
+            section._data = get_section(self._msg)
+            section.clear()
+            if value is not None:
+                section.put_object(value)
+        return restore
+
+    def _restore(self, restore: Optional[Tuple[Optional[str], bool]]) -> None:
+        if restore is not None:
+            self._set_encoding(restore[0])
+            self.inferred = restore[1]
+
+    def _post_decode(self, scratch: Optional[Data] = None) -> None:
+        section = scratch if scratch is not None else Data(None)
+        section.arrays_as_lists = self.arrays_as_lists
+        values = []
+        for get_section in self._SECTIONS:
+            section._data = get_section(self._msg)
+            if section.next():
+                values.append(section.get_object())
+            else:
+                values.append(None)
+        self.instructions, self.annotations, self.properties, self.body = values
 
     def clear(self) -> None:
         """
@@ -170,6 +302,24 @@ class Message(object):
         self.properties = None
         self.body = None
 
+    def reset(self) -> None:
+        """
+        Return the :class:`Message` to the state of a newly created message,
+        so that it can be reused rather than reallocated. As well as
+        clearing the message contents (see :meth:`clear`), this discards any
+        per message overrides such as :attr:`compact_lists` and any other
+        attributes set on the Python object.
+        """
+        msg = self._msg
+        pn_message_clear(msg)
+        d = self.__dict__
+        d.clear()
+        d['_msg'] = msg
+        d['instruction_dict'] = None
+        d['annotation_dict'] = None
+        d['properties'] = None
+        d['body'] = None
+
     @property
     def inferred(self) -> bool:
         """The inferred flag for a message indicates how the message content
@@ -372,6 +522,13 @@ class Message(object):
     def content_encoding(self, value: str) -> None:
         self._check(pn_message_set_content_encoding(self._msg, value))
 
+    # Unlike content_encoding these use None when there is no encoding
+    def _get_encoding(self) -> Optional[str]:
+        return pn_message_get_content_encoding(self._msg)
+
+    def _set_encoding(self, value: Optional[str]) -> None:
+        self._check(pn_message_set_content_encoding(self._msg, value))
+
     @property
     def expiry_time(self) -> float:  # TODO doc said int
         """The absolute expiry time of the message in seconds using the Unix time_t [IEEE1003] encoding.
@@ -474,9 +631,25 @@ class Message(object):
         else:
             self.annotation_dict = annotations
 
-    def encode(self) -> bytes:
-        self._pre_encode()
-        sz = 16
+    def encode(self, compression: Optional['Compression'] = None) -> bytes:
+        """
+        Encodes the message.
+
+        :param compression: If set, the body is compressed as described by
+            :class:`proton.Compression`.
+        :return: The encoded message
+        """
+        restore = self._pre_encode(None, compression)
+        try:
+            return self._encode(16)[1]
+        finally:
+            self._restore(restore)
+
+    def _encode(self, sz: int) -> Tuple[int, bytes]:
+        """Encode the pn_message, starting from a buffer of ``sz`` bytes.
+
+        :return: The buffer size that was large enough and the encoded data
+        """
         while True:
             err, data = pn_message_encode(self._msg, sz)
             if err == PN_OVERFLOW:
@@ -484,35 +657,121 @@ class Message(object):
                 continue
             else:
                 self._check(err)
-                return data
+                return sz, data
+
+    def encode_into(self, buffer: Union[bytearray, memoryview]) -> int:
+        """
+        Encodes the message into a caller supplied writable buffer, as
+        :meth:`encode` does but without allocating a new buffer.
+
+        :param buffer: A writable buffer, such as a ``bytearray`` or a
+            ``memoryview`` over one.
+        :return: The number of bytes written to ``buffer``
+        :raise: :exc:`MessageException` if ``buffer`` is too small or there
+            is a Proton error.
+        """
+        self._pre_encode()
+        return self._check(pn_message_encode_into(self._msg, buffer))
+
+    def _encode_scratch(self, buff: bytearray) -> Tuple[bytearray, int]:
+        """Encode the pn_message into ``buff``, replacing it with a larger
+        buffer if it is too small.
+
+        :return: The buffer holding the encoded message and its size
+        """
+        while True:
+            err = pn_message_encode_into(self._msg, buff)
+            if err == PN_OVERFLOW:
+                buff = bytearray(2 * len(buff))
+                continue
+            else:
+                self._check(err)
+                return buff, err
 
-    def decode(self, data: bytes) -> None:
-        self._check(pn_message_decode(self._msg, data))
-        self._post_decode()
+    def decode(self, data: bytes, zero_copy: bool = False) -> None:
+        """
+        Decodes an AMQP encoded message into this :class:`Message`.
+
+        :param data: The encoded message
+        :param zero_copy: If ``True`` and the message body is a single AMQP
+            data section, :attr:`body` is set to a ``memoryview`` over
+            ``data`` rather than to a copy of the body bytes. The view keeps
+            ``data`` alive for as long as the body is referenced, so ``data``
+            must not be modified afterwards.
+        """
+        self._decode(data, zero_copy)
+
+    def _decode(self, data: bytes, zero_copy: bool, scratch: Optional[Data] = None) -> None:
+        span = _data_section(memoryview(data)) if zero_copy else None
+        if span is None:
+            self._check(pn_message_decode(self._msg, data))
+            self._post_decode(scratch)
+            return
+        section_start, section_end, body_start, body_end = span
+        view = memoryview(data)
+        if section_end == len(view):
+            rest = view[:section_start]
+        else:
+            rest = b"".join((view[:section_start], view[section_end:]))
+        self._check(pn_message_decode(self._msg, rest))
+        self._post_decode(scratch)
+        self.body = view[body_start:body_end]
+        self.inferred = True
 
     def send(self, sender: 'Sender', tag: Optional[str] = None) -> 'Delivery':
         """
         Encodes and sends the message content using the specified sender,
         and, if present, using the specified tag. Upon success, will
-        return the :class:`Delivery` object for the sent message.
+        return the :class:`Delivery` object for the sent message. The body
+        is compressed if the sender has a :attr:`~proton.Sender.compression`.
 
         :param sender: The sender to send the message
         :param tag: The delivery tag for the sent message
         :return: The delivery associated with the sent message
         """
         dlv = sender.delivery(tag or sender.delivery_tag())
-        encoded = self.encode()
-        sender.stream(encoded)
+        restore = self._pre_encode(None, sender.compression)
+        # The link copies what is sent, so each sender keeps one buffer to
+        # encode into rather than allocating one per message
+        buff = getattr(sender, '_encode_buffer', None) or bytearray(1024)
+        try:
+            buff, size = self._encode_scratch(buff)
+        finally:
+            self._restore(restore)
+        sender._encode_buffer = buff if len(buff) <= _MAX_KEPT_BUFFER else None
+        sender.stream(memoryview(buff)[:size])
         sender.advance()
         if sender.snd_settle_mode == Link.SND_SETTLED:
             dlv.settle()
         return dlv
 
+    def _stream_framing(self, size: int) -> Tuple[bytes, bytes]:
+        """
+        Encode the sections surrounding a body of ``size`` bytes streamed
+        as AMQP data sections, ignoring :attr:`body`.
+
+        :return: The encoded sections preceding the body, including the
+            header of its first data section, and those following it
+        """
+        body = self.body
+        inferred = self.inferred
+        try:
+            self.body = b""
+            self.inferred = True
+            self._pre_encode()
+            encoded = self._encode(256)[1]
+        finally:
+            self.body = body
+            self.inferred = inferred
+        section_start, section_end = _data_section(memoryview(encoded))[:2]
+        prefix = encoded[:section_start] + _data_section_header(min(size, _MAX_DATA_SECTION))
+        return prefix, encoded[section_end:]
+
     @overload
-    def recv(self, link: 'Sender') -> None:
+    def recv(self, link: 'Sender', zero_copy: bool = False) -> None:
         ...
 
-    def recv(self, link: 'Receiver') -> Optional['Delivery']:
+    def recv(self, link: 'Receiver', zero_copy: bool = False) -> Optional['Delivery']:
         """
         Receives and decodes the message content for the current :class:`Delivery`
         from the link. Upon success it will return the current delivery
@@ -521,6 +780,8 @@ class Message(object):
         return ``None``.
 
         :param link: The link to receive a message from
+        :param zero_copy: If ``True``, a data section body is returned as a
+            ``memoryview`` over the received buffer (see :meth:`decode`).
         :return: the delivery associated with the decoded message (or None)
 
         """
@@ -535,7 +796,7 @@ class Message(object):
         # as well too
         if link.remote_snd_settle_mode == Link.SND_SETTLED:
             dlv.settle()
-        self.decode(dlv.encoded)
+        self.decode(dlv.encoded, zero_copy)
         return dlv
 
     def __repr__(self) -> str:
@@ -549,3 +810,422 @@ class Message(object):
             if value:
                 props.append("%s=%r" % (attr, value))
         return "Message(%s)" % ", ".join(props)
+
+
+class _OutgoingStream(object):
+    """
+    A message body being sent in chunks by :meth:`proton.Sender.send_stream`.
+
+    The body is sent as one data section per 4 GiB. At most ``window``
+    frames of it are buffered by the session at any time, so memory use
+    does not depend on the size of the body.
+    """
+
+    def __init__(
+            self,
+            sender: 'Sender',
+            source: Any,
+            size: Optional[int],
+            message: Optional[Message],
+            window: int
+    ) -> None:
+        transport = sender.connection.transport
+        frame = transport.remote_max_frame_size if transport else 0
+        self.chunk_size = min(frame or _STREAM_CHUNK, _STREAM_CHUNK)
+        self.limit = self.chunk_size * max(1, min(window, sender.session.outgoing_window))
+        self.delivery: Optional['Delivery'] = None
+        self.done = False
+        # a file mapping to close once the body has been sent
+        self.mapping: Optional[mmap.mmap] = None
+        try:
+            view = memoryview(source)
+        except TypeError:
+            view = None
+        if view is not None:
+            view = view.cast('B')
+            if size is not None and size != len(view):
+                raise ValueError("size %d does not match the %d byte buffer" % (size, len(view)))
+            size = len(view)
+            self._chunks = iter([view])
+        elif hasattr(source, 'readinto'):
+            if size is None:
+                size = os.fstat(source.fileno()).st_size - source.tell()
+            self._chunks = self._read(source, size)
+        elif size is None:
+            raise ValueError("size must be given to stream from an iterable")
+        else:
+            self._chunks = iter(source)
+        self.size = self.remaining = size
+        self._section = min(size, _MAX_DATA_SECTION)
+        self._pending = memoryview(b"")
+        self._prefix, self._suffix = (message or Message())._stream_framing(size)
+
+    def _read(self, source: Any, size: int) -> Iterator[memoryview]:
+        # The link copies what is sent, so one buffer is reused for the file
+        buff = memoryview(bytearray(min(size, self.chunk_size) or 1))
+        while size:
+            n = source.readinto(buff[:min(size, len(buff))])
+            if not n:
+                return
+            size -= n
+            yield buff[:n]
+
+    def ready(self, sender: 'Sender') -> bool:
+        """``True`` if :meth:`pump` can make progress."""
+        return self.done or sender.session.outgoing_bytes < self.limit
+
+    def pump(self, sender: 'Sender') -> bool:
+        """
+        Send as much of the body as the session buffer limit allows.
+
+        :return: ``True`` once the body has been sent and the delivery
+            advanced
+        :raise: :exc:`ValueError` if the source does not hold ``size``
+            bytes, in which case the delivery is aborted
+        """
+        if self.delivery.settled or sender.current != self.delivery:
+            # settled by the peer (or by the application) part way through
+            self.delivery.abort()
+            self._finish()
+            return True
+        if self._prefix:
+            sender.stream(self._prefix)
+            self._prefix = None
+        session = sender.session
+        while self.remaining and session.outgoing_bytes < self.limit:
+            if not self._pending:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    self._abort("source ended %d bytes short of the message size" % self.remaining)
+                self._pending = memoryview(chunk).cast('B')
+                continue
+            if not self._section:
+                self._section = min(self.remaining, _MAX_DATA_SECTION)
+                sender.stream(_data_section_header(self._section))
+            n = min(len(self._pending), self.chunk_size, self._section, self.limit - session.outgoing_bytes)
+            sender.stream(self._pending[:n])
+            self._pending = self._pending[n:]
+            self._section -= n
+            self.remaining -= n
+        if self.mapping is not None:
+            self._release_mapped(self._mapped_end - self.remaining)
+        if self.remaining:
+            return False
+        if self._pending:
+            self._abort("source holds more than the message size")
+        # at most one more chunk is read, as the source may not end
+        chunk = next(self._chunks, None)
+        if chunk is not None and len(chunk):
+            self._abort("source holds more than the message size")
+        if self._suffix:
+            sender.stream(self._suffix)
+        sender.advance()
+        if sender.snd_settle_mode == Link.SND_SETTLED:
+            self.delivery.settle()
+        self._finish()
+        return True
+
+    def _abort(self, reason: str) -> None:
+        self.delivery.abort()
+        self._finish()
+        raise ValueError(reason)
+
+    def map(self, mapping: mmap.mmap, offset: int) -> None:
+        """
+        Close ``mapping`` once the body, which is the content of
+        ``mapping`` from ``offset``, has been sent, and release the pages
+        of the mapping from memory as they are sent.
+        """
+        self.mapping = mapping
+        self._mapped_end = offset + self.size
+        self._released = offset - offset % mmap.PAGESIZE
+
+    def _release_mapped(self, sent: int) -> None:
+        end = sent - sent % mmap.PAGESIZE
+        if end - self._released >= _RELEASE_SIZE and _MADV_DONTNEED is not None:
+            # the link has copied these pages, so they need not stay resident
+            self.mapping.madvise(_MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    def _finish(self) -> None:
+        self.done = True
+        # drop any views over the source before closing a mapping of it
+        self._pending = self._chunks = None
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+class _StreamDecoder(object):
+    """
+    Incrementally decode a message received in several parts, returning
+    its data section bodies as they arrive rather than buffering them.
+
+    Sections preceding the first data section are buffered and decoded
+    into :attr:`message` once complete. If the message body is not made of
+    data sections the whole message is buffered, and decoded by
+    :meth:`finish`.
+    """
+
+    def __init__(self) -> None:
+        self.message = None
+        self.streamed = False
+        self._buffer = bytearray()
+        self._buffer_all = False
+        self._scanned = 0
+        self._section = 0
+
+    def feed(self, data: Union[bytes, memoryview]) -> List[memoryview]:
+        """
+        Decode the next part of the encoded message.
+
+        :return: The parts of the body contained in ``data``. These may be
+            views over ``data``.
+        """
+        chunks = []
+        view = memoryview(data)
+        while view:
+            if self._section:
+                n = min(self._section, len(view))
+                chunks.append(view[:n])
+                view = view[n:]
+                self._section -= n
+                continue
+            self._buffer += view
+            view = self._scan() if not self._buffer_all else view[:0]
+        return chunks
+
+    def _scan(self) -> memoryview:
+        # Returns any body bytes found after a data section header
+        buff = self._buffer
+        pos = self._scanned
+        try:
+            while pos < len(buff):
+                descriptor, start = _section_header(buff, pos)
+                if descriptor == _DATA_SECTION:
+                    code = buff[start]
+                    width = 1 if code == 0xa0 else 4 if code == 0xb0 else 0
+                    body = start + 1 + width
+                    if not width or body > len(buff):
+                        break
+                    if not self.streamed:
+                        self._start(bytes(buff[:pos]))
+                    self._section = int.from_bytes(buff[start + 1:body], 'big')
+                    rest = memoryview(bytes(buff[body:]))
+                    del buff[:]
+                    self._scanned = 0
+                    return rest
+                elif descriptor in (_VALUE_SECTION, _SEQUENCE_SECTION) and not self.streamed:
+                    # not streamable, so decode the whole message at the end
+                    self._buffer_all = True
+                    break
+                end = _skip_value(buff, start)
+                if end > len(buff):
+                    break
+                pos = end
+                if self.streamed:
+                    # sections following the body are not kept
+                    del buff[:pos]
+                    pos = 0
+        except (IndexError, KeyError):
+            pass
+        self._scanned = pos
+        return memoryview(b"")
+
+    def _start(self, header: bytes) -> None:
+        self.message = Message()
+        if header:
+            self.message._decode(header, False)
+        self.message.inferred = True
+        self.streamed = True
+
+    def finish(self) -> Message:
+        """
+        Complete decoding once the whole message has been received.
+
+        :return: :attr:`message`, with the full body when it was not streamed
+        :raise: :exc:`MessageException` if the message is malformed or
+            truncated
+        """
+        if not self.streamed:
+            self.message = Message()
+            self.message._decode(self._buffer, False)
+        elif self._section:
+            raise MessageException("message ends %d bytes into its data section" % self._section)
+        return self.message
+
+
+class MmapWriter(object):
+    """
+    Writes the parts of a streamed message body into a memory mapped file,
+    for example from :meth:`proton.handlers.MessagingHandler.on_message_chunk`
+    or from the iterator returned by
+    :meth:`proton.utils.BlockingReceiver.receive_stream`.
+
+    The file is extended to ``size`` bytes up front and mapped, so each part
+    is copied once, straight into the page cache. If more than ``size``
+    bytes are written the file is extended by doubling its size. On
+    :meth:`close` the file is truncated to the number of bytes written.
+
+    :param file: The path of the file to create or overwrite, or a binary
+        file object opened for update, which is written from its start.
+    :param size: The expected body size in bytes.
+    """
+
+    def __init__(self, file: Union[str, BinaryIO], size: int = 0) -> None:
+        if isinstance(file, str):
+            self._file = open(file, 'w+b')
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+        self.written = 0
+        self._released = 0
+        self._map = None
+        self._view = None
+        self._resize(size)
+
+    def _resize(self, size: int) -> None:
+        self._unmap()
+        self._file.truncate(size)
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), size)
+            self._view = memoryview(self._map)
+
+    def _unmap(self) -> None:
+        if self._map is not None:
+            self._view.release()
+            self._map.close()
+            self._map = self._view = None
+        self._released = 0
+
+    def write(self, chunk: Union[bytes, memoryview]) -> int:
+        """
+        Append part of the body to the file.
+
+        :param chunk: The next part of the body.
+        :return: The number of bytes written
+        """
+        data = memoryview(chunk).cast('B')
+        if not data:
+            return 0
+        end = self.written + len(data)
+        if end > (len(self._map) if self._map is not None else 0):
+            self._resize(max(end, 2 * self.written, 1 << 20))
+        self._view[self.written:end] = data
+        self.written = end
+        written = end - end % mmap.PAGESIZE
+        if written - self._released >= _RELEASE_SIZE and _MADV_DONTNEED is not None:
+            # the written pages are kept by the page cache of the shared
+            # mapping, so need not stay resident in this process
+            self._map.madvise(_MADV_DONTNEED, self._released, written - self._released)
+            self._released = written
+        return len(data)
+
+    def close(self) -> None:
+        """Unmap the file and truncate it to the number of bytes written."""
+        if self._file is None:
+            return
+        self._unmap()
+        self._file.truncate(self.written)
+        if self._owned:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self) -> 'MmapWriter':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class MessagePool(object):
+    """
+    A bounded free list of :class:`Message` objects.
+
+    Messages are taken from the pool with :meth:`get` and handed back with
+    :meth:`put` once they are no longer referenced, which avoids allocating
+    and freeing a native message for every message sent or received.
+
+    :param size: The maximum number of free messages held by the pool.
+    """
+
+    def __init__(self, size: int = 64) -> None:
+        self.size = size
+        self.created = 0
+        self._free = []
+
+    def __len__(self) -> int:
+        return len(self._free)
+
+    def get(self) -> Message:
+        """
+        Take a message from the pool, creating a new one if the pool is
+        empty.
+
+        :return: An empty message.
+        """
+        if self._free:
+            return self._free.pop()
+        self.created += 1
+        return Message()
+
+    def put(self, message: Message) -> None:
+        """
+        Reset a message and return it to the pool. If the pool is full the
+        message is discarded. The message must not be used by the caller
+        afterwards.
+
+        :param message: The message to return.
+        """
+        if len(self._free) < self.size:
+            message.reset()
+            self._free.append(message)
+
+
+def encode_messages(messages: Iterable[Union[Message, 'PythonAMQPData']]) -> List[bytes]:
+    """
+    Encode a batch of messages.
+
+    Each item is either a :class:`Message` or a message body, which is
+    encoded as a message with default properties. Bodies are encoded using
+    a single scratch :class:`Message` (and so a single native message) for
+    the whole batch, and the encode buffer is sized from the previous
+    message, up to 1 MiB, so large batches avoid most per message
+    allocation.
+
+    :param messages: The messages or bodies to encode
+    :return: The encoded messages, in order
+    """
+    scratch = Data(None)
+    message = None
+    size = 16
+    result = []
+    for item in messages:
+        if not isinstance(item, Message):
+            if message is None:
+                message = Message()
+            message.body = item
+            item = message
+        item._pre_encode(scratch)
+        size, data = item._encode(size)
+        size = min(size, _MAX_KEPT_BUFFER)
+        result.append(data)
+    return result
+
+
+def decode_messages(encoded: Iterable[bytes], zero_copy: bool = False) -> List[Message]:
+    """
+    Decode a batch of AMQP encoded messages.
+
+    :param encoded: The encoded messages
+    :param zero_copy: See :meth:`Message.decode`
+    :return: A new :class:`Message` for each encoded message, in order
+    """
+    scratch = Data(None)
+    result = []
+    for data in encoded:
+        message = Message()
+        message._decode(data, zero_copy, scratch)
+        result.append(message)
+    return result
@@ -0,0 +1,578 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import collections
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from ._delivery import Delivery
+from ._exceptions import OutboxFull
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._endpoints import Sender
+    from ._events import Event
+
+DeliveryTag = Optional[Union[str, bytes]]
+
+
+class Outbox(object):
+    """
+    A bounded queue of encoded messages waiting for credit on a
+    :class:`proton.Sender`, to which they are added by
+    :meth:`proton.Sender.enqueue` and from which they are sent, in order,
+    by :meth:`proton.Sender.send_queued`.
+
+    Each sender has its own outbox, given by :attr:`proton.Sender.outbox`.
+    A default one is created when first used, and another, with different
+    limits or policy, may be assigned before any messages are queued.
+
+    :param max_messages: The most messages held, or ``None`` for no limit.
+    :param max_bytes: The most bytes of encoded messages held, or ``None``
+        for no limit. A message larger than this is accepted only when the
+        outbox is empty.
+    :param policy: What to do with a message that does not fit.
+        :const:`RAISE` raises :exc:`proton.OutboxFull`. :const:`DROP`
+        discards the message and counts it in :attr:`dropped`.
+        :const:`BLOCK` makes :meth:`proton.utils.BlockingSender.enqueue`
+        wait until there is room. Anywhere else, such as in an event
+        handler where waiting would stall the event loop, it acts as
+        :const:`RAISE`.
+    """
+
+    BLOCK = "block"
+    """Wait for room in the outbox, where the caller can wait."""
+
+    DROP = "drop"
+    """Discard messages that do not fit."""
+
+    RAISE = "raise"
+    """Raise :exc:`proton.OutboxFull` for messages that do not fit."""
+
+    durable = False
+    """
+    Whether messages are kept until the peer settles them, in which case
+    :meth:`proton.Sender.enqueue` adds every message to the outbox rather
+    than sending it at once when there is credit.
+    """
+
+    def __init__(
+            self,
+            max_messages: Optional[int] = 1024,
+            max_bytes: Optional[int] = 16 * 1024 * 1024,
+            policy: str = RAISE
+    ) -> None:
+        if policy not in (self.BLOCK, self.DROP, self.RAISE):
+            raise ValueError("unknown outbox policy: %s" % policy)
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.bytes = 0
+        self.dropped = 0
+        self.sender: Optional['Sender'] = None
+        self._queue: Deque[Any] = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def has_room(self, size: int) -> bool:
+        """
+        Whether a message of ``size`` encoded bytes fits in the outbox.
+        """
+        if not self._queue:
+            return True
+        if self.max_messages is not None and len(self._queue) >= self.max_messages:
+            return False
+        return self.max_bytes is None or self.bytes + size <= self.max_bytes
+
+    def put(self, data: bytes, tag: DeliveryTag = None) -> bool:
+        """
+        Add an encoded message to the outbox, applying the :attr:`policy`
+        if it does not fit.
+
+        :param data: The encoded message.
+        :param tag: The delivery tag to send it with, or ``None`` for one
+            generated by the sender when the message is sent.
+        :return: ``True`` if the message was added, ``False`` if dropped.
+        :raise: :exc:`proton.OutboxFull` if the message does not fit and the
+            policy is not :const:`DROP`.
+        """
+        if not self.has_room(len(data)):
+            return self._overflow()
+        self._queue.append((tag, data))
+        self.bytes += len(data)
+        return True
+
+    def _overflow(self) -> bool:
+        if self.policy == self.DROP:
+            self.dropped += 1
+            return False
+        raise OutboxFull("outbox is full with %d messages of %d bytes" % (len(self._queue), self.bytes))
+
+    def get(self) -> Optional[Tuple[DeliveryTag, bytes]]:
+        """
+        Remove the oldest message from the outbox.
+
+        :return: The delivery tag, which may be ``None``, and the encoded
+            message, or ``None`` if the oldest message is not yet ready to
+            be sent.
+        """
+        tag, data = self._queue.popleft()
+        self.bytes -= len(data)
+        return tag, data
+
+    def sent(self, delivery: 'Delivery') -> None:
+        """
+        Called by :meth:`proton.Sender.send_queued` with the delivery of
+        the message last removed by :meth:`get`.
+        """
+        pass
+
+    def settled(self, delivery: 'Delivery') -> None:
+        """
+        Called when the peer settles a delivery of a message sent from the
+        outbox, or sent at once by :meth:`proton.Sender.enqueue`.
+        """
+        pass
+
+    def requeue(self) -> None:
+        """
+        Called when the connection of the sender is lost, leaving the
+        messages sent but not yet settled without a delivery to settle.
+        """
+        pass
+
+    def clear(self) -> None:
+        """
+        Discard every message in the outbox.
+        """
+        self._queue.clear()
+        self.bytes = 0
+
+
+# a stored message: the CRC-32 of the rest of the record, its sequence
+# number, the type and length of its delivery tag, then the tag and the
+# encoded message
+_HEADER = struct.Struct('<IQBH')
+# an index slot: the sequence number of a record, its offset and size in
+# the log, and its state
+_SLOT = struct.Struct('<QQII')
+_FREE, _LIVE, _DONE = 0, 1, 2
+_NO_TAG, _TEXT_TAG, _BINARY_TAG = 0, 1, 2
+
+
+class _Record(object):
+    __slots__ = ('seq', 'segment', 'slot', 'offset', 'size', 'in_flight')
+
+    def __init__(self, seq: int, segment: '_Segment', slot: int, offset: int, size: int) -> None:
+        self.seq = seq
+        self.segment = segment
+        self.slot = slot
+        self.offset = offset
+        self.size = size
+        self.in_flight = False
+
+
+class _Segment(object):
+    """
+    An append-only log file of records and the memory mapped index of
+    their slots.
+    """
+
+    def __init__(self, directory: str, number: int, slots: int) -> None:
+        self.number = number
+        self.path = os.path.join(directory, "%020d" % number)
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        self.log = os.open(self.path + ".log", flags | os.O_APPEND)
+        self._index_fd = os.open(self.path + ".idx", flags)
+        if os.fstat(self._index_fd).st_size < slots * _SLOT.size:
+            os.ftruncate(self._index_fd, slots * _SLOT.size)
+        self.index = mmap.mmap(self._index_fd, slots * _SLOT.size)
+        self.slots = slots
+        self.size = os.fstat(self.log).st_size
+        self.count = 0
+        self.live = 0
+        self.dirty = False
+
+    def slot(self, slot: int) -> Tuple[int, int, int, int]:
+        return _SLOT.unpack_from(self.index, slot * _SLOT.size)
+
+    def mark(self, slot: int, state: int) -> None:
+        struct.pack_into('<I', self.index, slot * _SLOT.size + 20, state)
+
+    def read(self, offset: int, size: int) -> bytes:
+        # shorter than size only if the log ends first
+        os.lseek(self.log, offset, os.SEEK_SET)
+        chunks = []
+        while size:
+            data = os.read(self.log, size)
+            if not data:
+                break
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    def append(self, seq: int, record: bytes) -> Tuple[int, int]:
+        offset = self.size
+        view = memoryview(record)
+        try:
+            while view:
+                view = view[os.write(self.log, view):]
+        except OSError:
+            # the record is not indexed, and must not be followed by others
+            os.ftruncate(self.log, offset)
+            raise
+        self.size += len(record)
+        slot = self.count
+        _SLOT.pack_into(self.index, slot * _SLOT.size, seq, offset, len(record), _LIVE)
+        self.count += 1
+        self.live += 1
+        self.dirty = True
+        return slot, offset
+
+    def sync(self) -> None:
+        if self.dirty:
+            os.fsync(self.log)
+            self.index.flush()
+            self.dirty = False
+
+    def close(self) -> None:
+        self.index.flush()
+        self.index.close()
+        os.close(self._index_fd)
+        os.close(self.log)
+
+    def remove(self) -> None:
+        self.index.close()
+        os.close(self._index_fd)
+        os.close(self.log)
+        os.remove(self.path + ".idx")
+        os.remove(self.path + ".log")
+
+
+class _SyncTask(object):
+    """
+    The timer task handler that stores the messages a :class:`DurableOutbox`
+    has batched and sends them.
+    """
+
+    def __init__(self, outbox: 'DurableOutbox') -> None:
+        self.outbox = outbox
+
+    def on_timer_task(self, event: 'Event') -> None:
+        outbox = self.outbox
+        outbox._sync_task = None
+        outbox.sync()
+        sender = outbox.sender
+        if sender is not None and sender.credit:
+            sender.send_queued()
+
+
+class DurableOutbox(Outbox):
+    """
+    An :class:`Outbox` that stores messages on disk until the peer settles
+    them, so that messages enqueued by a process that stops are sent by
+    its successor: at least once, as a message sent but not yet settled
+    when the process stops is sent again.
+
+    Messages are appended to segment files in ``directory``, each with a
+    memory mapped index recording which of its messages are still to be
+    settled. Messages are sent only once they are stored, after a ``fsync``
+    shared by every message added since the previous one. Segments are
+    deleted once all of their messages are settled, and an older segment
+    holding few unsettled messages is compacted by copying them to the
+    newest one.
+
+    A :class:`DurableOutbox` must be assigned to a sender's
+    :attr:`~proton.Sender.outbox` before use, and only one may use a
+    directory at a time. Messages released or modified by the peer are
+    sent again, as are those whose deliveries are lost to a disconnection,
+    which :class:`proton.handlers.MessagingHandler` passes to
+    :meth:`requeue`, once the sender is reconnected.
+
+    :param directory: The directory holding the segments, which is created
+        if it does not exist.
+    :param sync_interval: The least time in seconds between ``fsync`` calls.
+        With ``0`` (the default) messages are stored as soon as the sender
+        has credit to send them. A longer interval stores more messages
+        with each ``fsync``, adding up to that much latency; in a
+        :class:`proton.reactor.Container` a timer stores and sends the
+        messages at the end of the interval. With ``None`` messages are
+        never synced, so they survive the process stopping but not the
+        operating system doing so.
+    :param segment_size: The size in bytes after which a new segment is
+        started.
+    :param segment_messages: The most messages held by a segment, which
+        fixes the size of its index.
+    :param compact_ratio: When a segment is started, each older segment in
+        which at most this fraction of messages remain to be settled is
+        compacted. ``None`` disables compaction.
+    :param max_messages: See :class:`Outbox`. Only messages waiting to be
+        sent count towards the limits.
+    :param max_bytes: See :class:`Outbox`. Stored messages include a
+        header and their delivery tag.
+    :param policy: See :class:`Outbox`.
+    """
+
+    durable = True
+
+    def __init__(
+            self,
+            directory: str,
+            sync_interval: Optional[float] = 0.0,
+            segment_size: int = 64 * 1024 * 1024,
+            segment_messages: int = 65536,
+            compact_ratio: Optional[float] = 0.25,
+            max_messages: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            policy: str = Outbox.RAISE
+    ) -> None:
+        super(DurableOutbox, self).__init__(max_messages, max_bytes, policy)
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.segment_size = segment_size
+        self.segment_messages = segment_messages
+        self.compact_ratio = compact_ratio
+        self.syncs = 0
+        self._segments: Dict[int, _Segment] = {}
+        self._records: Dict[int, _Record] = {}
+        self._taken: Optional[_Record] = None
+        self._sync_task = None
+        self._last_sync = 0.0
+        self._compacting = False
+        self._active: Optional[_Segment] = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _recover(self) -> None:
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                         if name.endswith(".log") and name[:-4].isdigit())
+        self._seq = 0
+        for number in numbers:
+            segment = _Segment(self.directory, number, self.segment_messages)
+            self._segments[number] = segment
+            for slot in range(segment.slots):
+                seq, offset, size, state = segment.slot(slot)
+                if state == _FREE:
+                    break
+                segment.count += 1
+                self._seq = max(self._seq, seq + 1)
+                if state != _LIVE:
+                    continue
+                data = segment.read(offset, size)
+                if len(data) < _HEADER.size or zlib.crc32(data[4:]) != _HEADER.unpack_from(data)[0]:
+                    # torn by a crash before it was synced, so never sent
+                    segment.mark(slot, _DONE)
+                    continue
+                record = self._records.get(seq)
+                if record is not None:
+                    # copied by a compaction that did not complete
+                    self._settle(record)
+                self._records[seq] = _Record(seq, segment, slot, offset, size)
+                segment.live += 1
+        self._synced = self._seq
+        for seq in sorted(self._records):
+            record = self._records[seq]
+            self._queue.append(record)
+            self.bytes += record.size
+        for segment in list(self._segments.values())[:-1]:
+            if not segment.live:
+                self._remove(segment)
+        if not self._segments:
+            self._segments[0] = _Segment(self.directory, 0, self.segment_messages)
+        self._active = self._segments[max(self._segments)]
+        if self._active.count == self._active.slots:
+            self._roll()
+
+    @property
+    def unsettled(self) -> int:
+        """The number of messages stored, whether sent or not."""
+        return len(self._records)
+
+    def put(self, data: bytes, tag: DeliveryTag = None) -> bool:
+        if not self.has_room(len(data)):
+            return self._overflow()
+        if tag is None:
+            kind, tag_bytes = _NO_TAG, b""
+        elif isinstance(tag, str):
+            kind, tag_bytes = _TEXT_TAG, tag.encode('utf-8', 'surrogateescape')
+        else:
+            kind, tag_bytes = _BINARY_TAG, bytes(tag)
+        seq = self._seq
+        self._seq += 1
+        body = _HEADER.pack(0, seq, kind, len(tag_bytes))[4:] + tag_bytes + data
+        record = self._append(struct.pack('<I', zlib.crc32(body)) + body, seq)
+        self._queue.append(record)
+        self.bytes += record.size
+        return True
+
+    def _append(self, data: bytes, seq: int) -> _Record:
+        active = self._active
+        if active.count == active.slots or (active.count and active.size + len(data) > self.segment_size):
+            self._roll()
+            active = self._active
+        slot, offset = active.append(seq, data)
+        record = _Record(seq, active, slot, offset, len(data))
+        self._records[seq] = record
+        return record
+
+    def _roll(self) -> None:
+        self._active.sync()
+        self._active = _Segment(self.directory, self._active.number + 1, self.segment_messages)
+        self._segments[self._active.number] = self._active
+        if self.compact_ratio is not None:
+            self.compact(self.compact_ratio)
+
+    def get(self) -> Optional[Tuple[DeliveryTag, bytes]]:
+        record = self._queue[0]
+        if record.seq >= self._synced and self.sync_interval is not None:
+            wait = self._last_sync + self.sync_interval - time.monotonic()
+            if wait > 0 and self._schedule_sync(wait):
+                return None
+            self.sync()
+        self._queue.popleft()
+        self.bytes -= record.size
+        record.in_flight = True
+        self._taken = record
+        data = record.segment.read(record.offset, record.size)
+        if len(data) < record.size:
+            raise OSError("message %d is missing from %s.log" % (record.seq, record.segment.path))
+        kind, length = _HEADER.unpack_from(data)[2:]
+        tag: DeliveryTag = None
+        start = _HEADER.size + length
+        if kind == _TEXT_TAG:
+            tag = data[_HEADER.size:start].decode('utf-8', 'surrogateescape')
+        elif kind == _BINARY_TAG:
+            tag = data[_HEADER.size:start]
+        return tag, data[start:]
+
+    def _schedule_sync(self, delay: float) -> bool:
+        if self._sync_task is not None:
+            return True
+        connection = getattr(self.sender, 'connection', None)
+        container = getattr(connection, '_reactor', None)
+        if container is None:
+            return False
+        self._sync_task = container.schedule(delay, _SyncTask(self))
+        return True
+
+    def sync(self) -> None:
+        """
+        Store the messages added since the last sync, so that they are
+        ready to be sent.
+        """
+        if self._synced < self._seq:
+            self._active.sync()
+            self._synced = self._seq
+            self.syncs += 1
+        self._last_sync = time.monotonic()
+
+    def sent(self, delivery: 'Delivery') -> None:
+        record = self._taken
+        self._taken = None
+        delivery._outbox_record = record
+        if self.sender is not None and self.sender.snd_settle_mode == self.sender.SND_SETTLED:
+            self._settle(record)
+
+    def settled(self, delivery: 'Delivery') -> None:
+        record = getattr(delivery, '_outbox_record', None)
+        if record is None or not record.in_flight:
+            return
+        if delivery.remote_state in (Delivery.RELEASED, Delivery.MODIFIED):
+            record.in_flight = False
+            self._queue.appendleft(record)
+            self.bytes += record.size
+        else:
+            self._settle(record)
+
+    def requeue(self) -> None:
+        """
+        Return the messages sent but not yet settled to the front of the
+        outbox, to be sent again, as when their deliveries have been lost
+        to a disconnection.
+        """
+        records = sorted((r for r in self._records.values() if r.in_flight), key=lambda r: r.seq, reverse=True)
+        for record in records:
+            record.in_flight = False
+            self._queue.appendleft(record)
+            self.bytes += record.size
+
+    def clear(self) -> None:
+        for record in self._queue:
+            self._settle(record)
+        super(DurableOutbox, self).clear()
+
+    def _settle(self, record: _Record) -> None:
+        record.in_flight = False
+        if self._records.get(record.seq) is record:
+            del self._records[record.seq]
+        segment = record.segment
+        segment.mark(record.slot, _DONE)
+        segment.live -= 1
+        if not segment.live and segment is not self._active:
+            self._remove(segment)
+
+    def _remove(self, segment: _Segment) -> None:
+        del self._segments[segment.number]
+        segment.remove()
+
+    def compact(self, ratio: float = 1.0) -> None:
+        """
+        Copy the unsettled messages of each segment but the newest in which
+        at most ``ratio`` of the messages remain unsettled to the newest
+        segment, and delete it.
+        """
+        if self._compacting:
+            return
+        self._compacting = True
+        try:
+            moved: List[_Segment] = []
+            for segment in list(self._segments.values()):
+                if segment is not self._active and segment.live <= ratio * segment.count:
+                    moved.append(segment)
+            if not moved:
+                return
+            for record in sorted(self._records.values(), key=lambda r: r.seq):
+                old = record.segment
+                if old in moved:
+                    data = old.read(record.offset, record.size)
+                    copy = self._append(data, record.seq)
+                    record.segment, record.slot, record.offset = copy.segment, copy.slot, copy.offset
+                    self._records[record.seq] = record
+            self._active.sync()
+            for segment in moved:
+                if segment.number in self._segments:
+                    self._remove(segment)
+        finally:
+            self._compacting = False
+
+    def close(self) -> None:
+        """
+        Store any messages not yet stored and close the segment files.
+        """
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        self.sync()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
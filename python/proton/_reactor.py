@@ -23,6 +23,7 @@ import logging
 import re
 import os
 import queue
+from socket import socketpair
 from typing import Any, Dict, Iterator, Optional, List, Union, Callable, TYPE_CHECKING, Tuple, Type
 
 try:
@@ -101,12 +102,35 @@ class Task(object):
 
 
 class TimerSelectable(Selectable):
+    """
+    Expires when the next timer task is due, and is readable when the
+    reactor is woken by :meth:`Container.wakeup`.
+    """
 
     def __init__(self, reactor: 'Container') -> None:
-        super(TimerSelectable, self).__init__(None, reactor)
+        self._wakeup = socketpair()
+        for sock in self._wakeup:
+            sock.setblocking(False)
+        super(TimerSelectable, self).__init__(self._wakeup[0], reactor)
+        self.reading = True
+
+    def wakeup(self) -> None:
+        try:
+            self._wakeup[1].send(b"!")
+        except OSError:
+            # a wakeup is already pending, or the reactor has finished
+            pass
+
+    def close(self) -> None:
+        for sock in self._wakeup:
+            sock.close()
 
     def readable(self) -> None:
-        pass
+        try:
+            while self._wakeup[0].recv(512):
+                pass
+        except OSError:
+            pass
 
     def writable(self) -> None:
         pass
@@ -202,19 +226,19 @@ class Reactor(object):
         self._global_handler = None
         self._handler = None
 
-    # Cross thread reactor wakeup
     def wakeup(self) -> None:
-        # TODO: Do this with pipe and write?
-        #  os.write(self._wakeup[1], "x", 1);
-        pass
+        """
+        Make the thread processing events return from :meth:`process` if it
+        is waiting for I/O or a timer. May be called from any thread.
+        """
+        selectable = self._selectable
+        if selectable is not None:
+            selectable.wakeup()
 
     def start(self) -> None:
         self.push_event(self, Event.REACTOR_INIT)
         self._selectable = TimerSelectable(self)
         self._selectable.deadline = self.timer_deadline
-        # TODO set up fd to read for wakeups - but problematic on windows
-        #  self._selectable.fileno(self._wakeup[0])
-        #  self._selectable.reading = True
         self.update(self._selectable)
 
     @property
@@ -239,10 +263,22 @@ class Reactor(object):
             else:
                 raise value.with_traceback(tb)
 
-    def process(self) -> bool:
-        # result = pn_reactor_process(self._impl)
-        # self._check_errors()
-        # return result
+    def process(self, timeout: Optional[float] = None) -> bool:
+        """
+        Process events, returning when the events ready have been
+        processed and, if there were none, after waiting for I/O or a timer.
+
+        :param timeout: If given, the most time in seconds to wait for I/O,
+            if less than :attr:`timeout`.
+        :return: ``False`` once the reactor has stopped.
+        """
+        if timeout is not None and timeout < self._timeout:
+            saved = self._timeout
+            self._timeout = max(timeout, 0)
+            try:
+                return self.process()
+            finally:
+                self._timeout = saved
         self.mark()
         previous = PN_EVENT_NONE
         while True:
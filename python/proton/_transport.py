@@ -37,7 +37,7 @@ from cproton import PN_EOS, PN_OK, PN_SASL_AUTH, PN_SASL_NONE, PN_SASL_OK, PN_SA
     pn_transport_get_frames_output, pn_transport_get_idle_timeout, pn_transport_get_max_frame, \
     pn_transport_get_pytracer, pn_transport_get_remote_idle_timeout, pn_transport_get_remote_max_frame, \
     pn_transport_get_user, pn_transport_is_authenticated, pn_transport_is_encrypted, pn_transport_log, \
-    pn_transport_peek, pn_transport_pending, pn_transport_pop, pn_transport_push, pn_transport_remote_channel_max, \
+    pn_transport_peek, pn_transport_peek_into, pn_transport_pending, pn_transport_pop, pn_transport_push, pn_transport_remote_channel_max, \
     pn_transport_require_auth, pn_transport_require_encryption, pn_transport_set_channel_max, \
     pn_transport_set_idle_timeout, pn_transport_set_max_frame, pn_transport_set_pytracer, pn_transport_set_server, \
     pn_transport_tick, pn_transport_trace, pn_transport_unbind, \
@@ -346,6 +346,24 @@ class Transport(Wrapper):
             self._check(cd)
             return out
 
+    def peek_into(self, buffer: Union[bytearray, memoryview]) -> Optional[int]:
+        """
+        Copies bytes from the head of the transport into a caller supplied
+        writable buffer, as :meth:`peek` does, without allocating a new
+        buffer for each call. At most :meth:`pending` bytes are copied.
+
+        :param buffer: A writable buffer, such as a ``bytearray`` or a
+            ``memoryview`` over one.
+        :return: The number of bytes copied, or ``None`` if none are
+                 available.
+        :raise: :exc:`TransportException` if there is any Proton error.
+        """
+        cd = pn_transport_peek_into(self._impl, buffer)
+        if cd == PN_EOS:
+            return None
+        else:
+            return self._check(cd)
+
     def pop(self, size: int) -> None:
         """
         Removes ``size`` bytes of output from the pending output queue
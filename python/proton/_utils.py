@@ -17,20 +17,26 @@
 # under the License.
 #
 
+import asyncio
 import collections
+import itertools
+import math
+import os
 import time
 import threading
+import weakref
 
-from ._exceptions import ProtonException, ConnectionException, LinkException, Timeout
+from ._exceptions import ProtonException, ConnectionException, LinkException, MessageException, Timeout
 from ._delivery import Delivery
 from ._endpoints import Endpoint, Link
 from ._events import Handler
 from ._url import Url
+from ._outbox import Outbox
 
-from ._reactor import Container
-from ._handlers import MessagingHandler, IncomingMessageHandler
+from ._reactor import ApplicationEvent, Container, EventInjector
+from ._handlers import FlowController, MessagingHandler, IncomingMessageHandler, recv_msg, _reject_undecodable
 
-from typing import Callable, Optional, Union, TYPE_CHECKING, List, Any
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
 
 try:
     from typing import Literal
@@ -44,6 +50,7 @@ except ImportError:
         pass
 
 if TYPE_CHECKING:
+    from ._compression import Compression
     from ._delivery import DispositionType
     from ._transport import SSLDomain
     from ._reactor import SenderOption, ReceiverOption, Connection, LinkOption, Backoff
@@ -51,6 +58,10 @@ if TYPE_CHECKING:
     from ._events import Event
     from ._message import Message
 
+# the most bytes of a streamed body buffered by a receiver without max_bytes
+# until the application takes them
+_MAX_STREAM_BYTES = 1 << 20
+
 
 class BlockingLink:
     def __init__(self, connection: 'BlockingConnection', link: Union['Sender', 'Receiver']) -> None:
@@ -103,6 +114,58 @@ def _is_settled(delivery: Delivery) -> bool:
     return delivery.settled or delivery.link.snd_settle_mode == Link.SND_SETTLED
 
 
+class DeliveryFuture:
+    """
+    The outcome of a message sent by :meth:`BlockingSender.send_async`,
+    which is known once the peer has settled the message.
+    """
+
+    def __init__(
+            self,
+            sender: 'BlockingSender',
+            delivery: Delivery,
+            error_states: Optional[List['DispositionType']]
+    ) -> None:
+        self.sender = sender
+        self.delivery = delivery
+        self.error_states = error_states
+        self.state: Optional[int] = None
+        self._settled = False
+
+    def done(self) -> bool:
+        """
+        ``True`` once the message has been settled.
+        """
+        return self._settled or _is_settled(self.delivery)
+
+    def _settle(self) -> None:
+        if not self._settled:
+            self._settled = True
+            self.state = self.delivery.remote_state
+            if self.delivery.link.snd_settle_mode != Link.SND_SETTLED:
+                self.delivery.settle()
+
+    def result(self, timeout: Union[None, Literal[False], float] = False) -> Delivery:
+        """
+        Wait until the message is settled.
+
+        :param timeout: See :meth:`BlockingSender.send`.
+        :return: Delivery object for the message.
+        :raise: :class:`SendException` if the message was settled in one of
+            the error states given to :meth:`BlockingSender.send_async`.
+        """
+        if not self._settled:
+            self.sender.connection.wait(self.done, msg="Sending on sender %s" % self.sender.link.name,
+                                        timeout=timeout)
+            self._settle()
+        bad = self.error_states
+        if bad is None:
+            bad = [Delivery.REJECTED, Delivery.RELEASED]
+        if self.state in bad:
+            raise SendException(self.state)
+        return self.delivery
+
+
 class BlockingSender(BlockingLink):
     """
     A synchronous sender wrapper. This is typically created by calling
@@ -110,6 +173,7 @@ class BlockingSender(BlockingLink):
     """
 
     def __init__(self, connection: 'BlockingConnection', sender: 'Sender') -> None:
+        self._in_flight: Deque[DeliveryFuture] = collections.deque()
         super(BlockingSender, self).__init__(connection, sender)
         if self.link.target and self.link.target.address and self.link.target.address != self.link.remote_target.address:
             # this may be followed by a detach, which may contain an error condition, so wait a little...
@@ -136,7 +200,178 @@ class BlockingSender(BlockingLink):
             will default to a list containing :const:`proton.Delivery.REJECTED` and :const:`proton.Delivery.RELEASED`.
         :return: Delivery object for this message.
         """
-        delivery = self.link.send(msg)
+        return self._wait_settled(self.link.send(msg), timeout, error_states)
+
+    def send_async(
+            self,
+            msg: 'Message',
+            error_states: Optional[List['DispositionType']] = None
+    ) -> DeliveryFuture:
+        """
+        Send a message without waiting for it to be settled. The message is
+        transferred, and its settlement processed, whenever the connection
+        next waits, e.g. in :meth:`flush` or in another blocking call.
+
+        :param error_states: See :meth:`send`.
+        :return: A future for the outcome of the message.
+        """
+        future = DeliveryFuture(self, self.link.send(msg), error_states)
+        self._in_flight.append(future)
+        self._reap()
+        return future
+
+    def send_many(
+            self,
+            msgs: Iterable['Message'],
+            window: int = 64,
+            timeout: Union[None, Literal[False], float] = False,
+            error_states: Optional[List['DispositionType']] = None
+    ) -> List[DeliveryFuture]:
+        """
+        Send messages, keeping up to ``window`` of them in flight rather
+        than waiting for each to be settled before sending the next, and
+        return when all of them are settled.
+
+        :param msgs: The messages to send.
+        :param window: The most messages sent by this sender that may be
+            unsettled at once.
+        :param timeout: Timeout in seconds, applied to each wait for the
+            window to open and to the final wait for all the messages to be
+            settled. See :meth:`send`.
+        :param error_states: See :meth:`send`.
+        :return: A settled future for each message, in order, whose
+            :meth:`~DeliveryFuture.result` raises :class:`SendException` if
+            that message failed.
+        """
+        futures = []
+        for msg in msgs:
+            if len(self._in_flight) >= window:
+                self.connection.wait(lambda: self._reap() < window, msg="Sending on sender %s" % self.link.name,
+                                     timeout=timeout)
+            futures.append(self.send_async(msg, error_states))
+        self.flush(timeout)
+        return futures
+
+    def flush(self, timeout: Union[None, Literal[False], float] = False) -> None:
+        """
+        Wait until every message sent by :meth:`send_async` is settled, and
+        every message queued by :meth:`enqueue` is sent. Failed messages are
+        reported by their futures.
+
+        :param timeout: See :meth:`send`.
+        """
+        outbox = getattr(self.link, '_outbox', None) or ()
+        if self._reap() or outbox:
+            self.connection.wait(lambda: not self._reap() and not outbox, msg="Flushing sender %s" % self.link.name,
+                                 timeout=timeout)
+
+    def enqueue(
+            self,
+            msg: Union['Message', bytes],
+            timeout: Union[None, Literal[False], float] = False
+    ) -> Optional[Delivery]:
+        """
+        Send a message if there is credit for it, and otherwise queue it in
+        the sender's :class:`proton.Outbox` to be sent as credit arrives, as
+        :meth:`proton.Sender.enqueue` does. If the outbox is full and its
+        policy is :const:`proton.Outbox.BLOCK`, wait until there is room.
+        Messages still queued are sent whenever the connection next waits,
+        e.g. in :meth:`flush`.
+
+        :param msg: The message, or an encoded message.
+        :param timeout: Timeout in seconds for room in the outbox. See
+            :meth:`send`.
+        :return: The delivery for the message if it was sent at once,
+            otherwise ``None``.
+        :raise: :exc:`proton.OutboxFull` if the message does not fit and the
+            policy is :const:`proton.Outbox.RAISE`.
+        """
+        link = self.link
+        outbox = link.outbox
+        if outbox.policy == Outbox.BLOCK:
+            if not isinstance(msg, (bytes, bytearray, memoryview)):
+                msg = msg.encode(link.compression)
+            size = len(msg)
+            if not outbox.has_room(size):
+                self.connection.wait(lambda: link.send_queued() or outbox.has_room(size),
+                                     msg="Queueing on sender %s" % link.name, timeout=timeout)
+        return link.enqueue(msg)
+
+    def _reap(self) -> int:
+        # settle messages in the order sent, as peers usually settle them
+        in_flight = self._in_flight
+        while in_flight and in_flight[0].done():
+            in_flight.popleft()._settle()
+        return len(in_flight)
+
+    def send_stream(
+            self,
+            source: Union[bytes, memoryview, BinaryIO, Iterable[bytes]],
+            size: Optional[int] = None,
+            message: Optional['Message'] = None,
+            timeout: Union[None, Literal[False], float] = False,
+            error_states: Optional[List['DispositionType']] = None,
+    ) -> Delivery:
+        """
+        Blocking send of a message whose body is read incrementally from
+        ``source``, which will return only when the send is complete and the
+        message settled. See :meth:`proton.Sender.send_stream`.
+
+        :param source: A buffer, a binary file or an iterable of ``bytes``
+            like chunks holding the message body.
+        :param size: The body size in bytes, required if ``source`` is an
+            iterable.
+        :param message: A message supplying the other sections of the
+            streamed message. Its body is ignored.
+        :param timeout: Timeout in seconds, applied to each wait for the
+            peer to take more of the body and to the final settlement. If
+            ``False``, the value of ``timeout`` used in the constructor of
+            the :class:`BlockingConnection` object will be used. If ``None``,
+            there is no timeout.
+        :param error_states: See :meth:`send`.
+        :return: Delivery object for this message.
+        """
+        return self._wait_streamed(self.link.send_stream(source, size, message), timeout, error_states)
+
+    def send_file(
+            self,
+            file: Union[str, BinaryIO],
+            message: Optional['Message'] = None,
+            timeout: Union[None, Literal[False], float] = False,
+            error_states: Optional[List['DispositionType']] = None,
+    ) -> Delivery:
+        """
+        Blocking send of a message whose body is the content of a file,
+        sent from a memory mapping of the file. See
+        :meth:`proton.Sender.send_file` and :meth:`send_stream`.
+
+        :param file: The path of the file, or a binary file object.
+        :param message: A message supplying the other sections of the
+            message. Its body is ignored.
+        :param timeout: See :meth:`send_stream`.
+        :param error_states: See :meth:`send`.
+        :return: Delivery object for this message.
+        """
+        return self._wait_streamed(self.link.send_file(file, message), timeout, error_states)
+
+    def _wait_streamed(
+            self,
+            delivery: Delivery,
+            timeout: Union[None, Literal[False], float],
+            error_states: Optional[List['DispositionType']]
+    ) -> Delivery:
+        while not self.link.resume_stream():
+            stream = self.link._outgoing_stream
+            self.connection.wait(lambda: stream.ready(self.link), msg="Streaming on sender %s" % self.link.name,
+                                 timeout=timeout)
+        return self._wait_settled(delivery, timeout, error_states)
+
+    def _wait_settled(
+            self,
+            delivery: Delivery,
+            timeout: Union[None, Literal[False], float],
+            error_states: Optional[List['DispositionType']]
+    ) -> Delivery:
         self.connection.wait(lambda: _is_settled(delivery), msg="Sending on sender %s" % self.link.name,
                              timeout=timeout)
         if delivery.link.snd_settle_mode != Link.SND_SETTLED:
@@ -149,21 +384,127 @@ class BlockingSender(BlockingLink):
         return delivery
 
 
+class _DeferringHandler(IncomingMessageHandler):
+    """
+    Leaves deliveries in the engine rather than receiving them while a
+    :class:`Fetcher` holds as many bytes of messages as it may buffer.
+    """
+
+    def on_delivery(self, event: 'Event') -> None:
+        if not self.delegate._defer(event.delivery):
+            super(_DeferringHandler, self).on_delivery(event)
+
+
+class _StreamingHandler(IncomingMessageHandler):
+    """
+    Leaves the rest of a streamed delivery in the engine while a
+    :class:`Fetcher` holds as many bytes of its body as it may buffer.
+    """
+
+    def _hold_stream(self, delivery: Delivery) -> bool:
+        return self.delegate._hold(delivery)
+
+
 class Fetcher(MessagingHandler):
     """
     A message handler for blocking receivers.
     """
 
-    def __init__(self, connection: 'Connection', prefetch: int):
-        super(Fetcher, self).__init__(prefetch=prefetch, auto_accept=False)
+    def __init__(
+            self,
+            connection: 'Connection',
+            prefetch: Union[int, Handler],
+            streaming: bool = False,
+            compression: Optional['Compression'] = None
+    ):
+        super(Fetcher, self).__init__(prefetch=prefetch, auto_accept=False, streaming=streaming,
+                                      compression=compression)
         self.connection = connection
         self.incoming = collections.deque([])
         self.unsettled = collections.deque([])
+        self._size = 0
+        self._flow_controller = prefetch if isinstance(prefetch, FlowController) else None
+        self._compression = compression
+        self._deferred = 0
+        if self._flow_controller is not None and self._flow_controller.max_bytes is not None and not streaming:
+            # once the limit is reached deliveries stay in the engine, where
+            # the session incoming capacity stops the sender
+            for i, handler in enumerate(self.handlers):
+                if isinstance(handler, IncomingMessageHandler):
+                    self.handlers[i] = _DeferringHandler(False, weakref.proxy(self), compression=compression)
+        self._stream_handler = None
+        if streaming:
+            # once the limit is reached the rest of the body stays in the
+            # engine, where the session incoming capacity stops the sender
+            if self._flow_controller is not None and self._flow_controller.max_bytes is not None:
+                self._max_stream_bytes = self._flow_controller.max_bytes
+            else:
+                self._max_stream_bytes = _MAX_STREAM_BYTES
+            for i, handler in enumerate(self.handlers):
+                if isinstance(handler, IncomingMessageHandler):
+                    self._stream_handler = self.handlers[i] = _StreamingHandler(
+                        False, weakref.proxy(self), streaming=True, compression=compression)
+
+    def _defer(self, delivery: Delivery) -> bool:
+        # a delivery completed behind deferred ones is not yet readable
+        if getattr(delivery, '_unread', False):
+            return True
+        if delivery.pending and not delivery.partial and not delivery.aborted:
+            link = delivery.link
+            if self._deferred or getattr(link, '_held_bytes', 0) >= self._flow_controller.max_bytes:
+                # deferred messages are received in order when taken by pop
+                delivery._unread = True
+                self._deferred += 1
+                self.incoming.append((None, delivery))
+                self.connection.container.yield_()
+                return True
+        return False
+
+    def on_delivery(self, event: 'Event') -> None:
+        # called before the message is received, while its size is known
+        delivery = event.delivery
+        if delivery.readable and not delivery.partial:
+            self._size = delivery.pending
 
     def on_message(self, event: 'Event') -> None:
-        self.incoming.append((event.message, event.delivery))
+        delivery = event.delivery
+        delivery._held_bytes = self._size
+        link = delivery.link
+        link._held_bytes = getattr(link, '_held_bytes', 0) + self._size
+        self.incoming.append((event.message, delivery))
         self.connection.container.yield_()  # Wake up the wait() loop to handle the message.
 
+    def on_message_chunk(self, event: 'Event') -> None:
+        delivery = event.delivery
+        chunks = getattr(delivery, '_chunks', None)
+        if chunks is None:
+            chunks = delivery._chunks = collections.deque()
+            self.incoming.append((event.message, delivery))
+        # the chunk is a view over the receive buffer, so must be copied
+        if event.chunk is None:
+            chunks.append(None)
+        else:
+            chunks.append(bytes(event.chunk))
+            delivery._chunk_bytes = getattr(delivery, '_chunk_bytes', 0) + len(event.chunk)
+        self.connection.container.yield_()
+
+    def _hold(self, delivery: Delivery) -> bool:
+        if getattr(delivery, '_chunk_bytes', 0) < self._max_stream_bytes:
+            return False
+        delivery._held = True
+        return True
+
+    def _take_chunk(self, delivery: Delivery) -> Optional[bytes]:
+        # takes the next chunk of a streamed body, reading more of it from
+        # the engine once there is room
+        chunk = delivery._chunks.popleft()
+        if chunk is not None:
+            delivery._chunk_bytes -= len(chunk)
+            if getattr(delivery, '_held', False) and delivery._chunk_bytes < self._max_stream_bytes:
+                delivery._held = False
+                self._stream_handler.on_delivery(ApplicationEvent("stream_resumed", delivery=delivery))
+        return chunk
+
     def on_link_error(self, event: 'Event') -> None:
         if event.link.state & Endpoint.LOCAL_ACTIVE:
             event.link.close()
@@ -182,16 +523,62 @@ class Fetcher(MessagingHandler):
         """
         return len(self.incoming)
 
-    def pop(self) -> 'Message':
+    def pop(self) -> Optional['Message']:
         """
         Get the next available incoming message. If the message is unsettled, its
         delivery object is moved onto the unsettled queue, and can be settled with
         a call to :meth:`settle`.
+
+        :return: The message, or ``None`` if there was none left once those
+            whose bodies could not be decompressed were rejected.
+        """
+        message, link = self._take()
+        if link is not None:
+            self._flow_controller._flow(link)
+        return message
+
+    def pop_batch(self, count: int) -> List['Message']:
         """
-        message, delivery = self.incoming.popleft()
+        Get up to ``count`` of the available incoming messages, as by
+        :meth:`pop`, issuing any credit this frees once for the batch.
+        """
+        messages = []
+        flow = None
+        while len(messages) < count and self.incoming:
+            message, link = self._take()
+            if message is not None:
+                messages.append(message)
+            flow = link or flow
+        if flow is not None:
+            self._flow_controller._flow(flow)
+        return messages
+
+    def _take(self) -> Tuple[Optional['Message'], Optional[Link]]:
+        # returns the message and, if taking it freed buffered bytes that
+        # the flow controller limits, its link
+        flow = None
+        while True:
+            if not self.incoming:
+                return None, flow
+            message, delivery = self.incoming.popleft()
+            if message is not None:
+                break
+            self._deferred -= 1
+            delivery._unread = False
+            flow = delivery.link
+            try:
+                message = recv_msg(delivery, compression=self._compression)
+                break
+            except MessageException as e:
+                _reject_undecodable(delivery, e)
+        size = getattr(delivery, '_held_bytes', 0)
+        if size:
+            delivery.link._held_bytes -= size
+            if self._flow_controller is not None:
+                flow = delivery.link
         if not delivery.settled:
             self.unsettled.append(delivery)
-        return message
+        return message, flow
 
     def settle(self, state: Optional[int] = None) -> None:
         """
@@ -205,6 +592,18 @@ class Fetcher(MessagingHandler):
             delivery.update(state)
         delivery.settle()
 
+    def settle_all(self, state: Optional[int] = None) -> None:
+        """
+        Settle all the messages previously taken with :meth:`pop` or
+        :meth:`pop_batch` and not yet settled.
+        """
+        unsettled = self.unsettled
+        self.unsettled = collections.deque()
+        for delivery in unsettled:
+            if state:
+                delivery.update(state)
+            delivery.settle()
+
 
 class BlockingReceiver(BlockingLink):
     """
@@ -230,6 +629,20 @@ class BlockingReceiver(BlockingLink):
             receiver.flow(credit)
         self.fetcher = fetcher
         self.container = connection.container
+        # set if the receiver was created on a session of its own
+        self._owns_session = False
+
+    def close(self) -> None:
+        """
+        Close the link, and the session it was created on if that was
+        opened for it.
+        """
+        super(BlockingReceiver, self).close()
+        if self._owns_session:
+            session = self.link.session
+            session.close()
+            self.connection.wait(lambda: not (session.state & Endpoint.REMOTE_ACTIVE),
+                                 msg="Closing session of link %s" % self.link.name)
 
     def __del__(self):
         self.fetcher = None
@@ -239,6 +652,14 @@ class BlockingReceiver(BlockingLink):
         if hasattr(self, "container"):
             self.link.handler = None  # implicit call to reactor
 
+    @property
+    def buffered_bytes(self) -> int:
+        """
+        The number of bytes of messages buffered by this receiver, both
+        in the engine and waiting to be taken by :meth:`receive`.
+        """
+        return self.link.buffered_bytes + getattr(self.link, '_held_bytes', 0)
+
     def receive(
             self,
             timeout: Union[None, Literal[False], float] = False
@@ -255,9 +676,98 @@ class BlockingReceiver(BlockingLink):
             raise Exception("Can't call receive on this receiver as a handler was not provided")
         if not self.link.credit:
             self.link.flow(1)
-        self.connection.wait(lambda: self.fetcher.has_message, msg="Receiving on receiver %s" % self.link.name,
-                             timeout=timeout)
-        return self.fetcher.pop()
+        while True:
+            self.connection.wait(lambda: self.fetcher.has_message, msg="Receiving on receiver %s" % self.link.name,
+                                 timeout=timeout)
+            message = self.fetcher.pop()
+            if message is not None:
+                return message
+
+    def receive_batch(
+            self,
+            max_messages: int = 1024,
+            timeout: Union[None, Literal[False], float] = False
+    ) -> List['Message']:
+        """
+        Blocking receive call which returns the messages already received,
+        up to ``max_messages`` of them, waiting for input only if there are
+        none. The
+        messages are settled together by :meth:`accept_all` or
+        :meth:`settle_batch`, or one at a time in order by :meth:`accept`
+        and the like.
+
+        :param max_messages: The most messages to return.
+        :param timeout: Timeout in seconds for the wait for a first message.
+            See :meth:`receive`.
+        :return: The received messages, of which there is at least one.
+        """
+        if not self.fetcher:
+            raise Exception("Can't call receive on this receiver as a handler was not provided")
+        fetcher = self.fetcher
+        if not fetcher.has_message and not self.link.credit:
+            self.link.flow(max_messages)
+        # the fetcher yields on each message, so keep processing the events
+        # for what has already been read, without waiting for more input
+        while True:
+            self.connection.wait(lambda: fetcher.has_message >= max_messages or
+                                 (fetcher.has_message and self.container.quiesced),
+                                 msg="Receiving on receiver %s" % self.link.name, timeout=timeout)
+            messages = fetcher.pop_batch(max_messages)
+            if messages:
+                return messages
+
+    def receive_stream(
+            self,
+            timeout: Union[None, Literal[False], float] = False
+    ) -> Tuple['Message', Iterator[bytes]]:
+        """
+        Blocking receive call which will return as soon as the start of a
+        message is received, or a timeout (if supplied) occurs. If the
+        receiver was created with ``streaming`` set, the body of the
+        message is then received as the returned iterator is consumed,
+        so that bodies larger than memory can be processed. Otherwise the
+        iterator yields the whole body of the received message.
+
+        The message must be settled, for example with :meth:`accept`, once
+        the iterator is exhausted.
+
+        :param timeout: Timeout in seconds, applied to the wait for the
+            message and to each wait for more of its body. If ``False``, the
+            value of ``timeout`` used in the constructor of the
+            :class:`BlockingConnection` object used in the constructor will
+            be used. If ``None``, there is no timeout.
+        :return: The message, with its body unset if it is streamed, and an
+            iterator over the parts of its body.
+        """
+        if not self.fetcher:
+            raise Exception("Can't call receive on this receiver as a handler was not provided")
+        if not self.link.credit:
+            self.link.flow(1)
+        while True:
+            self.connection.wait(lambda: self.fetcher.has_message, msg="Receiving on receiver %s" % self.link.name,
+                                 timeout=timeout)
+            delivery = self.fetcher.incoming[0][1]
+            chunks = getattr(delivery, '_chunks', None)
+            message = self.fetcher.pop()
+            if message is not None:
+                break
+        if chunks is None:
+            return message, iter([] if message.body is None else [message.body])
+        return message, self._stream(delivery, timeout)
+
+    def _stream(
+            self,
+            delivery: Delivery,
+            timeout: Union[None, Literal[False], float]
+    ) -> Iterator[bytes]:
+        chunks = delivery._chunks
+        while True:
+            self.connection.wait(lambda: chunks, msg="Streaming on receiver %s" % self.link.name,
+                                 timeout=timeout)
+            chunk = self.fetcher._take_chunk(delivery)
+            if chunk is None:
+                return
+            yield chunk
 
     def accept(self) -> None:
         """
@@ -300,6 +810,24 @@ class BlockingReceiver(BlockingLink):
             raise Exception("Can't call accept/reject etc on this receiver as a handler was not provided")
         self.fetcher.settle(state)
 
+    def accept_all(self) -> None:
+        """
+        Accept and settle all the received messages that are not yet
+        settled, such as those returned by :meth:`receive_batch`.
+        """
+        self.settle_batch(Delivery.ACCEPTED)
+
+    def settle_batch(self, state: Optional['DispositionType'] = None) -> None:
+        """
+        Settle all the received messages that are not yet settled.
+
+        :param state: Update the delivery of each message with the supplied
+            state before settling it.
+        """
+        if not self.fetcher:
+            raise Exception("Can't call accept/reject etc on this receiver as a handler was not provided")
+        self.fetcher.settle_all(state)
+
 
 class LinkDetached(LinkException):
     """
@@ -344,6 +872,19 @@ class ConnectionClosed(ConnectionException):
         super(ConnectionClosed, self).__init__(txt)
 
 
+class _Waiter:
+    """
+    A thread waiting on a condition in :meth:`BlockingConnection.wait`
+    while another processes events.
+    """
+
+    def __init__(self, condition: Callable[[], bool]) -> None:
+        self.condition = condition
+        self.event = threading.Event()
+        self.done = False
+        self.error: Optional[Exception] = None
+
+
 class BlockingConnection(Handler):
     """
     A synchronous style connection wrapper.
@@ -377,6 +918,9 @@ class BlockingConnection(Handler):
             **kwargs
     ) -> None:
         self.disconnected = False
+        self._lock = threading.Lock()
+        self._processing: Optional[int] = None
+        self._waiters: List[_Waiter] = []
         self.timeout = timeout or 60
         self.container = container or Container()
         self.container.timeout = self.timeout
@@ -424,7 +968,10 @@ class BlockingConnection(Handler):
             dynamic: bool = False,
             handler: Optional[Handler] = None,
             name: Optional[str] = None,
-            options: Optional[Union['ReceiverOption', List['ReceiverOption'], 'LinkOption', List['LinkOption']]] = None
+            options: Optional[Union['ReceiverOption', List['ReceiverOption'], 'LinkOption', List['LinkOption']]] = None,
+            streaming: bool = False,
+            compression: Optional['Compression'] = None,
+            max_bytes: Optional[int] = None
     ) -> BlockingReceiver:
         """
         Create a blocking receiver.
@@ -435,19 +982,53 @@ class BlockingConnection(Handler):
         :param handler: Event handler for this receiver.
         :param name: Receiver name.
         :param options: A single option, or a list of receiver options
+        :param streaming: If ``True``, message bodies are received
+            incrementally by :meth:`BlockingReceiver.receive_stream`. At most
+            about ``max_bytes``, or 1 MiB if not set, of a body is buffered
+            until taken from its iterator, the rest being held back by the
+            incoming capacity of a session of the receiver's own, which is
+            closed with the receiver.
+        :param compression: A :class:`proton.Compression` with which to
+            decompress the bodies of received messages.
+        :param max_bytes: If set, credit defaults to 1024 but is limited so
+            that about this many bytes of messages are buffered by the
+            receiver, including messages waiting to be taken by :meth:`receive`.
+            The receiver is created on a session of its own with this incoming
+            capacity, which is closed with the receiver. The bytes buffered are
+            given by :attr:`BlockingReceiver.buffered_bytes`.
         :return: New blocking receiver instance.
         """
         prefetch = credit
+        context = self.conn
         if handler:
             fetcher = None
             if prefetch is None:
                 prefetch = 1
         else:
-            fetcher = Fetcher(self, credit)
-        return BlockingReceiver(
-            self,
-            self.container.create_receiver(self.conn, address, name=name, dynamic=dynamic, handler=handler or fetcher,
-                                           options=options), fetcher, credit=prefetch)
+            if max_bytes is not None:
+                fetcher = Fetcher(self, FlowController(credit or 1024, max_bytes), streaming, compression)
+                prefetch = 0
+            else:
+                fetcher = Fetcher(self, credit, streaming, compression)
+            if max_bytes is not None or streaming:
+                # a session of its own limits the bytes in transit to the
+                # receiver, including those sent on credit issued for smaller
+                # messages and the rest of a streamed body not yet taken
+                context = self.conn.session()
+                capacity = _MAX_STREAM_BYTES if max_bytes is None else max_bytes
+                context.incoming_capacity = max(capacity, self.conn.transport.max_frame_size)
+                context.open()
+        try:
+            receiver = BlockingReceiver(
+                self,
+                self.container.create_receiver(context, address, name=name, dynamic=dynamic,
+                                               handler=handler or fetcher, options=options), fetcher, credit=prefetch)
+        except Exception:
+            if context is not self.conn:
+                context.close()
+            raise
+        receiver._owns_session = context is not self.conn
+        return receiver
 
     def close(self) -> None:
         """
@@ -504,6 +1085,12 @@ class BlockingConnection(Handler):
         """
         Process events until ``condition()`` returns ``True``.
 
+        Several threads may wait on one connection at once. One of them
+        processes events while the others sleep until their conditions are
+        met, which the processing thread checks after each batch of events.
+        A thread that changes state a waiting condition depends on, other
+        than by processing events, should then call :meth:`wakeup`.
+
         :param condition: Condition which determines when the wait will end.
         :param timeout: Timeout in seconds. If ``False``, the value of ``timeout`` used in the
             constructor of this object will be used. If ``None``, there is no timeout. Any other
@@ -512,27 +1099,122 @@ class BlockingConnection(Handler):
         """
         if timeout is False:
             timeout = self.timeout
-        if timeout is None:
-            while not condition() and not self.disconnected:
-                self.container.process()
-        else:
-            container_timeout = self.container.timeout
-            self.container.timeout = timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        thread = threading.get_ident()
+        if self._processing == thread:
+            # waiting within a wait, e.g. in an event handler
+            self._process(condition, deadline, msg)
+            self._check_disconnected()
+            return
+        lock = self._lock
+        waiter = None
+        with lock:
+            while self._processing is not None:
+                if waiter is None:
+                    waiter = _Waiter(condition)
+                    self._waiters.append(waiter)
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(waiter)
+                        self._timeout(msg)
+                lock.release()
+                try:
+                    waiter.event.wait(remaining)
+                finally:
+                    lock.acquire()
+                waiter.event.clear()
+                if waiter.done:
+                    self._waiters.remove(waiter)
+                    if waiter.error is not None:
+                        raise waiter.error
+                    self._check_disconnected()
+                    return
+            if waiter is not None:
+                self._waiters.remove(waiter)
+            self._processing = thread
+        try:
+            self._process(condition, deadline, msg)
+        finally:
+            with lock:
+                self._processing = None
+                # hand over processing to a thread still waiting
+                for waiter in self._waiters:
+                    if not waiter.done:
+                        waiter.event.set()
+                        break
+        self._check_disconnected()
+
+    def _process(self, condition: Callable[[], bool], deadline: Optional[float], msg: Optional[str]) -> None:
+        container = self.container
+        while True:
+            if self._waiters:
+                self._check_waiters()
+            if condition() or self.disconnected:
+                return
+            if deadline is None:
+                container.process()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeout(msg)
+                container.process(remaining)
+
+    def _check_waiters(self) -> None:
+        # the conditions of other threads are checked by the processing
+        # thread, as they depend on the state it changes
+        with self._lock:
+            waiters = [waiter for waiter in self._waiters if not waiter.done]
+        for waiter in waiters:
             try:
-                deadline = time.time() + timeout
-                while not condition() and not self.disconnected:
-                    self.container.process()
-                    if deadline < time.time():
-                        txt = "Connection %s timed out" % self.url
-                        if msg:
-                            txt += ": " + msg
-                        raise Timeout(txt)
-            finally:
-                self.container.timeout = container_timeout
+                if not (waiter.condition() or self.disconnected):
+                    continue
+            except Exception as e:
+                waiter.error = e
+            waiter.done = True
+            waiter.event.set()
+
+    def _timeout(self, msg: Optional[str]) -> None:
+        txt = "Connection %s timed out" % self.url
+        if msg:
+            txt += ": " + msg
+        raise Timeout(txt)
+
+    def _check_disconnected(self) -> None:
         if self.disconnected and not self._is_closed():
             raise ConnectionException(
                 "Connection %s disconnected: %s" % (self.url, self.disconnected))
 
+    def wakeup(self) -> None:
+        """
+        Have the threads waiting in :meth:`wait` check their conditions.
+        May be called from any thread.
+        """
+        self.container.wakeup()
+
+    def on_link_flow(self, event: 'Event') -> None:
+        """
+        Event callback for when a link's flow state changes, which sends
+        messages queued by :meth:`proton.Sender.enqueue`.
+        """
+        link = event.link
+        if link.is_sender and link.credit and link.state & Endpoint.LOCAL_ACTIVE:
+            link.send_queued()
+
+    def on_delivery(self, event: 'Event') -> None:
+        """
+        Event callback for when a delivery is updated, which settles the
+        deliveries of messages sent by :meth:`proton.Sender.enqueue` once
+        the peer has settled them.
+        """
+        dlv = event.delivery
+        if dlv.link.is_sender and dlv.settled:
+            outbox = getattr(dlv, '_outbox', None)
+            if outbox is not None:
+                outbox.settled(dlv)
+                dlv.settle()
+
     def on_link_remote_close(self, event: 'Event') -> None:
         """
         Event callback for when the remote terminus closes.
@@ -577,58 +1259,205 @@ class AtomicCount:
         return result
 
 
+class ResponseFuture:
+    """
+    The response to a request sent by :meth:`SyncRequestResponse.call_async`.
+    """
+
+    def __init__(self, client: 'SyncRequestResponse', correlation_id: str) -> None:
+        self.client = client
+        self.correlation_id = correlation_id
+        self.response: Optional['Message'] = None
+        self.error: Optional[Exception] = None
+        self._event = threading.Event()
+
+    def done(self) -> bool:
+        """
+        ``True`` once the response has arrived or the request has failed.
+        """
+        return self.response is not None or self.error is not None
+
+    def result(self, timeout: Union[None, Literal[False], float] = False) -> 'Message':
+        """
+        Wait for and return the response message.
+
+        :param timeout: Timeout in seconds. If ``False``, the value of ``timeout`` used in the
+            constructor of the :class:`BlockingConnection` object will be used. If ``None``,
+            there is no timeout. When it expires the request is abandoned and a response
+            arriving later is discarded.
+        :raise: :class:`proton.Timeout` if the timeout expires, or :class:`SendException`
+            if the request was rejected or released.
+        """
+        return self.client._result(self, timeout)
+
+
 class SyncRequestResponse(IncomingMessageHandler):
     """
     Implementation of the synchronous request-response (aka RPC) pattern.
     A single instance can send many requests to the same or different
-    addresses.
+    addresses, and can have many requests in flight at once, sent by
+    :meth:`call_async` or by :meth:`call` from several threads. Responses
+    are matched to requests by their ``correlation_id``.
+
+    While requests are waiting for their responses, one of the waiting
+    threads processes the connection's events on behalf of all of them.
+    Other uses of the connection must not overlap with calls.
 
     :param connection: Connection for requests and responses.
     :param address: Address for all requests. If not specified, each request
         must have the address property set. Successive messages may have
         different addresses.
+    :param credit: The number of responses the receiver is given credit
+        for, which is renewed as they arrive.
     """
 
     correlation_id = AtomicCount()
 
-    def __init__(self, connection: BlockingConnection, address: Optional[str] = None) -> None:
+    def __init__(self, connection: BlockingConnection, address: Optional[str] = None, credit: int = 1024) -> None:
         super(SyncRequestResponse, self).__init__()
         self.connection = connection
         self.address = address
+        self.credit = credit
         self.sender = self.connection.create_sender(self.address)
         # dynamic=true generates a unique address dynamically for this receiver.
-        # credit=1 because we want to receive 1 response message initially.
-        self.receiver = self.connection.create_receiver(None, dynamic=True, credit=1, handler=self)
+        # Responses are taken as they arrive, so credit is issued in bulk.
+        self.receiver = self.connection.create_receiver(None, dynamic=True, credit=credit, handler=self)
         self.response = None
-
-    def call(self, request: 'Message') -> 'Message':
+        self._reply_to = self.receiver.remote_source.address
+        self._lock = threading.Lock()
+        self._waiting: List[ResponseFuture] = []
+        self._pending: Dict[str, ResponseFuture] = {}
+        self._outgoing: Deque[Tuple['Message', ResponseFuture]] = collections.deque()
+        self._sent: Deque[Tuple[DeliveryFuture, ResponseFuture]] = collections.deque()
+        self._driving = False
+
+    def call(self, request: 'Message', timeout: Union[None, Literal[False], float] = False) -> 'Message':
         """
         Send a request message, wait for and return the response message.
 
         :param request: Request message. If ``self.address`` is not set the
             request message address must be set and will be used.
+        :param timeout: See :meth:`ResponseFuture.result`.
+        """
+        return self.call_async(request).result(timeout)
+
+    def call_async(self, request: 'Message') -> ResponseFuture:
+        """
+        Send a request message without waiting for the response. The
+        request is sent when this or another call next waits, and must not
+        be changed until then.
+
+        :param request: Request message. If ``self.address`` is not set the
+            request message address must be set and will be used.
+        :return: A future for the response.
         """
         if not self.address and not request.address:
             raise ValueError("Request message has no address: %s" % request)
-        request.reply_to = self.reply_to
+        request.reply_to = self._reply_to
         request.correlation_id = correlation_id = str(self.correlation_id.next())
-        self.sender.send(request)
-
-        def wakeup():
-            return self.response and (self.response.correlation_id == correlation_id)
+        future = ResponseFuture(self, correlation_id)
+        with self._lock:
+            self._pending[correlation_id] = future
+            self._outgoing.append((request, future))
+            driving = self._driving
+        if driving:
+            self.connection.wakeup()
+        return future
+
+    def _result(self, future: ResponseFuture, timeout: Union[None, Literal[False], float]) -> 'Message':
+        if timeout is False:
+            timeout = self.connection.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        lock = self._lock
+        try:
+            with lock:
+                while not future.done():
+                    if self._driving:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise Timeout("Connection %s timed out: Waiting for response" % self.connection.url)
+                        # woken when the response arrives or when it is this
+                        # thread's turn to process events
+                        self._waiting.append(future)
+                        lock.release()
+                        try:
+                            future._event.wait(remaining)
+                        finally:
+                            lock.acquire()
+                            self._waiting.remove(future)
+                            future._event.clear()
+                        continue
+                    self._driving = True
+                    lock.release()
+                    try:
+                        self._drive(future, deadline)
+                    finally:
+                        lock.acquire()
+                        self._driving = False
+                        for waiting in self._waiting:
+                            if not waiting.done():
+                                waiting._event.set()
+                                break
+        except Timeout as e:
+            self._complete(future, error=e)
+            raise
+        if future.error is not None:
+            raise future.error
+        return future.response
+
+    def _drive(self, future: ResponseFuture, deadline: Optional[float]) -> None:
+        # called by one waiting thread at a time, which alone uses the connection
+        while True:
+            self._send_outgoing()
+            self._check_sent()
+            if future.done():
+                return
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise Timeout("Connection %s timed out: Waiting for response" % self.connection.url)
+            self.connection.wait(lambda: future.done() or self._outgoing or (self._sent and self._sent[0][0].done()),
+                                 timeout=remaining, msg="Waiting for response")
+
+    def _send_outgoing(self) -> None:
+        while True:
+            with self._lock:
+                if not self._outgoing:
+                    return
+                request, future = self._outgoing.popleft()
+                if future.done():
+                    # abandoned before it was sent
+                    continue
+            self._sent.append((self.sender.send_async(request), future))
+
+    def _check_sent(self) -> None:
+        # requests are settled in the order sent, so failures are found
+        # without looking at every request in flight
+        sent = self._sent
+        while sent and sent[0][0].done():
+            delivery, future = sent.popleft()
+            try:
+                delivery.result()
+            except SendException as e:
+                self._complete(future, error=e)
 
-        self.connection.wait(wakeup, msg="Waiting for response")
-        response = self.response
-        self.response = None  # Ready for next response.
-        self.receiver.flow(1)  # Set up credit for the next response.
-        return response
+    def _complete(
+            self,
+            future: ResponseFuture,
+            response: Optional['Message'] = None,
+            error: Optional[Exception] = None
+    ) -> None:
+        with self._lock:
+            if self._pending.pop(future.correlation_id, None) is not None:
+                future.response = response
+                future.error = error
+                future._event.set()
 
     @property
     def reply_to(self) -> str:
         """
         The dynamic address of our receiver.
         """
-        return self.receiver.remote_source.address
+        return self._reply_to
 
     def on_message(self, event: 'Event') -> None:
         """
@@ -636,5 +1465,301 @@ class SyncRequestResponse(IncomingMessageHandler):
 
         :param event: The event which occurs when a message is received.
         """
-        self.response = event.message
+        self.response = message = event.message
+        future = self._pending.get(message.correlation_id)
+        if future is not None:
+            self._complete(future, response=message)
+        link = event.link
+        if link.credit <= self.credit // 2:
+            link.flow(self.credit - link.credit)
         self.connection.container.yield_()  # Wake up the wait() loop to handle the message.
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies, counted in buckets a quarter of a power of two
+    wide, so that percentiles are given to within 19%.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """
+        Count a latency.
+
+        :param seconds: The latency in seconds.
+        """
+        # bucket i holds latencies of up to 2 ** (i / 4) microseconds
+        index = math.ceil(4 * math.log2(max(seconds * 1e6, 1.0)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        """
+        The mean of the latencies counted, in seconds.
+        """
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        The latency in seconds which ``p`` percent of those counted do not
+        exceed, to within the width of a bucket.
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** (index / 4) / 1e6, self.max)
+        return self.max
+
+
+class AsyncRequestResponse(MessagingHandler):
+    """
+    Implementation of the request-response (aka RPC) pattern for
+    :mod:`asyncio`, the counterpart of :class:`SyncRequestResponse` for
+    coroutines.
+
+    The connection is processed by a container running in a thread of its
+    own, so that many calls can be awaited at once. All the calls share one
+    dynamic reply receiver, and responses are matched to requests by their
+    ``correlation_id``::
+
+        async with AsyncRequestResponse("localhost:5672", "examples") as client:
+            response = await client.call(Message(body="hello"), timeout=5)
+
+    :param url: The connection URL.
+    :param address: Address for all requests. If not specified, each request
+        must have the address property set.
+    :param max_outstanding: The most calls that may be awaiting responses at
+        once. Further calls wait for one of those to finish before sending
+        their requests.
+    :param credit: The number of responses the receiver is given credit
+        for, which is renewed as they arrive.
+    :param kwargs: Connection keyword arguments. See
+        :meth:`proton.reactor.Container.connect`. The connection is not
+        reconnected unless ``reconnect`` is given.
+    :ivar latency: A :class:`LatencyHistogram` of the time from sending
+        each request to receiving its response.
+    """
+
+    def __init__(
+            self,
+            url: Union[str, Url],
+            address: Optional[str] = None,
+            max_outstanding: int = 1024,
+            credit: int = 1024,
+            **kwargs
+    ) -> None:
+        super(AsyncRequestResponse, self).__init__(prefetch=credit)
+        self.url = url
+        self.address = address
+        self.max_outstanding = max_outstanding
+        self.latency = LatencyHistogram()
+        self.conn: Optional['Connection'] = None
+        self.sender: Optional['Sender'] = None
+        self.receiver: Optional['Receiver'] = None
+        kwargs.setdefault('reconnect', False)
+        self._kwargs = kwargs
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # the pending calls, outgoing requests and completed futures are
+        # shared by the event loop and the container thread
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._outgoing: Deque['Message'] = collections.deque()
+        self._completed: List[Tuple[asyncio.Future, Any, Optional[Exception]]] = []
+        self._waking = False
+        self._unsent: Deque['Message'] = collections.deque()
+        self._injector: Optional[EventInjector] = None
+        # set once the container thread has finished, after which requests
+        # can neither be sent nor be woken up for
+        self._stopped = False
+        self._reply_to: Optional[str] = None
+        self._opened: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def open(self) -> None:
+        """
+        Connect, and wait until requests can be sent.
+        """
+        self._loop = loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_outstanding)
+        self._injector = EventInjector()
+        self._stopped = False
+        self._opened = loop.create_future()
+        self._thread = threading.Thread(target=self._run, name="AsyncRequestResponse", daemon=True)
+        self._thread.start()
+        await self._opened
+
+    async def close(self) -> None:
+        """
+        Close the connection. Calls still awaiting responses fail with
+        :class:`proton.ConnectionException`.
+        """
+        if self._thread is None:
+            return
+        with self._lock:
+            stopped = self._stopped
+        if not stopped:
+            # the pipe is closed only below, once the thread has finished
+            self._injector.trigger(ApplicationEvent("rpc_close"))
+        await self._loop.run_in_executor(None, self._thread.join)
+        self._thread = None
+        for fd in self._injector.pipe:
+            os.close(fd)
+
+    async def __aenter__(self) -> 'AsyncRequestResponse':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def call(self, request: 'Message', timeout: Optional[float] = None) -> 'Message':
+        """
+        Send a request message and return the response message.
+
+        :param request: Request message. If ``self.address`` is not set the
+            request message address must be set and will be used. It must
+            not be changed until the call returns.
+        :param timeout: Timeout in seconds, or ``None`` for no timeout. When
+            it expires the request is abandoned and a response arriving
+            later is discarded. The time spent waiting for one of
+            ``max_outstanding`` calls to finish is not included.
+        :raise: :class:`proton.Timeout` if the timeout expires,
+            :class:`SendException` if the request was rejected or released,
+            or :class:`proton.ConnectionException` if the client is not open
+            or the connection was lost.
+        """
+        if not self.address and not request.address:
+            raise ValueError("Request message has no address: %s" % request)
+        if self._slots is None:
+            raise ConnectionException("Connection %s is not open" % self.url)
+        async with self._slots:
+            request.reply_to = self._reply_to
+            request.correlation_id = correlation_id = str(next(self._ids))
+            future = self._loop.create_future()
+            start = time.monotonic()
+            with self._lock:
+                if self._stopped:
+                    raise ConnectionException("Connection %s closed" % self.url)
+                self._pending[correlation_id] = future
+                self._outgoing.append(request)
+                wake = not self._waking
+                self._waking = True
+            if wake:
+                self._injector.trigger(ApplicationEvent("rpc_request"))
+            try:
+                response = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise Timeout("Connection %s timed out: Waiting for response" % self.url) from None
+            finally:
+                with self._lock:
+                    self._pending.pop(correlation_id, None)
+            self.latency.record(time.monotonic() - start)
+            return response
+
+    def _run(self) -> None:
+        try:
+            Container(self).run()
+        finally:
+            error = ConnectionException("Connection %s closed" % self.url)
+            with self._lock:
+                self._stopped = True
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for future in pending + [self._opened]:
+                self._complete(future, None, error)
+
+    def _complete(self, future: asyncio.Future, result: Any, error: Optional[Exception]) -> None:
+        # called in the container thread; futures are completed in batches
+        # by the event loop
+        with self._lock:
+            self._completed.append((future, result, error))
+            wake = len(self._completed) == 1
+        if wake:
+            self._loop.call_soon_threadsafe(self._deliver)
+
+    def _deliver(self) -> None:
+        with self._lock:
+            completed = self._completed
+            self._completed = []
+        for future, result, error in completed:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _send(self) -> None:
+        sender = self.sender
+        unsent = self._unsent
+        while unsent and sender.credit:
+            request = unsent.popleft()
+            correlation_id = request.correlation_id
+            if correlation_id in self._pending:
+                sender.send(request)._correlation_id = correlation_id
+
+    def _fail(self, delivery: Delivery) -> None:
+        correlation_id = getattr(delivery, '_correlation_id', None)
+        with self._lock:
+            future = self._pending.pop(correlation_id, None)
+        if future is not None:
+            self._complete(future, None, SendException(delivery.remote_state))
+
+    def on_start(self, event: 'Event') -> None:
+        container = event.container
+        container.selectable(self._injector)
+        self.conn = container.connect(self.url, **self._kwargs)
+        self.sender = container.create_sender(self.conn, self.address)
+        self.receiver = container.create_receiver(self.conn, None, dynamic=True)
+
+    def on_link_opened(self, event: 'Event') -> None:
+        if event.link.is_receiver:
+            self._reply_to = event.link.remote_source.address
+            self._complete(self._opened, None, None)
+
+    def on_rpc_request(self, event: 'Event') -> None:
+        with self._lock:
+            outgoing = self._outgoing
+            self._outgoing = collections.deque()
+            self._waking = False
+        self._unsent.extend(outgoing)
+        self._send()
+
+    def on_rpc_close(self, event: 'Event') -> None:
+        if self.conn is not None:
+            self.conn.close()
+        self._injector.close()
+
+    def on_sendable(self, event: 'Event') -> None:
+        self._send()
+
+    def on_message(self, event: 'Event') -> None:
+        message = event.message
+        with self._lock:
+            future = self._pending.pop(message.correlation_id, None)
+        if future is not None:
+            self._complete(future, message, None)
+
+    def on_rejected(self, event: 'Event') -> None:
+        self._fail(event.delivery)
+
+    def on_released(self, event: 'Event') -> None:
+        self._fail(event.delivery)
+
+    def on_transport_closed(self, event: 'Event') -> None:
+        if not self._kwargs['reconnect']:
+            # stop the container, failing the calls in progress
+            self._injector.close()
@@ -18,6 +18,7 @@
 #
 
 from typing import Any, Callable, Optional
+from weakref import WeakValueDictionary
 
 from cproton import addressof, pn_incref, pn_decref, \
     pn_record_get_py, pn_record_def_py, pn_record_set_py
@@ -25,36 +26,28 @@ from cproton import addressof, pn_incref, pn_decref, \
 from ._exceptions import ProtonException
 
 
-class EmptyAttrs:
-
-    def __contains__(self, name):
-        return False
-
-    def __getitem__(self, name):
-        raise KeyError(name)
-
-    def __setitem__(self, name, value):
-        raise TypeError("does not support item assignment")
-
-
-EMPTY_ATTRS = EmptyAttrs()
-
-
 class Wrapper(object):
     """ Wrapper for python objects that need to be stored in event contexts and be retrieved again from them
         Quick note on how this works:
-        The actual *python* object has only 3 attributes which redirect into the wrapped C objects:
+        The wrapped C object carries a special pn_record_t holding a PYCTX which is a python dict. That dict
+        is used as the instance dictionary (``__dict__``) of every python wrapper of the C object, so all
+        attributes set on any wrapper are stored with the C object and shared by all of its wrappers, while
+        still being read and written at normal attribute speed. It always contains:
         _impl   The wrapped C object itself
-        _attrs  This is a special pn_record_t holding a PYCTX which is a python dict
-                every attribute in the python object is actually looked up here
 
         Because the objects actual attributes are stored away they must be initialised *after* the wrapping
         is set up. This is the purpose of the _init method in the wrapped  object. Wrapper.__init__ will call
         eht subclass _init to initialise attributes. So they *must not* be initialised in the subclass __init__
         before calling the superclass (Wrapper) __init__ or they will not be accessible from the wrapper at all.
 
+        Subclasses may set _wrapper_cache to a WeakValueDictionary keyed by the address of the C object. Every
+        wrapper is then recorded there so that their wrap method can hand back the existing python object for
+        a C object instead of building a new wrapper each time it crosses the FFI boundary.
+
     """
 
+    _wrapper_cache: Optional['WeakValueDictionary[int, Wrapper]'] = None
+
     def __init__(
             self,
             impl: Any = None,
@@ -67,7 +60,6 @@ class Wrapper(object):
             impl = constructor()
             if impl is None:
                 self.__dict__["_impl"] = impl
-                self.__dict__["_attrs"] = EMPTY_ATTRS
                 raise ProtonException(
                     "Wrapper failed to create wrapped object. Check for file descriptor or memory exhaustion.")
             init = True
@@ -83,48 +75,43 @@ class Wrapper(object):
                 pn_record_def_py(record)
                 pn_record_set_py(record, attrs)
                 init = True
+            attrs["_impl"] = impl
+            self.__dict__ = attrs
         else:
-            attrs = EMPTY_ATTRS
+            self.__dict__["_impl"] = impl
             init = False
-        self.__dict__["_impl"] = impl
-        self.__dict__["_attrs"] = attrs
+        cache = self._wrapper_cache
+        if cache is not None:
+            cache[addressof(impl)] = self
         if init:
             self._init()
 
-    def __getattr__(self, name: str) -> Any:
-        attrs = self.__dict__["_attrs"]
-        if name in attrs:
-            return attrs[name]
-        else:
-            raise AttributeError(name + " not in _attrs")
-
-    def __setattr__(self, name: str, value: Any) -> None:
-        if hasattr(self.__class__, name):
-            object.__setattr__(self, name, value)
-        else:
-            attrs = self.__dict__["_attrs"]
-            attrs[name] = value
-
-    def __delattr__(self, name: str) -> None:
-        attrs = self.__dict__["_attrs"]
-        if attrs:
-            del attrs[name]
-
     def __hash__(self) -> int:
         return hash(addressof(self._impl))
 
     def __eq__(self, other: Any) -> bool:
+        if other is self:
+            return True
         if isinstance(other, Wrapper):
             return addressof(self._impl) == addressof(other._impl)
         return False
 
     def __ne__(self, other: Any) -> bool:
+        if other is self:
+            return False
         if isinstance(other, Wrapper):
             return addressof(self._impl) != addressof(other._impl)
         return True
 
     def __del__(self) -> None:
-        pn_decref(self._impl)
+        impl = self._impl
+        cache = self._wrapper_cache
+        if cache is not None and impl is not None:
+            # Forget this wrapper before the C object can be freed and its address reused
+            key = addressof(impl)
+            if cache.get(key) is self:
+                del cache[key]
+        pn_decref(impl)
 
     def __repr__(self) -> str:
         return '<%s.%s 0x%x ~ 0x%x>' % (self.__class__.__module__,
@@ -20,7 +20,7 @@
 from ._handlers import MessagingHandler, IncomingMessageHandler, OutgoingMessageHandler, \
     EndpointStateHandler, TransactionHandler, TransactionalClientHandler,\
     Reject, Release,\
-    Handshaker, FlowController, IOHandler, PythonIO
+    Handshaker, FlowController, AdaptiveFlowController, IOHandler, PythonIO
 
 __all__ = [
     'MessagingHandler',
@@ -33,6 +33,7 @@ __all__ = [
     'Release',
     'Handshaker',
     'FlowController',
+    'AdaptiveFlowController',
     'IOHandler',
     'PythonIO'
 ]
@@ -17,13 +17,18 @@
 # under the License.
 #
 
-from ._utils import BlockingConnection, BlockingSender, BlockingReceiver, SyncRequestResponse, SendException, LinkDetached, ConnectionClosed
+from ._utils import AsyncRequestResponse, BlockingConnection, BlockingSender, BlockingReceiver, DeliveryFuture, \
+    LatencyHistogram, ResponseFuture, SyncRequestResponse, SendException, LinkDetached, ConnectionClosed
 
 __all__ = [
     'BlockingConnection',
     'BlockingSender',
     'BlockingReceiver',
+    'DeliveryFuture',
     'SyncRequestResponse',
+    'ResponseFuture',
+    'AsyncRequestResponse',
+    'LatencyHistogram',
     'SendException',
     'LinkDetached',
     'ConnectionClosed'
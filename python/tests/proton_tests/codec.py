@@ -471,6 +471,28 @@ class DataTest(Test):
         dst.copy(self.data)
         assert dst.format() == self.data.format()
 
+    def testEncodeInto(self):
+        self.data.put_object({symbol("key"): [1, 2, 3], u"desc": u"value"})
+        enc = self.data.encode()
+        size = self.data.encoded_size()
+        assert size == len(enc)
+        buff = bytearray(size + 8)
+        assert self.data.encode_into(buff) == size
+        assert buff[:size] == enc
+        view = memoryview(bytearray(size))
+        assert self.data.encode_into(view) == size
+        assert view.tobytes() == enc
+        try:
+            self.data.encode_into(bytearray(size - 1))
+            assert False, "expected overflow"
+        except DataException:
+            pass
+        try:
+            self.data.encode_into(bytes(size))
+            assert False, "expected a writable buffer to be required"
+        except BufferError:
+            pass
+
     def testRoundTrip(self):
         obj = {symbol("key"): timestamp(1234),
                ulong(123): "blah",
@@ -488,6 +510,126 @@ class DataTest(Test):
         copy = data.get_object()
         assert copy == obj, (copy, obj)
 
+    def testFixedWidthArrayRoundTrip(self):
+        arrays = [Array(UNDESCRIBED, Data.UBYTE, *[ubyte(v) for v in self.int_values("ubyte")]),
+                  Array(UNDESCRIBED, Data.BYTE, *[byte(v) for v in self.int_values("byte")]),
+                  Array(UNDESCRIBED, Data.USHORT, *[ushort(v) for v in self.int_values("ushort")]),
+                  Array(UNDESCRIBED, Data.SHORT, *[short(v) for v in self.int_values("short")]),
+                  Array(UNDESCRIBED, Data.UINT, *[uint(v) for v in self.int_values("uint")]),
+                  Array(UNDESCRIBED, Data.INT, *[int32(v) for v in self.int_values("int")]),
+                  Array(UNDESCRIBED, Data.ULONG, *[ulong(v) for v in self.int_values("ulong")]),
+                  Array(UNDESCRIBED, Data.LONG, *self.int_values("long")),
+                  Array(UNDESCRIBED, Data.FLOAT, float32(1.5), float32(-2.25)),
+                  Array(UNDESCRIBED, Data.DOUBLE, 1.5, -2.25, 1e300),
+                  Array(UNDESCRIBED, Data.TIMESTAMP, timestamp(0), timestamp(1234)),
+                  Array(UNDESCRIBED, Data.INT)]
+        # Arrays first in a list, after a sibling in a list and at the root
+        for obj in [arrays, ["first"] + arrays] + arrays:
+            self.data.clear()
+            self.data.put_object(obj)
+            data = Data()
+            data.decode(self.data.encode())
+            data.rewind()
+            assert data.next()
+            copy = data.get_object()
+            assert copy == obj, (copy, obj)
+            if isinstance(obj, Array):
+                assert [type(e) for e in copy.elements] == [type(e) for e in obj.elements]
+
+    def testFloatArrayOutOfRange(self):
+        # values too large for a float are stored as infinity, as when
+        # encoded element by element
+        self.data.put_object(Array(UNDESCRIBED, Data.FLOAT, float32(1e300), float32(-1e300), float32(1.5)))
+        data = Data()
+        data.decode(self.data.encode())
+        data.rewind()
+        assert data.next()
+        copy = data.get_object()
+        assert list(copy.elements) == [float("inf"), float("-inf"), 1.5], copy.elements
+
+    def testCompactLists(self):
+        values = [list(range(100)),
+                  [v * 300 for v in range(100)],
+                  [v * 100000 for v in range(100)],
+                  [v * 2**40 for v in range(100)],
+                  [v * 0.5 for v in range(100)]]
+        types = [Data.BYTE, Data.SHORT, Data.INT, Data.LONG, Data.DOUBLE]
+        for v, t in zip(values, types):
+            self.data.clear()
+            self.data.put_object(v)
+            plain = self.data.encode()
+            self.data.clear()
+            self.data.compact_lists = True
+            self.data.put_object(v)
+            self.data.compact_lists = False
+            compact = self.data.encode()
+            assert len(compact) < len(plain), (t, len(compact), len(plain))
+
+            data = Data()
+            data.decode(compact)
+            data.rewind()
+            assert data.next() == Data.ARRAY
+            assert data.get_array() == (len(v), False, t), data.get_array()
+            data.arrays_as_lists = True
+            copy = data.get_object()
+            assert type(copy) is list
+            assert copy == v, (copy, v)
+            assert set(type(e) for e in copy) == set(type(e) for e in v)
+
+    def testCompactListsUnsuitable(self):
+        self.data.compact_lists = True
+        for v in [[], [1, 2.0], [True, False], ["one", "two"],
+                  [symbol("one")], [1, 2**40], [1.0, None]]:
+            self.data.clear()
+            self.data.put_object(v)
+            self.data.rewind()
+            assert self.data.next() == Data.LIST, v
+            assert self.data.get_object() == v
+
+    def testArraysAsListsDescribed(self):
+        a = Array(symbol("desc"), Data.INT, 1, 2, 3)
+        self.data.put_object(a)
+        self.data.rewind()
+        self.data.next()
+        self.data.arrays_as_lists = True
+        assert self.data.get_object() == a
+
+    def _numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise common.Skipped("numpy not available")
+        return numpy
+
+    def testNdarrayRoundTrip(self):
+        numpy = self._numpy()
+        for dtype in ('u1', 'i1', '<u2', '>i2', 'u4', 'i4', 'u8', 'i8', 'f4', '<f8', '>f8'):
+            a = numpy.arange(-5, 100).astype(dtype)
+            self.data.clear()
+            self.data.put_object(["before", a, "after"])
+            data = Data()
+            data.decode(self.data.encode())
+            data.rewind()
+            assert data.next() == Data.LIST
+            data.enter()
+            data.next()
+            assert data.next() == Data.ARRAY
+            copy = data.get_ndarray()
+            assert copy.dtype.newbyteorder('=') == a.dtype.newbyteorder('='), (copy.dtype, a.dtype)
+            assert (copy == a).all(), (copy, a)
+            assert list(data.get_object()) == a.tolist()
+            assert data.next() == Data.STRING
+            assert data.get_string() == "after"
+
+    def testNdarrayErrors(self):
+        numpy = self._numpy()
+        self.assertRaises(DataException, self.data.put_ndarray, numpy.zeros((2, 2)))
+        self.assertRaises(DataException, self.data.put_ndarray, numpy.zeros(2, dtype=complex))
+        self.data.put_object(Array(UNDESCRIBED, Data.STRING, "one"))
+        self.data.rewind()
+        self.data.next()
+        assert self.data.get_ndarray() is None
+
     def testBuffer(self):
         try:
             self.data.put_object(buffer(b"foo"))
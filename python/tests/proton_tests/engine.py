@@ -19,8 +19,12 @@
 
 import os
 import gc
+import itertools
 from time import time, sleep
 from proton import *
+from cproton import addressof, retained_count, retained_count_by_type
+from proton.handlers import AdaptiveFlowController, FlowController, IncomingMessageHandler, OutgoingMessageHandler, \
+    Reject, Release
 from proton.reactor import Container
 from . import common
 from .common import pump, Skipped
@@ -877,6 +881,100 @@ class TransferTest(Test):
         binary = self.rcv.recv(1024)
         assert binary is None
 
+    def test_recv_into(self):
+        self.rcv.flow(1)
+        self.snd.delivery("tag")
+        msg = b"this is a test"
+        self.snd.send(msg)
+        self.snd.advance()
+        self.pump()
+
+        buff = bytearray(32)
+        n = self.rcv.recv_into(memoryview(buff)[:4])
+        assert n == 4, n
+        n = self.rcv.recv_into(memoryview(buff)[4:])
+        assert n == len(msg) - 4, n
+        assert buff[:len(msg)] == msg, buff
+        assert self.rcv.recv_into(buff) is None
+
+    def test_stream_buffers(self):
+        import mmap
+        import tempfile
+        payload = bytes(range(256)) * 64
+        with tempfile.TemporaryFile() as src, tempfile.TemporaryFile() as dst:
+            src.write(payload)
+            src.flush()
+            dst.truncate(len(payload))
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as smap, \
+                    mmap.mmap(dst.fileno(), 0) as dmap:
+                self.rcv.flow(1)
+                self.snd.delivery("tag")
+                # a view over ints is sent as all of its bytes
+                view = memoryview(smap).cast("I")
+                assert self.snd.stream(view[:16]) == 64
+                view.release()
+                chunk = 4096
+                for offset in range(64, len(payload), chunk):
+                    n = self.snd.stream(memoryview(smap)[offset:offset + chunk])
+                    assert n == min(chunk, len(payload) - offset), n
+                self.snd.advance()
+                self.pump()
+
+                out = memoryview(dmap)
+                received = 0
+                while True:
+                    n = self.rcv.recv_into(out[received:received + chunk])
+                    if not n:
+                        break
+                    received += n
+                out.release()
+                assert received == len(payload), received
+                assert dmap[:] == payload
+
+    def test_steady_state_buffers(self):
+        import tracemalloc
+        body = b"x" * 65536
+        count = 50
+        self.rcv.flow(2 * count)
+        buff = bytearray(2 * len(body))
+        tags = ["tag-%s" % i for i in range(2 * count)]
+
+        def transfer(i):
+            msg = Message(body=body)
+            msg.send(self.snd, tags[i]).settle()
+            self.pump(1024)
+            dlv = self.rcv.current
+            n = self.rcv.recv_into(buff)
+            assert n > len(body), n
+            self.rcv.advance()
+            dlv.settle()
+
+        # warm up so that the per link encode buffer is allocated
+        transfer(0)
+        tracemalloc.start()
+        try:
+            for i in range(1, count):
+                transfer(i)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # a per message copy of the encoded message would show up here
+        assert peak < len(body) // 2, peak
+
+    def test_large_message_buffers(self):
+        from proton._handlers import recv_msg
+        self.rcv.flow(2)
+        for i, body in enumerate([b"x" * (4 << 20), b"y" * 1000]):
+            Message(body=body).send(self.snd, "tag-%s" % i).settle()
+            self.pump(1 << 20)
+            message = recv_msg(self.rcv.current)
+            assert message.body == body
+            # the buffers kept by the links are no larger than 1 MiB
+            for buff in (getattr(self.snd, '_encode_buffer', None), getattr(self.rcv, '_recv_buffer', None)):
+                assert buff is None or len(buff) <= 1 << 20, len(buff)
+        assert self.snd._encode_buffer is not None
+        assert self.rcv._recv_buffer is not None
+
     def test_multiframe_abort(self):
         self.rcv.flow(1)
         sd = self.snd.delivery("tag")
@@ -975,6 +1073,33 @@ class TransferTest(Test):
         assert sd.local_state == rd.remote_state == Delivery.ACCEPTED
         sd.settle()
 
+    def test_delivery_tags(self):
+        self.rcv.flow(300)
+        generated = [self.snd.delivery_tag() for i in range(257)]
+        deliveries = [Message(body=i).send(self.snd, tag) for i, tag in enumerate(generated)]
+        tags = [d.tag for d in deliveries]
+        assert tags == generated
+        # tags are str whether or not they are valid UTF-8
+        assert set(type(tag) for tag in tags) == {str}
+        assert tags[:2] == ["\x01", "\x02"], tags[:2]
+        assert tags[126:128] == ["\x7f", "\udc80"], tags[126:128]
+        assert tags[254:] == ["\udcff", "\x01\x00", "\x01\x01"], tags[254:]
+        assert [d.binary_tag for d in deliveries[126:128]] == [b"\x7f", b"\x80"]
+        assert len(set(tags)) == len(tags)
+        self.pump()
+        received = []
+        while self.rcv.current:
+            received.append((self.rcv.current.tag, self.rcv.current.binary_tag))
+            self.rcv.advance()
+        assert received == [(d.tag, d.binary_tag) for d in deliveries]
+        # a tag that happens to be valid multi-byte UTF-8 is a str too
+        assert self.snd.delivery("\udcc3\udca9").binary_tag == b"\xc3\xa9"
+        assert self.snd.delivery(b"\xc3\xa9").tag == "\xe9"
+
+        snd = self.snd.session.sender("text-tags")
+        snd.compact_tags = False
+        assert [snd.delivery_tag() for i in range(3)] == ["1", "2", "3"]
+
     def test_delivery_id_ordering(self):
         self.rcv.flow(1024)
         self.pump(buffer_size=64 * 1024)
@@ -2382,6 +2507,59 @@ class DeliveryTest(Test):
         self.testDisposition(type=0x12345, value=CustomValue([1, 2, 3]))
 
 
+class WrapperCacheTest(Test):
+
+    def tearDown(self):
+        self.cleanup()
+        gc.collect()
+
+    def testIdentity(self):
+        snd, rcv = self.link("test-link")
+        ssn = snd.session
+        conn = snd.connection
+        assert Connection.wrap(conn._impl) is conn
+        assert ssn.connection is conn
+        assert ssn.sender("test-link") is not snd
+        assert conn.session_head(0) is ssn
+        assert Link.wrap(snd._impl) is snd
+        assert Link.wrap(rcv._impl) is rcv
+        assert isinstance(Link.wrap(rcv._impl), Receiver)
+        dlv = snd.delivery("tag")
+        assert snd.current is dlv
+        assert dlv.link is snd
+        snd.user_data = "kept"
+        assert Link.wrap(snd._impl).user_data == "kept"
+
+    def testSharedAttributes(self):
+        snd, rcv = self.link("test-link")
+        handler = Handler()
+        snd.handler = handler
+        snd.user_data = "shared"
+        other = Sender(snd._impl)
+        assert other is not snd
+        assert other.handler is handler
+        assert other.user_data == "shared"
+        other.user_data = "changed"
+        assert snd.user_data == "changed"
+        del other.user_data
+        assert not hasattr(snd, "user_data")
+        dlv = snd.delivery("tag")
+        dlv.encoded = b"data"
+        assert Delivery(dlv._impl).encoded == b"data"
+        assert Delivery(dlv._impl) == dlv
+
+    def testExpiry(self):
+        snd, rcv = self.link("test-link")
+        dlv = snd.delivery("tag")
+        address = addressof(dlv._impl)
+        assert Delivery._wrapper_cache[address] is dlv
+        del dlv
+        gc.collect()
+        assert address not in Delivery._wrapper_cache
+        dlv = snd.current
+        assert Delivery._wrapper_cache[address] is dlv
+
+
 class CollectorTest(Test):
 
     def setUp(self):
@@ -2421,6 +2599,53 @@ class CollectorTest(Test):
         etypes = tuple([e.type for e in events[-len(types):]])
         assert etypes == types, "actual events %s did not end in expect sequence: %s" % (events, types)
 
+    def dispatch(self, *handlers, pump=True):
+        # passes each collected event to the handlers in turn, having sent
+        # what the connections have to send, and sends what they then have
+        if pump:
+            self.pump()
+        events = self.drain()
+        for event in events:
+            for handler in handlers:
+                event.dispatch(handler)
+        if pump:
+            self.pump()
+        return events
+
+
+class ReceiveTest(CollectorTest):
+    """
+    Tests of the handling of deliveries on a link opened by setUp, whose
+    receiver has ``credit`` and events collected.
+    """
+
+    credit = 10
+
+    def setUp(self):
+        CollectorTest.setUp(self)
+        self.snd, self.rcv = self.link("test-link")
+        self.rcv.connection.collect(self.collector)
+        self.snd.open()
+        self.rcv.open()
+        if self.credit:
+            self.rcv.flow(self.credit)
+        self.pump()
+
+    def tearDown(self):
+        self.cleanup()
+
+
+class BodyRecorder(Handler):
+    """Records the bodies of the messages received."""
+
+    def __init__(self):
+        self.received = []
+
+    def on_message(self, event):
+        body = event.message.body
+        # binary bodies are views of the received message
+        self.received.append(bytes(body) if isinstance(body, memoryview) else body)
+
 
 class EventTest(CollectorTest):
 
@@ -2637,6 +2862,807 @@ class EventTest(CollectorTest):
         self.expect_until(Event.LINK_REMOTE_DETACH)
 
 
+class MessagePoolTest(ReceiveTest):
+
+    def testIncomingMessagePool(self):
+        received = []
+
+        class Recorder(Handler):
+            def on_message(self, event):
+                received.append((id(event.message), event.message.body))
+
+        pool = MessagePool(4)
+        handler = IncomingMessageHandler(delegate=Recorder(), message_pool=pool)
+        for i in range(5):
+            Message(body=i, subject="msg-%d" % i).send(self.snd)
+            self.dispatch(handler)
+
+        assert [body for _, body in received] == list(range(5)), received
+        assert len(set(ident for ident, _ in received)) == 1, received
+        assert pool.created == 1
+        assert len(pool) == 1
+
+    def testPoolOnError(self):
+        class Failing(Handler):
+            def on_message(self, event):
+                raise ValueError(event.message.body)
+
+        pool = MessagePool(4)
+        handler = IncomingMessageHandler(delegate=Failing(), message_pool=pool, compression=Compression())
+        # the message is returned to the pool when the application raises
+        # and when the body cannot be decompressed
+        for message in [Message(body=0), Message(body=b"corrupt", content_encoding="deflate"), Message(body=1)]:
+            message.send(self.snd)
+            self.pump()
+            for event in self.drain():
+                try:
+                    event.dispatch(handler)
+                except ValueError:
+                    pass
+        assert pool.created == 1
+        assert len(pool) == 1
+
+
+class CompressionTest(ReceiveTest):
+
+    def testSendReceive(self):
+        self.snd.compression = Compression(threshold=100)
+        recorder = BodyRecorder()
+        handler = IncomingMessageHandler(delegate=recorder, compression=Compression())
+        bodies = [b"small", "large " * 100, b"bytes" * 100]
+        for body in bodies:
+            Message(body=body).send(self.snd)
+            self.dispatch(handler)
+        assert recorder.received == bodies, recorder.received
+        assert self.snd.compression.raw_bytes == 500
+        assert self.snd.compression.ratio > 10
+
+    def testUndecodable(self):
+        recorder = BodyRecorder()
+        handler = IncomingMessageHandler(delegate=recorder, compression=Compression())
+        deliveries = [Message(body=b"\xff\xfe", content_encoding="gzip").send(self.snd),
+                      Message(body=b"not compressed", content_encoding="deflate", inferred=True).send(self.snd)]
+        self.dispatch(handler)
+        # a binary value section body is passed on as it is, and a corrupt
+        # data section rejected
+        assert recorder.received == [b"\xff\xfe"], recorder.received
+        assert deliveries[0].remote_state == Delivery.ACCEPTED
+        assert deliveries[1].remote_state == Delivery.REJECTED
+        assert deliveries[1].remote.condition.name == "amqp:decode-error"
+
+
+class BatchAckTest(ReceiveTest):
+
+    credit = 20
+
+    def testBatchAcks(self):
+        dispositions = []
+        self.rcv.transport.trace(Transport.TRACE_FRM)
+        self.rcv.transport.tracer = lambda t, frame: "-> @disposition" in frame and dispositions.append(frame)
+        handler = IncomingMessageHandler(batch_acks=4)
+        deliveries = []
+        for i in range(10):
+            deliveries.append(Message(body=i).send(self.snd))
+            self.dispatch(handler)
+        assert [d.remote_state for d in deliveries] == [Delivery.ACCEPTED] * 8 + [0] * 2, [d.remote_state for d in deliveries]
+        assert all(d.settled for d in deliveries[:8])
+        assert len(dispositions) == 2, dispositions
+        handler.flush_acks()
+        self.pump()
+        assert all(d.settled for d in deliveries)
+        assert len(dispositions) == 3, dispositions
+        for i in range(3):
+            deliveries.append(Message(body=i).send(self.snd))
+        self.dispatch(handler)
+        assert not any(d.settled for d in deliveries[10:])
+        self.rcv.close()
+        self.dispatch(handler)
+        assert all(d.remote_state == Delivery.ACCEPTED for d in deliveries[10:])
+        assert len(dispositions) == 4, dispositions
+
+
+class OutboxTest(CollectorTest):
+
+    def setUp(self):
+        import tempfile
+        super(OutboxTest, self).setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cleanup()
+        self.tmp.cleanup()
+
+    def received(self, rcv):
+        bodies = []
+        while rcv.current:
+            msg = Message()
+            msg.decode(rcv.recv(rcv.current.pending))
+            bodies.append(msg.body)
+            rcv.advance()
+        return bodies
+
+    def testEnqueue(self):
+        snd, rcv = self.link("test-link")
+        snd.connection.collect(self.collector)
+        snd.open()
+        rcv.open()
+        self.pump()
+        sendable = []
+
+        class Recorder(Handler):
+            def on_sendable(self, event):
+                sendable.append(event.link.credit)
+        handler = OutgoingMessageHandler(delegate=Recorder())
+        msg = Message()
+        for i in range(3):
+            msg.body = i
+            assert snd.enqueue(msg) is None
+        snd.enqueue(Message(body=3).encode())
+        assert len(snd.outbox) == 4
+        assert snd.queued == 0
+
+        rcv.flow(2)
+        self.dispatch(handler)
+        # the outbox goes before the application
+        assert len(snd.outbox) == 2
+        assert sendable == []
+        assert self.received(rcv) == [0, 1]
+
+        rcv.flow(3)
+        self.dispatch(handler)
+        assert not snd.outbox
+        assert snd.outbox.bytes == 0
+        assert sendable == [1], sendable
+        # with credit and an empty outbox messages are sent at once
+        dlv = snd.enqueue(Message(body=4))
+        assert dlv is not None and dlv.link == snd
+        self.pump()
+        assert self.received(rcv) == [2, 3, 4]
+
+    def testLimits(self):
+        snd, rcv = self.link("test-link")
+        snd.outbox = Outbox(max_messages=2)
+        snd.enqueue(Message(body=0))
+        snd.enqueue(Message(body=1))
+        self.assertRaises(OutboxFull, snd.enqueue, Message(body=2))
+        snd.outbox.clear()
+
+        snd.outbox = Outbox(max_messages=None, max_bytes=100, policy=Outbox.DROP)
+        # a large message is taken by an empty outbox
+        assert snd.outbox.put(b"x" * 200)
+        assert not snd.outbox.put(b"y")
+        snd.outbox.get()
+        for i in range(10):
+            snd.enqueue(b"x" * 30)
+        assert len(snd.outbox) == 3
+        assert snd.outbox.bytes == 90
+        assert snd.outbox.dropped == 8
+        self.assertRaises(ValueError, Outbox, policy="wait")
+
+    def settle(self, rcv, state=Delivery.ACCEPTED):
+        bodies = []
+        while rcv.current:
+            dlv = rcv.current
+            msg = Message()
+            msg.decode(rcv.recv(dlv.pending))
+            bodies.append((dlv.tag, msg.body))
+            rcv.advance()
+            dlv.update(state)
+            dlv.settle()
+        return bodies
+
+    def testDurable(self):
+        directory = self.tmp.name
+        snd, rcv = self.link("test-link")
+        snd.connection.collect(self.collector)
+        snd.open()
+        rcv.open()
+        self.pump()
+        handler = OutgoingMessageHandler()
+        snd.outbox = outbox = DurableOutbox(directory)
+        for i in range(5):
+            snd.enqueue(Message(body=i), tag="t%d" % i if i == 2 else None)
+        assert len(outbox) == 5 and outbox.unsettled == 5
+        outbox.close()
+
+        # the messages are recovered by a new outbox
+        snd.outbox = outbox = DurableOutbox(directory)
+        assert len(outbox) == 5
+        rcv.flow(3)
+        self.dispatch(handler)
+        assert outbox.syncs == 0
+        received = self.settle(rcv)
+        assert [body for tag, body in received] == [0, 1, 2], received
+        assert received[2][0] == "t2"
+        self.dispatch(handler)
+        assert len(outbox) == 2 and outbox.unsettled == 2
+        # a released message is sent again
+        rcv.flow(1)
+        self.dispatch(handler)
+        assert self.settle(rcv, Delivery.RELEASED)[0][1] == 3
+        self.dispatch(handler)
+        assert len(outbox) == 2
+        rcv.flow(10)
+        self.dispatch(handler)
+        assert [body for tag, body in self.settle(rcv)] == [3, 4]
+        self.dispatch(handler)
+        assert not outbox and outbox.unsettled == 0
+
+        # messages are stored before they are sent
+        snd.enqueue(Message(body=5))
+        assert outbox.syncs == 1
+        assert not outbox and outbox.unsettled == 1
+        self.pump()
+        # messages sent and not settled are sent again after a restart
+        outbox.close()
+        outbox = DurableOutbox(directory)
+        assert len(outbox) == 1
+        outbox.close()
+
+    def testDurableSegments(self):
+        directory = self.tmp.name
+        snd, rcv = self.link("test-link")
+        snd.connection.collect(self.collector)
+        snd.open()
+        rcv.open()
+        self.pump()
+        handler = OutgoingMessageHandler()
+
+        def logs():
+            return sorted(name for name in os.listdir(directory) if name.endswith(".log"))
+        snd.outbox = outbox = DurableOutbox(directory, segment_messages=4, compact_ratio=None)
+        for i in range(10):
+            snd.enqueue(Message(body=i))
+        assert len(logs()) == 3, logs()
+        # settled segments are deleted
+        rcv.flow(5)
+        self.dispatch(handler)
+        received = self.settle(rcv)
+        assert [body for tag, body in received] == [0, 1, 2, 3, 4], received
+        self.dispatch(handler)
+        assert len(logs()) == 2, logs()
+        # the unsettled messages of a segment are moved to the newest
+        outbox.compact(0.75)
+        assert logs() == ["%020d.log" % 2, "%020d.log" % 3], logs()
+        outbox.close()
+        snd.outbox = outbox = DurableOutbox(directory, segment_messages=4)
+        assert outbox.unsettled == 5
+        rcv.flow(10)
+        self.dispatch(handler)
+        assert [body for tag, body in self.settle(rcv)] == [5, 6, 7, 8, 9]
+        self.dispatch(handler)
+        assert outbox.unsettled == 0
+        outbox.close()
+
+    def testDurableShortWrites(self):
+        import errno
+        from proton import _outbox
+        directory = self.tmp.name
+        outbox = DurableOutbox(directory)
+        write = os.write
+        full = []
+
+        def short_write(fd, data):
+            # a few bytes at a time, then no room at all
+            if full:
+                write(fd, data[:3])
+                raise OSError(errno.ENOSPC, "No space left on device")
+            return write(fd, data[:7])
+        _outbox.os.write = short_write
+        try:
+            outbox.put(b"first")
+            full.append(True)
+            try:
+                outbox.put(b"second")
+                assert False, "expected OSError"
+            except OSError:
+                pass
+        finally:
+            _outbox.os.write = write
+        outbox.put(b"third")
+        assert outbox.unsettled == 2
+        assert [outbox.get()[1] for i in range(2)] == [b"first", b"third"]
+        outbox.close()
+        outbox = DurableOutbox(directory)
+        assert [outbox.get()[1] for i in range(2)] == [b"first", b"third"]
+        outbox.close()
+
+
+class DuplicateFilterTest(ReceiveTest):
+
+    credit = 20
+
+    def testFilter(self):
+        received = []
+        duplicates = []
+
+        class Recorder(Handler):
+            def on_message(self, event):
+                received.append((event.message.id, event.possible_duplicate))
+                if event.message.body == "modify":
+                    raise Release()
+                if event.message.body == "release":
+                    handler.release(event.delivery, delivered=False)
+                else:
+                    handler.accept(event.delivery)
+
+            def on_duplicate(self, event):
+                duplicates.append(event.message.id)
+
+        handler = IncomingMessageHandler(auto_accept=False, delegate=Recorder(),
+                                         duplicate_filter=DuplicateFilter(window=2, bloom_capacity=100))
+        deliveries = []
+        # 2 is forgotten by the exact window but not the Bloom filter, and
+        # 4 is remembered only once accepted
+        for id, body in [(1, ""), (2, ""), (1, ""), (3, ""), (2, ""), (4, "release"), (4, "modify"), (4, ""),
+                         (4, "")]:
+            deliveries.append(Message(id=id, body=body).send(self.snd))
+            self.dispatch(handler)
+        assert received == [(1, False), (2, False), (3, False), (2, True), (4, False), (4, False), (4, False)], \
+            received
+        assert duplicates == [1, 4]
+        states = [d.remote_state for d in deliveries]
+        assert states == [Delivery.ACCEPTED] * 5 + [Delivery.RELEASED, Delivery.MODIFIED] + [Delivery.ACCEPTED] * 2, \
+            states
+
+
+class ByteCreditTest(ReceiveTest):
+
+    # credit is issued by the flow controllers
+    credit = 0
+
+    def send(self, snd, count, size):
+        for i in range(count):
+            dlv = snd.delivery("%s-%s" % (size, i))
+            snd.send(b"x" * size)
+            snd.advance()
+
+    def flow(self, controller, consume=False):
+        class Consumer(Handler):
+            def on_delivery(self, event):
+                dlv = event.delivery
+                if consume and dlv.readable and not dlv.partial:
+                    event.link.advance()
+
+        self.dispatch(controller, Consumer())
+
+    def testBufferedBytes(self):
+        snd, rcv = self.snd, self.rcv
+        assert snd.buffered_bytes == 0
+        self.send(snd, 3, 1000)
+        assert snd.buffered_bytes == 3000, snd.buffered_bytes
+        rcv.flow(2)
+        self.pump()
+        assert snd.buffered_bytes == 1000, snd.buffered_bytes
+        assert rcv.buffered_bytes == 2000, rcv.buffered_bytes
+        rcv.recv(600)
+        assert rcv.buffered_bytes == 1400, rcv.buffered_bytes
+        rcv.advance()
+        assert rcv.buffered_bytes == 1000, rcv.buffered_bytes
+
+    def testLinkBytes(self):
+        snd, rcv = self.snd, self.rcv
+        controller = FlowController(100, max_bytes=10000)
+        self.flow(controller)
+        # the size of messages is unknown, so credit is for one at a time
+        assert rcv.credit == 1, rcv.credit
+        self.send(snd, 40, 1000)
+        for i in range(4):
+            self.flow(controller)
+        assert rcv.queued == 10, rcv.queued
+        assert rcv.buffered_bytes == 10000, rcv.buffered_bytes
+        assert rcv.credit == 10, rcv.credit
+        for i in range(10):
+            rcv.advance()
+        controller._flow(rcv)
+        for i in range(10):
+            self.flow(controller, True)
+            assert rcv.buffered_bytes <= 10000, rcv.buffered_bytes
+        assert snd.queued == 0, snd.queued
+        # the sender switches to larger messages, of which the credit
+        # already issued lets more than the limit through at first
+        self.send(snd, 20, 5000)
+        for i in range(20):
+            self.flow(controller, True)
+            assert rcv.buffered_bytes <= 9 * 5000, rcv.buffered_bytes
+            if i > 2:
+                assert rcv.buffered_bytes <= 10000, rcv.buffered_bytes
+        assert snd.queued == 0, snd.queued
+
+    def testCountedBytes(self):
+        # the bytes the controller sums over the deliveries they arrived
+        # for match those the engine holds as they are read, discarded or
+        # settled
+        snd, rcv = self.snd, self.rcv
+        controller = FlowController(100, max_bytes=10000)
+        self.flow(controller)
+        self.send(snd, 30, 1000)
+
+        def check(consume=False):
+            self.flow(controller, consume)
+            # the deliveries that arrived since are counted by their events
+            self.dispatch(controller, pump=False)
+            assert controller._buffered(rcv) == rcv.buffered_bytes, (controller._buffered(rcv), rcv.buffered_bytes)
+
+        for i in range(3):
+            check()
+        rcv.recv(300)
+        buff = bytearray(200)
+        rcv.recv_into(buff)
+        assert controller._buffered(rcv) == rcv.buffered_bytes == 9500, (controller._buffered(rcv), rcv.buffered_bytes)
+        rcv.advance()
+        rcv.current.settle()
+        assert controller._buffered(rcv) == rcv.buffered_bytes == 8000, (controller._buffered(rcv), rcv.buffered_bytes)
+        for i in range(3):
+            check(True)
+
+    def testLargeMessage(self):
+        snd, rcv = self.snd, self.rcv
+        controller = FlowController(100, max_bytes=1000)
+        self.send(snd, 5, 5000)
+        for i in range(8):
+            self.flow(controller, True)
+            # one being consumed and one more
+            assert rcv.buffered_bytes <= 10000, rcv.buffered_bytes
+        assert snd.queued == 0, snd.queued
+
+    def testConnectionBytes(self):
+        c1, c2 = self.connection()
+        c2.collect(self.collector)
+        c1.open()
+        c2.open()
+        ssn1 = c1.session()
+        ssn1.open()
+        self.pump()
+        ssn2 = c2.session_head(Endpoint.LOCAL_UNINIT | Endpoint.REMOTE_ACTIVE)
+        ssn2.open()
+        senders = [ssn1.sender("link-%s" % i) for i in range(2)]
+        receivers = [ssn2.receiver("link-%s" % i) for i in range(2)]
+        controller = FlowController(100, connection_bytes=64 * 1024)
+        for link in senders + receivers:
+            link.open()
+        self.flow(controller)
+        assert ssn2.incoming_capacity == 64 * 1024, ssn2.incoming_capacity
+        for snd in senders:
+            self.send(snd, 100, 1000)
+        for i in range(6):
+            self.flow(controller)
+        total = sum(rcv.buffered_bytes for rcv in receivers)
+        assert 32 * 1024 < total <= 64 * 1024 + 1000, total
+        assert all(rcv.queued for rcv in receivers)
+
+
+class AdaptiveFlowTest(CollectorTest):
+
+    def tearDown(self):
+        self.cleanup()
+
+    def transfer(self, controller, count, latency, cost):
+        """
+        Send count messages over a wire delaying each direction by latency,
+        to a consumer taking cost to process each, on a virtual clock.
+        Returns the elapsed time, the most deliveries ever queued at the
+        receiver, the credit issued each time and the largest window.
+        """
+        now = [0.0]
+        controller._clock = lambda: now[0]
+        snd, rcv = self.link("test-link")
+        rcv.connection.collect(self.collector)
+        grants = []
+        flow = rcv.flow
+        rcv.flow = lambda n: (grants.append(n), flow(n))
+        t1, t2 = snd.transport, rcv.transport
+        wire = []
+        sent = [0]
+        consumed = [0]
+        max_queued = [0]
+
+        class Consumer(Handler):
+            def on_delivery(self, event):
+                dlv = event.delivery
+                if dlv.readable and not dlv.partial:
+                    max_queued[0] = max(max_queued[0], event.link.queued)
+                    event.link.recv(dlv.pending)
+                    event.link.advance()
+                    dlv.settle()
+                    consumed[0] += 1
+                    now[0] += cost
+
+        consumer = Consumer()
+        snd.open()
+        rcv.open()
+        max_window = 0
+        while consumed[0] < count:
+            while snd.credit > 0 and sent[0] < count:
+                dlv = snd.delivery(str(sent[0]))
+                snd.send(b"x" * 100)
+                snd.advance()
+                dlv.settle()
+                sent[0] += 1
+            for src, dst in ((t1, t2), (t2, t1)):
+                pending = src.pending()
+                if pending > 0:
+                    wire.append((now[0] + latency, dst, src.peek(pending)))
+                    src.pop(pending)
+            while wire and wire[0][0] <= now[0]:
+                _, dst, data = wire.pop(0)
+                while data:
+                    size = dst.capacity()
+                    dst.push(data[:size])
+                    data = data[size:]
+            events = self.dispatch(controller, consumer, pump=False)
+            max_window = max(max_window, getattr(controller, "window", lambda link: 0)(rcv))
+            if not events and wire and t1.pending() <= 0 and t2.pending() <= 0:
+                now[0] = max(now[0], wire[0][0])
+        return now[0], max_queued[0], grants, max_window
+
+    def testSlowConsumer(self):
+        controller = AdaptiveFlowController(8, 1024, interval=0.01)
+        elapsed, max_queued, _, window = self.transfer(controller, 500, 0.0005, 0.002)
+        assert window == 8, window
+        assert max_queued <= 8, max_queued
+        fixed, fixed_queued, _, _ = self.transfer(FlowController(1024), 500, 0.0005, 0.002)
+        assert fixed_queued > 10 * max_queued, fixed_queued
+        assert elapsed < fixed * 1.1, (elapsed, fixed)
+
+    def testHighLatency(self):
+        controller = AdaptiveFlowController(4, 1024, interval=0.01)
+        elapsed, _, _, window = self.transfer(controller, 2000, 0.025, 0.00001)
+        assert 100 < window <= 1024, window
+        fixed, _, _, _ = self.transfer(FlowController(4), 2000, 0.025, 0.00001)
+        assert fixed > 10 * elapsed, (fixed, elapsed)
+
+    def testBounds(self):
+        controller = AdaptiveFlowController(8, 32, interval=0.01)
+        _, _, grants, window = self.transfer(controller, 1000, 0.025, 0.00001)
+        assert window == 32, window
+        assert max(grants) <= 32, grants
+        controller = AdaptiveFlowController(8, 32, interval=0.01)
+        _, max_queued, grants, window = self.transfer(controller, 200, 0, 0.01)
+        assert window == 8, window
+        assert min(grants) >= 2, grants
+        assert max_queued <= 8, max_queued
+        try:
+            AdaptiveFlowController(8, 4)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+    def testBatching(self):
+        controller = AdaptiveFlowController(64, 64)
+        _, _, grants, _ = self.transfer(controller, 1000, 0.001, 0.0001)
+        assert len(grants) < 1000 / 16 + 2, len(grants)
+        assert min(grants) >= 16, grants
+
+
+class StreamTest(CollectorTest):
+
+    def setUp(self):
+        CollectorTest.setUp(self)
+        self.snd, self.rcv = self.link("test-link", max_frame=(512, 512))
+        self.snd.connection.collect(self.collector)
+        self.rcv.connection.collect(self.collector)
+        self.snd.open()
+        self.rcv.open()
+        self.rcv.flow(10)
+        self.pump()
+        self.drain()
+        self.chunks = []
+        self.messages = []
+        self.aborted = []
+        self.reject = False
+
+        test = self
+
+        class Recorder(Handler):
+            def on_message_chunk(self, event):
+                test.chunks.append(None if event.chunk is None else bytes(event.chunk))
+                if event.chunk is None:
+                    test.messages.append(event.message)
+                elif test.reject:
+                    raise Reject()
+
+            def on_message(self, event):
+                test.messages.append(event.message)
+
+            def on_aborted(self, event):
+                test.aborted.append(event.delivery)
+
+            def on_stream_error(self, event):
+                test.errors.append(event.stream_error)
+
+        self.errors = []
+        recorder = Recorder()
+        self.incoming = IncomingMessageHandler(delegate=recorder, streaming=True)
+        self.outgoing = OutgoingMessageHandler(delegate=recorder)
+
+    def tearDown(self):
+        self.cleanup()
+
+    def run_stream(self):
+        # returns the largest number of bytes buffered by the sender
+        buffered = self.snd.session.outgoing_bytes
+        for i in range(10000):
+            self.pump(1024)
+            events = self.drain()
+            if not events and not self.snd.streaming:
+                return buffered
+            for event in events:
+                event.dispatch(self.incoming)
+                event.dispatch(self.outgoing)
+                buffered = max(buffered, self.snd.session.outgoing_bytes)
+        assert False, "stream did not complete"
+
+    def body(self):
+        return b"".join(self.chunks[:-1])
+
+    def testSendStream(self):
+        payload = bytes(range(256)) * 400
+        dlv = self.snd.send_stream(payload, message=Message(subject="big", properties={"n": 1}), window=4)
+        assert self.snd.streaming
+        assert self.snd.session.outgoing_bytes <= 4 * 512
+        buffered = self.run_stream()
+        assert buffered <= 4 * 512, buffered
+        assert self.chunks[-1] is None
+        assert len(self.chunks) > 2, len(self.chunks)
+        assert self.body() == payload
+        message, = self.messages
+        assert message.subject == "big"
+        assert message.properties == {"n": 1}
+        assert message.body is None
+        assert dlv.remote_state == Delivery.ACCEPTED
+        # the link is usable again
+        Message(body="next").send(self.snd)
+        self.run_stream()
+        assert self.messages[-1].body == "next"
+
+    def testSendStreamFile(self):
+        import tempfile
+        payload = os.urandom(10000)
+        with tempfile.TemporaryFile() as f:
+            f.write(b"skip")
+            f.write(payload)
+            f.seek(4)
+            self.snd.send_stream(f)
+            self.run_stream()
+        assert self.body() == payload
+
+    def testSendFile(self):
+        import tempfile
+        payload = os.urandom(50000)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "payload")
+            with open(path, "wb") as f:
+                f.write(payload)
+            self.snd.send_file(path, message=Message(subject="file"))
+            stream = self.snd._outgoing_stream
+            assert stream.mapping is not None
+            self.run_stream()
+            assert stream.mapping is None
+            assert self.body() == payload
+            assert self.messages[0].subject == "file"
+
+            # an open file is sent from its current position
+            del self.chunks[:]
+            with open(path, "rb") as f:
+                f.seek(100)
+                self.snd.send_file(f)
+                self.run_stream()
+            assert self.body() == payload[100:]
+
+            del self.chunks[:]
+            open(path, "wb").close()
+            self.snd.send_file(path)
+            self.run_stream()
+            assert self.chunks == [None]
+
+    def testSendStreamIterable(self):
+        chunks = [b"a" * 3000, b"", b"b" * 10, b"c" * 5000]
+        self.snd.send_stream(iter(chunks), size=8010)
+        self.run_stream()
+        assert self.body() == b"".join(chunks)
+
+    def testSendStreamEmpty(self):
+        self.snd.send_stream(b"", message=Message(subject="empty"))
+        self.run_stream()
+        assert self.chunks == [None]
+        assert self.messages[0].subject == "empty"
+
+    def testSendStreamSizeMismatch(self):
+        try:
+            self.snd.send_stream(b"abc", size=4)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert not self.snd.streaming
+        # more than the window, so part of the message has been sent and
+        # the rest fails when resumed by the handler
+        self.snd.send_stream(iter([b"x" * 1000, b"x" * 1000, b"x"]), size=2000, window=2)
+        self.run_stream()
+        assert not self.snd.streaming
+        assert [str(e) for e in self.errors] == ["source holds more than the message size"], self.errors
+        assert len(self.aborted) == 1
+        assert not self.messages
+        Message(body="next").send(self.snd)
+        self.run_stream()
+        assert self.messages[-1].body == "next"
+
+    def testSendStreamEndlessSource(self):
+        def endless():
+            while True:
+                yield b"x" * 100
+
+        self.snd.send_stream(endless(), size=2000, window=2)
+        self.run_stream()
+        assert not self.snd.streaming
+        assert len(self.errors) == 1, self.errors
+        assert len(self.aborted) == 1
+        # a source ending with empty chunks is not too long
+        del self.chunks[:]
+        self.snd.send_stream(itertools.chain([b"y" * 2000], itertools.repeat(b"")), size=2000, window=2)
+        self.run_stream()
+        assert self.body() == b"y" * 2000
+        assert len(self.errors) == 1, self.errors
+
+    def testStreamAlreadyInProgress(self):
+        self.snd.send_stream(b"x" * 100000)
+        try:
+            self.snd.send_stream(b"y")
+            assert False, "expected LinkException"
+        except LinkException:
+            pass
+        self.run_stream()
+        assert self.body() == b"x" * 100000
+
+    def testStreamReject(self):
+        self.reject = True
+        dlv = self.snd.send_stream(b"x" * 100000)
+        self.run_stream()
+        assert self.chunks == [b"x" * len(self.chunks[0])]
+        assert dlv.remote_state == Delivery.REJECTED
+        self.reject = False
+        del self.chunks[:]
+        self.snd.send_stream(b"y" * 1000)
+        self.run_stream()
+        assert self.body() == b"y" * 1000
+
+    def testStreamValueBody(self):
+        Message(body={"key": "value" * 1000}).send(self.snd)
+        self.run_stream()
+        assert not self.chunks
+        assert self.messages[0].body == {"key": "value" * 1000}
+
+
+class RetainedHandleTest(CollectorTest):
+
+    def testSharedHandle(self):
+        class Context(object):
+            pass
+
+        A = EventType("retained_a")
+        B = EventType("retained_b")
+        before = retained_count()
+        context = Context()
+        self.collector.put(context, A)
+        self.collector.put(context, B)
+        self.collector.put(context, A)
+        assert retained_count() == before + 1
+        assert retained_count_by_type()["Context"] == 1
+        events = self.drain()
+        assert [e.type for e in events] == [A, B, A]
+        assert all(e.context is context for e in events)
+        del events
+        gc.collect()
+        assert retained_count() == before
+        assert "Context" not in retained_count_by_type()
+
+    def testReleasedCollector(self):
+        before = retained_count()
+        self.collector.release()
+        self.collector.put(object(), EventType("retained_c"))
+        assert retained_count() == before
+
+
 class PeerTest(CollectorTest):
 
     def setUp(self):
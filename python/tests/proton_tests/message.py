@@ -17,6 +17,8 @@
 # under the License.
 #
 
+import os
+import time
 from uuid import uuid4
 from sys import version_info
 
@@ -201,6 +203,23 @@ class CodecTest(Test):
         # both keys must be symbols
         assert msg2.annotations == a
 
+    def testEncodeInto(self):
+        self.msg.address = "address"
+        self.msg.body = b"x" * 100
+        enc = self.msg.encode()
+        buff = bytearray(256)
+        n = self.msg.encode_into(buff)
+        assert buff[:n] == enc
+        msg2 = Message()
+        msg2.decode(memoryview(buff)[:n])
+        assert msg2.address == "address"
+        assert msg2.body == self.msg.body
+        try:
+            self.msg.encode_into(bytearray(16))
+            assert False, "expected overflow"
+        except MessageException:
+            pass
+
     def testRoundTrip(self):
         self.msg.id = "asdf"
         self.msg.correlation_id = uuid4()
@@ -358,3 +377,321 @@ class CodecTest(Test):
         msg4 = Message()
         msg4.decode(data)
         assert msg4.priority == 4, (msg4.priority)
+
+    def testZeroCopyDataBody(self):
+        self.msg.inferred = True
+        self.msg.subject = "subject"
+        self.msg.properties = {'key': 'value'}
+        self.msg.body = b'\x00\x01binary body' * 100
+        data = self.msg.encode()
+
+        msg2 = Message()
+        msg2.decode(data, zero_copy=True)
+        assert isinstance(msg2.body, memoryview), type(msg2.body)
+        assert msg2.body.obj is data, msg2.body.obj
+        assert msg2.body == self.msg.body, msg2.body
+        assert msg2.inferred
+        assert msg2.subject == "subject", msg2.subject
+        assert msg2.properties == {'key': 'value'}, msg2.properties
+
+        # The view keeps the encoded buffer alive with the message
+        del data
+        assert msg2.body.tobytes() == self.msg.body
+
+    def testZeroCopyBareDataBody(self):
+        data = b'\x00\x53\x75\xa0\x03abc'
+        msg2 = Message()
+        msg2.decode(data, zero_copy=True)
+        assert isinstance(msg2.body, memoryview), type(msg2.body)
+        assert msg2.body == b'abc', msg2.body
+
+    def testZeroCopyValueBody(self):
+        # Bodies that are not a data section are decoded as usual
+        self.msg.body = u'Hello World!'
+        data = self.msg.encode()
+
+        msg2 = Message()
+        msg2.decode(data, zero_copy=True)
+        assert msg2.body == u'Hello World!', msg2.body
+
+    def testCompactLists(self):
+        self.msg.body = {'readings': [v * 0.5 for v in range(100)], 'ids': list(range(100))}
+        plain = self.msg.encode()
+        self.msg.compact_lists = True
+        compact = self.msg.encode()
+        assert len(compact) < len(plain), (len(compact), len(plain))
+
+        msg2 = Message()
+        msg2.decode(compact)
+        assert isinstance(msg2.body['ids'], Array), msg2.body['ids']
+        msg3 = Message(arrays_as_lists=True)
+        msg3.decode(compact)
+        assert msg3.body == self.msg.body, msg3.body
+
+    def testReset(self):
+        self.msg.address = "address"
+        self.msg.body = "body"
+        self.msg.properties = {"key": "value"}
+        self.msg.compact_lists = True
+        self.msg.tag = "application data"
+        self.msg.reset()
+        assert self.msg.address is None
+        assert self.msg.body is None
+        assert self.msg.properties is None
+        assert self.msg.compact_lists is False
+        assert not hasattr(self.msg, "tag")
+        self.msg.body = "reused"
+        msg2 = Message()
+        msg2.decode(self.msg.encode())
+        assert msg2.body == "reused"
+
+
+class MessagePoolTest(common.Test):
+
+    def testReuse(self):
+        pool = MessagePool(2)
+        m1 = pool.get()
+        m2 = pool.get()
+        m3 = pool.get()
+        assert pool.created == 3
+        m1.body = "one"
+        pool.put(m1)
+        pool.put(m2)
+        pool.put(m3)
+        assert len(pool) == 2
+        m = pool.get()
+        assert m is m2
+        assert m.body is None
+        pool.get()
+        pool.get()
+        assert pool.created == 4
+
+
+class BatchCodecTest(common.Test):
+
+    def testEncodeDecodeMessages(self):
+        messages = [Message(body={'n': i}, subject=str(i)) for i in range(10)]
+        encoded = encode_messages(messages)
+        assert encoded == [m.encode() for m in messages]
+        decoded = decode_messages(encoded)
+        assert [m.body for m in decoded] == [{'n': i} for i in range(10)]
+        assert [m.subject for m in decoded] == [str(i) for i in range(10)]
+
+    def testEncodeBodies(self):
+        bodies = [{'n': i, 'data': 'x' * i * 100} for i in range(20)]
+        encoded = encode_messages(bodies)
+        assert encoded == [Message(body=b).encode() for b in bodies]
+        decoded = decode_messages(encoded)
+        assert [m.body for m in decoded] == bodies
+
+    def testDecodeZeroCopy(self):
+        encoded = encode_messages([Message(body=b'abc', inferred=True)])
+        decoded = decode_messages(encoded, zero_copy=True)
+        assert isinstance(decoded[0].body, memoryview), type(decoded[0].body)
+        assert decoded[0].body == b'abc'
+
+
+class StreamDecoderTest(common.Test):
+
+    def decode(self, encoded, step):
+        from proton._message import _StreamDecoder
+        decoder = _StreamDecoder()
+        chunks = []
+        for i in range(0, len(encoded), step):
+            chunks.extend(bytes(c) for c in decoder.feed(encoded[i:i + step]))
+        return decoder.finish(), decoder.streamed, b"".join(chunks)
+
+    def testDataSections(self):
+        from proton._message import _data_section_header
+        header = Message(subject="s", properties={"k": "v"}).encode()
+        encoded = header + _data_section_header(3) + b"abc" + _data_section_header(2) + b"de"
+        for step in (1, 7, len(encoded)):
+            message, streamed, body = self.decode(encoded, step)
+            assert streamed
+            assert body == b"abcde", (step, body)
+            assert message.subject == "s"
+            assert message.properties == {"k": "v"}
+
+    def testValueBody(self):
+        encoded = Message(subject="s", body=b"abc").encode()
+        message, streamed, body = self.decode(encoded, 3)
+        assert not streamed
+        assert body == b""
+        assert message.body == b"abc"
+
+    def testTruncated(self):
+        from proton._message import _data_section_header
+        encoded = _data_section_header(10) + b"abc"
+        try:
+            self.decode(encoded, 1)
+            assert False, "expected MessageException"
+        except MessageException:
+            pass
+
+
+class MmapWriterTest(common.Test):
+
+    def testWrite(self):
+        import os
+        import tempfile
+        payload = os.urandom(3 << 20)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out")
+            # larger than expected, so the file is grown
+            with MmapWriter(path, 1000) as writer:
+                for i in range(0, len(payload), 65536):
+                    writer.write(memoryview(payload)[i:i + 65536])
+                assert writer.write(b"") == 0
+                assert writer.written == len(payload)
+            with open(path, "rb") as f:
+                assert f.read() == payload
+            # smaller than expected, so the file is truncated
+            with open(path, "r+b") as f:
+                writer = MmapWriter(f, 1 << 20)
+                writer.write(b"abc")
+                writer.close()
+                writer.close()
+                f.seek(0)
+                assert f.read() == b"abc"
+
+
+class CompressionTest(common.Test):
+
+    def roundtrip(self, message, compression):
+        encoded = message.encode(compression)
+        received = Message()
+        received.decode(encoded)
+        compression.decompress(received)
+        return encoded, received
+
+    def testRoundTrip(self):
+        text = u'{"name": "café", "values": [1, 2, 3]}' * 100
+        for encoding in ("deflate", "gzip", "xz"):
+            compression = Compression(encoding)
+            body = text.encode("utf-8")
+            message = Message(body=body, subject="s")
+            encoded, received = self.roundtrip(message, compression)
+            assert len(encoded) < len(message.encode()) // 5, (encoding, len(encoded))
+            assert received.body == body, encoding
+            assert type(received.body) is bytes, type(received.body)
+            assert received.content_encoding == symbol(None)
+            assert received.subject == "s"
+            # the message itself is left unchanged
+            assert message.content_encoding == symbol(None)
+            assert not message.inferred
+            assert compression.ratio > 5, compression.ratio
+
+    def testUncompressed(self):
+        compression = Compression(threshold=100)
+        for message in (Message(body=b"x" * 99),
+                        Message(body="x" * 1000),
+                        Message(body={"x": "x" * 1000}),
+                        Message(body=b"x" * 1000, content_encoding="identity"),
+                        Message(body=os.urandom(1000))):
+            assert message.encode(compression) == message.encode()
+        assert compression.ratio == 1.0
+
+    def testRegister(self):
+        import zlib
+        Compression.register("reversed", lambda data, level: zlib.compress(data)[::-1],
+                             lambda data, max_size: zlib.decompress(bytes(data)[::-1]))
+        try:
+            compression = Compression("reversed", threshold=0)
+            encoded, received = self.roundtrip(Message(body=b"x" * 100), compression)
+            assert received.body == b"x" * 100
+        finally:
+            del Compression._codecs["reversed"]
+        try:
+            Compression("unknown")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+    def testValueSection(self):
+        # only data sections are decompressed, whatever the content encoding
+        for body in (b"x" * 100, "x" * 100):
+            received = Message(body=body, content_encoding="gzip")
+            Compression().decompress(received)
+            assert received.body == body
+            assert received.content_encoding == symbol("gzip")
+
+    def testCorrupt(self):
+        received = Message(body=b"not compressed", content_encoding="deflate", inferred=True)
+        try:
+            Compression().decompress(received)
+            assert False, "expected MessageException"
+        except MessageException:
+            pass
+
+    def testMaxSize(self):
+        body = b"x" * 100000
+        for encoding in ("deflate", "gzip", "xz"):
+            compression = Compression(encoding, max_size=len(body))
+            encoded, received = self.roundtrip(Message(body=body), compression)
+            assert received.body == body, encoding
+            # a small body expanding beyond the limit is refused
+            received = Message()
+            received.decode(encoded)
+            try:
+                Compression(encoding, max_size=len(body) - 1).decompress(received)
+                assert False, "expected MessageException"
+            except MessageException:
+                pass
+            # as is a truncated one
+            received = Message(body=compression.compress(Message(body=body))[:-10], content_encoding=encoding,
+                               inferred=True)
+            try:
+                compression.decompress(received)
+                assert False, "expected MessageException"
+            except MessageException:
+                pass
+
+
+class DuplicateFilterTest(common.Test):
+
+    def testWindow(self):
+        dedup = DuplicateFilter(window=3)
+        messages = [Message(id=i) for i in range(4)]
+        for msg in messages[:3]:
+            assert dedup.check(msg) is False
+            dedup.add(msg)
+        assert dedup.check(Message(id=0)) is True
+        # the least recently seen is forgotten
+        dedup.add(messages[3])
+        assert len(dedup) == 3
+        assert dedup.check(messages[1]) is False
+        assert dedup.check(messages[0]) is True
+        assert dedup.duplicates == 2
+        # messages without a key are not filtered
+        dedup.add(Message())
+        assert dedup.check(Message()) is False
+
+    def testKey(self):
+        dedup = DuplicateFilter(key=lambda m: (m.properties["producer"], m.id))
+        dedup.add(Message(id=1, properties={"producer": "a"}))
+        assert dedup.check(Message(id=1, properties={"producer": "a"})) is True
+        assert dedup.check(Message(id=1, properties={"producer": "b"})) is False
+
+    def testWindowTime(self):
+        dedup = DuplicateFilter(window_time=0.05)
+        dedup.add(Message(id="a"))
+        assert dedup.check(Message(id="a")) is True
+        time.sleep(0.1)
+        assert dedup.check(Message(id="a")) is False
+        dedup.add(Message(id="b"))
+        assert len(dedup) == 1
+
+    def testBloom(self):
+        dedup = DuplicateFilter(window=10, bloom_capacity=1000, bloom_error=1e-4)
+        for i in range(1000):
+            dedup.add(Message(id=i))
+        assert dedup.check(Message(id=999)) is True
+        # older messages are only possibly seen
+        assert all(dedup.check(Message(id=i)) is None for i in range(990))
+        false = sum(dedup.check(Message(id=i)) is not False for i in range(1000, 11000))
+        assert false < 10, false
+        # the oldest half of the Bloom filter is cleared as it fills
+        for i in range(2000, 4000):
+            dedup.add(Message(id=i))
+        assert dedup.check(Message(id=0)) is False
+        assert dedup.check(Message(id=3500)) is None
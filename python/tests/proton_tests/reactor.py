@@ -21,7 +21,7 @@ import time
 
 from proton.reactor import Container, ApplicationEvent, EventInjector, Selector, Backoff
 from proton.handlers import Handshaker, MessagingHandler
-from proton import Handler, Url, symbol
+from proton import DurableOutbox, Handler, Message, Url, symbol
 
 from .common import Test, SkipTest, TestServer, free_tcp_port, free_tcp_ports, ensureCanTestExtendedSASL
 
@@ -408,6 +408,170 @@ class ContainerTest(Test):
         container.connect(test_handler.url, handler=ConnectionHandler())
         container.run()
 
+    def test_batch_ack_delay(self):
+        port = free_tcp_port()
+
+        class Receiver(MessagingHandler):
+            def __init__(self):
+                super(Receiver, self).__init__(batch_acks=100, batch_ack_delay=0.2)
+
+            def on_start(self, event):
+                self.listener = event.container.listen("127.0.0.1:%i" % port)
+
+            def on_link_opening(self, event):
+                event.link.target.address = event.link.remote_target.address
+
+            def on_connection_closing(self, event):
+                self.listener.close()
+
+        class Sender(MessagingHandler):
+            def __init__(self):
+                super(Sender, self).__init__()
+                self.sent = 0
+                self.settled = []
+
+            def on_sendable(self, event):
+                while event.sender.credit and self.sent < 5:
+                    event.sender.send(Message(body=self.sent))
+                    self.sent += 1
+                    self.last_sent = time.time()
+
+            def on_accepted(self, event):
+                self.settled.append(time.time() - self.last_sent)
+                if len(self.settled) == 5:
+                    event.connection.close()
+
+        container = Container(Receiver())
+        sender = Sender()
+        container.create_sender(container.connect("127.0.0.1:%i" % port, allowed_mechs="ANONYMOUS",
+                                                  handler=sender), "q")
+        container.run()
+        assert len(sender.settled) == 5
+        # fewer than batch_acks messages are held until the delay passes
+        assert min(sender.settled) >= 0.15, sender.settled
+
+    def test_durable_outbox(self):
+        import tempfile
+        port = free_tcp_port()
+
+        class Receiver(MessagingHandler):
+            def __init__(self):
+                super(Receiver, self).__init__()
+                self.received = []
+
+            def on_start(self, event):
+                self.listener = event.container.listen("127.0.0.1:%i" % port)
+
+            def on_link_opening(self, event):
+                event.link.target.address = event.link.remote_target.address
+
+            def on_message(self, event):
+                self.received.append(event.message.body)
+
+            def on_connection_closing(self, event):
+                self.listener.close()
+
+        class Sender(MessagingHandler):
+            def __init__(self, outbox):
+                super(Sender, self).__init__()
+                self.outbox = outbox
+                self.sent = 0
+                self.accepted = 0
+
+            def on_link_opened(self, event):
+                event.sender.outbox = self.outbox
+
+            def on_sendable(self, event):
+                while event.sender.credit and self.sent < 100:
+                    event.sender.enqueue(Message(body=self.sent))
+                    self.sent += 1
+
+            def on_accepted(self, event):
+                self.accepted += 1
+                if self.accepted == 100:
+                    event.connection.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = DurableOutbox(directory, sync_interval=0.05)
+            receiver = Receiver()
+            container = Container(receiver)
+            sender = Sender(outbox)
+            start = time.time()
+            container.create_sender(container.connect("127.0.0.1:%i" % port, allowed_mechs="ANONYMOUS",
+                                                      handler=sender), "q")
+            container.run()
+            assert receiver.received == list(range(100))
+            # the messages enqueued within each interval are stored together
+            assert outbox.syncs <= (time.time() - start) / 0.05 + 1, outbox.syncs
+            assert outbox.unsettled == 0
+            outbox.close()
+
+    def test_durable_outbox_reconnect(self):
+        import tempfile
+        port = free_tcp_port()
+
+        class Receiver(MessagingHandler):
+            def __init__(self):
+                super(Receiver, self).__init__(auto_accept=False)
+                self.received = []
+                self.connections = 0
+
+            def on_start(self, event):
+                self.listener = event.container.listen("127.0.0.1:%i" % port)
+
+            def on_connection_opened(self, event):
+                self.connections += 1
+
+            def on_link_opening(self, event):
+                event.link.target.address = event.link.remote_target.address
+
+            def on_message(self, event):
+                self.received.append(event.message.body)
+                if self.connections == 1:
+                    # drop the first connection with the messages unsettled
+                    if len(self.received) == 10:
+                        event.transport.close_tail()
+                        event.transport.close_head()
+                else:
+                    self.accept(event.delivery)
+
+            def on_connection_closing(self, event):
+                self.listener.close()
+
+        class Sender(MessagingHandler):
+            def __init__(self, outbox):
+                super(Sender, self).__init__()
+                self.outbox = outbox
+                self.sent = 0
+                self.accepted = 0
+
+            def on_link_opened(self, event):
+                event.sender.outbox = self.outbox
+
+            def on_sendable(self, event):
+                while event.sender.credit and self.sent < 10:
+                    event.sender.enqueue(Message(body=self.sent))
+                    self.sent += 1
+
+            def on_accepted(self, event):
+                self.accepted += 1
+                if self.accepted == 10:
+                    event.connection.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = DurableOutbox(directory)
+            receiver = Receiver()
+            container = Container(receiver)
+            sender = Sender(outbox)
+            container.create_sender(container.connect("127.0.0.1:%i" % port, allowed_mechs="ANONYMOUS",
+                                                      handler=sender, reconnect=[0]), "q")
+            container.run()
+            assert receiver.connections == 2
+            assert receiver.received == list(range(10)) * 2, receiver.received
+            assert sender.accepted == 10
+            assert outbox.unsettled == 0
+            outbox.close()
+
     def test_authentication_via_url(self):
         ensureCanTestExtendedSASL()
         test_handler = AuthenticationTestHandler()
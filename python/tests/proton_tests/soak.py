@@ -17,12 +17,17 @@
 # under the License.
 #
 
+import gc
 import os
 
+from cproton import retained_count, retained_count_by_type
+from proton import Collector, Connection, EventType, Handler, Message, Transport
+from proton.handlers import IncomingMessageHandler
+
 from .common import Test, Skipped, free_tcp_ports, \
     MessengerReceiverC, MessengerSenderC, \
     ReactorReceiverC, ReactorSenderC, \
-    isSSLPresent
+    isSSLPresent, pump
 
 #
 # Tests that run the apps
@@ -266,3 +271,84 @@ class MessengerTests(AppTests):
 
     def test_oneway_reactor(self):
         self._do_oneway_test(ReactorReceiverC(), ReactorSenderC())
+
+#
+# Lifecycle of the python objects referenced from C by the bindings
+#
+
+
+class RetainedObjectsTest(Test):
+
+    @property
+    def message_count(self):
+        return int(self.default("message_count", 1000000, fast=10000))
+
+    def test_steady_state(self):
+        TICK = EventType("soak_tick")
+        count = self.message_count
+        batch = 500
+
+        c1, c2 = Connection(), Connection()
+        t1, t2 = Transport(), Transport()
+        t1.bind(c1)
+        t2.bind(c2)
+        collector = Collector()
+        c2.collect(collector)
+        c1.open()
+        c2.open()
+        ssn = c1.session()
+        ssn.open()
+        pump(t1, t2)
+        c2.session_head(0).open()
+        snd = ssn.sender("soak")
+        snd.open()
+        pump(t1, t2)
+        rcv = c2.link_head(0)
+        rcv.open()
+        rcv.flow(count)
+        pump(t1, t2)
+
+        class Counter(Handler):
+            received = 0
+            ticks = 0
+
+            def on_message(self, event):
+                Counter.received += 1
+
+            def on_soak_tick(self, event):
+                Counter.ticks += 1
+
+        counter = Counter()
+        handler = IncomingMessageHandler(delegate=counter)
+        encoded = Message(body="soak").encode()
+
+        def run(n):
+            for _ in range(n // batch):
+                for i in range(batch):
+                    dlv = snd.delivery(str(i))
+                    snd.send(encoded)
+                    snd.advance()
+                    dlv.settle()
+                    # an application defined event context for every message
+                    collector.put(object(), TICK)
+                pump(t1, t2)
+                while True:
+                    event = collector.peek()
+                    if event is None:
+                        break
+                    event.dispatch(handler)
+                    event.dispatch(counter)
+                    collector.pop()
+
+        warmup = max(count // 10, batch)
+        run(warmup)
+        gc.collect()
+        retained = retained_count()
+        objects = len(gc.get_objects())
+
+        run(count - warmup)
+        gc.collect()
+        assert Counter.received == Counter.ticks == count // batch * batch, (Counter.received, Counter.ticks)
+        assert retained_count() <= retained, (retained, retained_count_by_type())
+        growth = len(gc.get_objects()) - objects
+        assert growth < 1000, growth
@@ -118,6 +118,13 @@ class ClientTransportTest(Test):
         out = self.transport.peek(1024)
         assert out is not None
 
+    def testPeekInto(self):
+        expected = self.transport.peek(1024)
+        buff = bytearray(1024)
+        n = self.transport.peek_into(buff)
+        assert n == len(expected), (n, expected)
+        assert buff[:n] == expected
+
     def testBindAfterOpen(self):
         conn = Connection()
         ssn = conn.session()
@@ -17,13 +17,16 @@
 # under the License.
 #
 
+import asyncio
+import time
 from threading import Thread, Event
 from uuid import uuid4
 
-from proton import Message, Url, Array, UNDESCRIBED, Data, symbol, ConnectionException
+from proton import Delivery, Endpoint, Message, Url, Array, UNDESCRIBED, Data, symbol, ConnectionException, Timeout, \
+    Outbox
 from proton.handlers import MessagingHandler
 from proton.reactor import Container
-from proton.utils import SyncRequestResponse, BlockingConnection
+from proton.utils import AsyncRequestResponse, SyncRequestResponse, BlockingConnection, SendException
 
 from .common import Test, free_tcp_port
 from .common import ensureCanTestExtendedSASL
@@ -100,9 +103,417 @@ class ConnPropertiesServer(EchoServer):
             self.desired_capabilities_received = True
 
 
+class StreamServer(EchoServer):
+    """
+    Receives streamed messages, and streams PAYLOAD to each receiver of
+    the "out" address.
+    """
+
+    PAYLOAD = bytes(range(256)) * 4096
+
+    def __init__(self, url, timeout):
+        EchoServer.__init__(self, url, timeout)
+        MessagingHandler.__init__(self, streaming=True)
+        self.received = []
+        self.chunks = []
+        self.streamed = set()
+
+    def on_link_opening(self, event):
+        if event.link.is_sender:
+            event.link.source.address = event.link.remote_source.address
+        else:
+            event.link.target.address = event.link.remote_target.address
+
+    def on_message_chunk(self, event):
+        if event.chunk is None:
+            self.received.append((event.message.subject, b"".join(self.chunks)))
+            self.chunks = []
+        else:
+            self.chunks.append(bytes(event.chunk))
+
+    def on_sendable(self, event):
+        if event.link.source.address == "out" and event.link.name not in self.streamed:
+            self.streamed.add(event.link.name)
+            event.sender.send_stream(self.PAYLOAD, message=Message(subject="out"))
+
+
+class StreamTest(Test):
+    """Test streaming message bodies over a BlockingConnection"""
+
+    def test_send_receive_stream(self):
+        server = StreamServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            sender = connection.create_sender("in")
+            chunks = [bytes([i]) * 65536 for i in range(20)]
+            delivery = sender.send_stream(iter(chunks), size=20 * 65536, message=Message(subject="in"))
+            self.assertEqual(delivery.remote_state, delivery.ACCEPTED)
+            receiver = connection.create_receiver("out", streaming=True)
+            message, body = receiver.receive_stream()
+            self.assertEqual(message.subject, "out")
+            self.assertEqual(message.body, None)
+            self.assertEqual(b"".join(body), StreamServer.PAYLOAD)
+            receiver.accept()
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+        self.assertEqual(server.received, [("in", b"".join(chunks))])
+
+    def test_receive_stream_bounded(self):
+        server = StreamServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            receiver = connection.create_receiver("out", streaming=True, max_bytes=100000)
+            message, body = receiver.receive_stream()
+            delivery = receiver.fetcher.unsettled[-1]
+            # the rest of the body is left with the sender until taken
+            connection.wait(lambda: getattr(delivery, '_held', False), msg="Waiting for the body to be held")
+            self.assertTrue(delivery._chunk_bytes < 100000 + 65536, delivery._chunk_bytes)
+            self.assertEqual(b"".join(body), StreamServer.PAYLOAD)
+            self.assertEqual(delivery._chunk_bytes, 0)
+            receiver.accept()
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+
+
+class SizeServer(EchoServer):
+    """
+    Sends small and then large messages to each receiver of the "out"
+    address, as fast as credit allows.
+    """
+
+    BODIES = [b"s" * 100] * 50 + [b"L" * 100000] * 20
+
+    def __init__(self, url, timeout):
+        EchoServer.__init__(self, url, timeout)
+        self.sent = {}
+
+    def on_link_opening(self, event):
+        if event.link.is_sender:
+            event.link.source.address = event.link.remote_source.address
+
+    def on_sendable(self, event):
+        sender = event.sender
+        sent = self.sent.get(sender.name, 0)
+        while sender.credit and sent < len(self.BODIES):
+            sender.send(Message(body=self.BODIES[sent]))
+            sent += 1
+        self.sent[sender.name] = sent
+
+
+class ByteCreditTest(Test):
+    """Test byte limited prefetch for a BlockingReceiver"""
+
+    def test_max_bytes(self):
+        server = SizeServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            receiver = connection.create_receiver("out", max_bytes=250000)
+            most = 0
+            for body in SizeServer.BODIES:
+                message = receiver.receive()
+                self.assertEqual(message.body, body)
+                receiver.accept()
+                # let the server send all it has credit for
+                try:
+                    connection.wait(lambda: False, timeout=0.05)
+                except Timeout:
+                    pass
+                most = max(most, receiver.buffered_bytes)
+            # credit issued for small messages may let large ones in
+            # until taken back, limited by the session capacity
+            self.assertLessEqual(most, 2 * 250000 + 100100)
+            self.assertGreater(most, 200000)
+            # the session opened for the receiver is closed with it
+            session = receiver.link.session
+            receiver.close()
+            self.assertTrue(session.state & Endpoint.LOCAL_CLOSED)
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+
+
+class BatchReceiveTest(Test):
+    """Test taking and settling messages in batches from a BlockingReceiver"""
+
+    def test_receive_batch(self):
+        server = SizeServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.accepted = 0
+
+        def on_accepted(event):
+            server.accepted += 1
+        server.on_accepted = on_accepted
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            receiver = connection.create_receiver("out", credit=10)
+            messages = []
+            while len(messages) < len(SizeServer.BODIES):
+                batch = receiver.receive_batch(8)
+                self.assertTrue(1 <= len(batch) <= 8, len(batch))
+                messages.extend(batch)
+                receiver.accept_all()
+            self.assertEqual([m.body for m in messages], SizeServer.BODIES)
+            connection.wait(lambda: server.accepted == len(SizeServer.BODIES))
+            self.assertRaises(Timeout, receiver.receive_batch, timeout=0.1)
+            receiver.close()
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+
+
+class BatchServer(EchoServer):
+    """
+    Holds the messages it receives and settles them ten at a time,
+    rejecting those with a "reject" body.
+    """
+
+    def __init__(self, url, timeout):
+        EchoServer.__init__(self, url, timeout)
+        MessagingHandler.__init__(self, auto_accept=False)
+        self.held = []
+        self.bodies = []
+        self.most = 0
+
+    def on_link_opening(self, event):
+        if event.link.is_receiver:
+            event.link.target.address = event.link.remote_target.address
+
+    def on_message(self, event):
+        self.bodies.append(event.message.body)
+        self.held.append((event.delivery, event.message.body == "reject"))
+        self.most = max(self.most, len(self.held))
+        if len(self.held) == 10:
+            for delivery, reject in self.held:
+                if reject:
+                    self.reject(delivery)
+                else:
+                    self.accept(delivery)
+            self.held = []
+
+
+class PipelinedSendTest(Test):
+    """Test sending with many messages in flight from a BlockingSender"""
+
+    def test_send_many(self):
+        server = BatchServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            sender = connection.create_sender("in")
+            bodies = ["reject" if i == 13 else str(i) for i in range(30)]
+            futures = sender.send_many((Message(body=body) for body in bodies), window=10)
+            self.assertEqual(server.bodies, bodies)
+            self.assertEqual(server.most, 10)
+            self.assertTrue(all(f.done() for f in futures))
+            for i, future in enumerate(futures):
+                if i == 13:
+                    self.assertRaises(SendException, future.result)
+                else:
+                    self.assertEqual(future.result().remote_state, Delivery.ACCEPTED)
+
+            futures = [sender.send_async(Message(body=str(i))) for i in range(10)]
+            self.assertFalse(any(f.done() for f in futures))
+            sender.flush()
+            self.assertTrue(all(f.result() for f in futures))
+            self.assertEqual(len(server.bodies), 40)
+            sender.close()
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+
+    def test_enqueue(self):
+        server = BatchServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        try:
+            sender = connection.create_sender("in")
+            sender.link.outbox = outbox = Outbox(max_messages=4, policy=Outbox.BLOCK)
+            bodies = [str(i) for i in range(50)]
+            queued = 0
+            for body in bodies:
+                sender.enqueue(Message(body=body))
+                queued = max(queued, len(outbox))
+            # only the initial credit can be used without waiting
+            self.assertEqual(queued, 4)
+            sender.flush()
+            self.assertFalse(outbox)
+            connection.wait(lambda: len(server.bodies) == 50, timeout=self.timeout)
+            self.assertEqual(server.bodies, bodies)
+            sender.close()
+        finally:
+            connection.close()
+        server.join(timeout=self.timeout)
+
+
+class WaitTest(Test):
+    """Test the latency of BlockingConnection.wait"""
+
+    def setUp(self):
+        self.server = EchoServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        self.server.start()
+        self.server.wait()
+        self.connection = BlockingConnection(self.server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.join(timeout=self.timeout)
+
+    def set_later(self, flags, name, delay):
+        def run():
+            time.sleep(delay)
+            flags[name] = time.monotonic()
+            self.connection.wakeup()
+        Thread(target=run).start()
+
+    def test_wakeup(self):
+        flags = {}
+        self.set_later(flags, "a", 0.1)
+        self.connection.wait(lambda: "a" in flags, timeout=self.timeout)
+        self.assertLess(time.monotonic() - flags["a"], 0.5)
+
+    def test_timeout(self):
+        start = time.monotonic()
+        self.assertRaises(Timeout, self.connection.wait, lambda: False, timeout=0.3)
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 0.8)
+
+    def test_threads(self):
+        flags = {}
+        woken = {}
+
+        def waiter(name):
+            self.connection.wait(lambda: name in flags, timeout=self.timeout)
+            woken[name] = time.monotonic()
+        threads = [Thread(target=waiter, args=(name,)) for name in "abc"]
+        for t in threads:
+            t.start()
+        self.set_later(flags, "b", 0.1)
+        self.set_later(flags, "a", 0.3)
+        self.set_later(flags, "main", 0.4)
+        self.set_later(flags, "c", 0.5)
+        self.connection.wait(lambda: "main" in flags, timeout=self.timeout)
+        woken["main"] = time.monotonic()
+        for t in threads:
+            t.join(self.timeout)
+        self.assertEqual(sorted(woken, key=woken.get), ["b", "a", "main", "c"])
+        for name in woken:
+            self.assertLess(woken[name] - flags[name], 0.5, name)
+
+
+class DroppingEchoServer(EchoServer):
+    """
+    Echo server that accepts requests on any address and does not respond
+    to those with a "drop" body, and closes the connection on receiving one
+    with a "close" body.
+    """
+
+    def on_link_opening(self, event):
+        EchoServer.on_link_opening(self, event)
+        if event.link.is_receiver:
+            event.link.target.address = event.link.remote_target.address
+
+    def on_message(self, event):
+        if event.message.body == "close":
+            event.connection.close()
+        elif event.message.body != "drop":
+            EchoServer.on_message(self, event)
+
+
 class SyncRequestResponseTest(Test):
     """Test SyncRequestResponse"""
 
+    def test_concurrent_calls(self):
+        server = DroppingEchoServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+        connection = BlockingConnection(server.url, timeout=self.timeout, allowed_mechs=ANONYMOUS)
+        client = SyncRequestResponse(connection, "x", credit=4)
+        try:
+            futures = [client.call_async(Message(body=str(i))) for i in range(20)]
+            for i, future in reversed(list(enumerate(futures))):
+                self.assertEqual(future.result().body, str(i))
+                self.assertEqual(future.result().correlation_id, future.correlation_id)
+
+            errors = []
+
+            def caller(name):
+                try:
+                    for i in range(10):
+                        body = "%s-%s" % (name, i)
+                        self.assertEqual(client.call(Message(body=body)).body, body)
+                except Exception as e:
+                    errors.append(e)
+            threads = [Thread(target=caller, args=(n,)) for n in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(self.timeout)
+            self.assertEqual(errors, [])
+
+            self.assertRaises(Timeout, client.call, Message(body="drop"), timeout=0.2)
+            self.assertEqual(client.call(Message(body="after")).body, "after")
+            self.assertEqual(client._pending, {})
+        finally:
+            client.connection.close()
+        server.join(timeout=self.timeout)
+
+    def test_async_calls(self):
+        server = DroppingEchoServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+
+        async def calls():
+            async with AsyncRequestResponse(server.url, "x", max_outstanding=16, credit=10,
+                                            allowed_mechs=ANONYMOUS) as client:
+                bodies = [str(i) for i in range(200)]
+                responses = await asyncio.gather(*[client.call(Message(body=body)) for body in bodies])
+                self.assertEqual([r.body for r in responses], bodies)
+                self.assertEqual(client.latency.count, 200)
+                self.assertLessEqual(client.latency.percentile(50), client.latency.percentile(99))
+                self.assertLessEqual(client.latency.percentile(99), client.latency.max)
+                with self.assertRaises(Timeout):
+                    await client.call(Message(body="drop"), timeout=0.2)
+                self.assertEqual((await client.call(Message(body="after"))).body, "after")
+                self.assertEqual(client._pending, {})
+
+        asyncio.run(asyncio.wait_for(calls(), self.timeout))
+        server.join(timeout=self.timeout)
+
+    def test_async_closed(self):
+        server = DroppingEchoServer(Url(host="127.0.0.1", port=free_tcp_port()), self.timeout)
+        server.start()
+        server.wait()
+
+        async def calls():
+            client = AsyncRequestResponse(server.url, "x", allowed_mechs=ANONYMOUS)
+            with self.assertRaises(ConnectionException):
+                await client.call(Message(body="unopened"))
+            await client.open()
+            self.assertEqual((await client.call(Message(body="open"))).body, "open")
+            # calls fail once the connection is lost, rather than waiting
+            with self.assertRaises(ConnectionException):
+                await client.call(Message(body="close"))
+            with self.assertRaises(ConnectionException):
+                await client.call(Message(body="lost"))
+            await client.close()
+            with self.assertRaises(ConnectionException):
+                await client.call(Message(body="closed"))
+
+        asyncio.run(asyncio.wait_for(calls(), self.timeout))
+        server.join(timeout=self.timeout)
+
     def test_request_response(self):
         ensureCanTestExtendedSASL()
 